@@ -0,0 +1,198 @@
+""" Times the repository backends on generated repositories
+
+Run with `python benchmarks/bench_backends.py --output results.json`,
+`--help` lists the options shaping the repositories. For every backend
+whose tools are installed a repository is generated (see generators.py),
+then walk_history, get_changeset, get_file_contents and ChangeSet.optimize
+are each timed `--repeat` times and run once more under tracemalloc for
+their peak memory. tracemalloc only sees Python allocations, not those of
+the version control processes.
+
+Results are written as JSON, compare_results.py compares two runs.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Runnable from a checkout, without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from generators import GENERATORS, Shape
+
+from codeminer_tools.repositories.change import ChangeType
+from codeminer_tools.repositories.file import content_cache
+
+# Version of the results format
+FORMAT = 1
+
+OPERATIONS = ('walk_history', 'get_changeset', 'get_file_contents',
+              'optimize')
+
+
+def spread(items, count):
+    """ Up to count items taken evenly from the whole list"""
+    if len(items) <= count:
+        return list(items)
+    step = len(items) / count
+    return [items[int(index * step)] for index in range(count)]
+
+
+def workloads(repository, samples):
+    """ (setup, function) pairs by operation: function(setup()) runs it
+    once and returns the number of items it handled"""
+    history = list(repository.walk_history())
+    identifiers = spread([x.identifier for x in history], samples)
+    files = spread([(change.current_file.path, change.current_file.revision)
+                    for changeset in history for change in changeset.changes
+                    if change.action != ChangeType.remove], samples)
+
+    def nothing():
+        return None
+
+    def walk_history(state):
+        return sum(1 for _ in repository.walk_history())
+
+    def get_changeset(state):
+        for identifier in identifiers:
+            repository.get_changeset(identifier)
+        return len(identifiers)
+
+    def get_file_contents(state):
+        for path, revision in files:
+            repository.get_file_contents(path, revision=revision).read()
+        return len(files)
+
+    def optimize(changesets):
+        for changeset in changesets:
+            changeset.optimize()
+        return len(changesets)
+
+    return {
+        'walk_history': (nothing, walk_history),
+        'get_changeset': (nothing, get_changeset),
+        'get_file_contents': (nothing, get_file_contents),
+        # Timed on changesets walked beforehand
+        'optimize': (lambda: list(repository.walk_history()), optimize),
+    }
+
+
+def measure(setup, function, repeat):
+    times = []
+    for _ in range(repeat):
+        content_cache.clear()
+        state = setup()
+        start = time.perf_counter()
+        items = function(state)
+        times.append(time.perf_counter() - start)
+
+    content_cache.clear()
+    state = setup()
+    tracemalloc.start()
+    try:
+        function(state)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'items': items, 'times': times, 'best': min(times),
+            'median': statistics.median(times), 'peak_memory': peak}
+
+
+def bench_backend(name, shape, repeat, samples, operations=OPERATIONS):
+    directory = tempfile.mkdtemp(prefix='bench-{0}-'.format(name))
+    try:
+        start = time.perf_counter()
+        repository = GENERATORS[name]().generate(directory, shape)
+        result = {'generate': time.perf_counter() - start, 'operations': {}}
+        loads = workloads(repository, samples)
+        for operation in operations:
+            setup, function = loads[operation]
+            try:
+                result['operations'][operation] = measure(setup, function,
+                                                          repeat)
+            except Exception as error:
+                result['operations'][operation] = {
+                    'error': '{0}: {1}'.format(type(error).__name__, error)}
+        # Hg checkouts and the like go with the repository object
+        del repository, loads
+        return result
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run(backends, shape, repeat, samples, report=sys.stderr):
+    results = {
+        'format': FORMAT,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'shape': shape.as_dict(),
+        'repeat': repeat,
+        'samples': samples,
+        'results': {},
+        'skipped': {},
+    }
+    for name in backends:
+        reason = GENERATORS[name].available()
+        if reason is not None:
+            results['skipped'][name] = reason
+            print('{0}: skipped, {1}'.format(name, reason), file=report)
+            continue
+        result = bench_backend(name, shape, repeat, samples)
+        results['results'][name] = result
+        print('{0}: generated in {1:.2f}s'.format(name, result['generate']),
+              file=report)
+        for operation, measured in result['operations'].items():
+            if 'error' in measured:
+                print('  {0}: {1}'.format(operation, measured['error']),
+                      file=report)
+            else:
+                print('  {0}: {1} items, {2:.4f}s median, {3:.4f}s best, '
+                      '{4:.1f} KiB peak'.format(
+                          operation, measured['items'], measured['median'],
+                          measured['best'], measured['peak_memory'] / 1024),
+                      file=report)
+    return results
+
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backends', nargs='+', choices=sorted(GENERATORS),
+                        default=sorted(GENERATORS))
+    parser.add_argument('--output', help='JSON file for the results, '
+                        'printed when not given')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--samples', type=int, default=20,
+                        help='changesets and files get_changeset and '
+                        'get_file_contents are timed on')
+    defaults = Shape()
+    for name, value in defaults.as_dict().items():
+        parser.add_argument('--' + name.replace('_', '-'), type=type(value),
+                            default=value)
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    arguments = parse_arguments(arguments)
+    shape = Shape(**{name: getattr(arguments, name)
+                     for name in Shape().as_dict()})
+    results = run(arguments.backends, shape, arguments.repeat,
+                  arguments.samples)
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+""" Times ChangeSet.optimize on large synthetic reorganization commits
+
+Run with `python benchmarks/bench_optimize.py [changes]`. The original
+nested-loop implementation is kept here as a reference, both to compare
+timings and to check that the results are the same.
+"""
+import copy
+from io import BytesIO
+import os
+import sys
+import time
+
+# Runnable from a checkout, without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
+from codeminer_tools.repositories.repository import Repository
+
+
+class SyntheticRepository(Repository):
+    """ Every file has the same contents, so nothing is derived"""
+    name = 'Synthetic'
+
+    def get_file_contents(self, path, revision=None):
+        return BytesIO(b'contents')
+
+
+def make_changeset(size):
+    """ A commit moving half of `size` files, plus some unrelated adds,
+    modifications and removes"""
+    repository = SyntheticRepository()
+    changes = []
+    moves = size // 2
+    for index in range(moves // 2):
+        old = 'old/{0}.txt'.format(index)
+        changes.append(Change(repository, old, '1', 'new/{0}.txt'.format(index),
+                              '2', ChangeType.copy))
+        changes.append(Change(repository, old, '1', None, '2',
+                              ChangeType.remove))
+    for index in range(size - len(changes)):
+        path = 'other/{0}.txt'.format(index)
+        action = [ChangeType.add, ChangeType.modify, ChangeType.remove][
+            index % 3]
+        if action == ChangeType.add:
+            changes.append(Change(repository, None, None, path, '2', action))
+        elif action == ChangeType.remove:
+            changes.append(Change(repository, path, '1', None, '2', action))
+        else:
+            changes.append(Change(repository, path, '1', path, '2', action))
+    return ChangeSet(changes, None, '2', 'author', 'Reorganize', 0)
+
+
+def reference_optimize(changeset):
+    """ ChangeSet.optimize as it was before the path index"""
+    removes = []
+    copies = []
+    for change in changeset.changes:
+        if change.action == ChangeType.copy:
+            copies.append(change)
+        elif change.action == ChangeType.remove:
+            removes.append(change)
+
+    redundant = []
+    for copy_change in copies:
+        for remove in removes:
+            if copy_change.previous_file.path == remove.previous_file.path:
+                copy_change.action = ChangeType.move
+                redundant.append(remove)
+                break
+
+    combined_changes = [x for x in changeset.changes if x not in redundant]
+    for change in combined_changes:
+        if change.action in (ChangeType.move, ChangeType.copy):
+            if change.previous_file.read() != change.current_file.read():
+                change.action = ChangeType.derived
+    changeset.changes = combined_changes
+
+
+def summarize(changeset):
+    # deepcopy gives the copy its own repository, compare everything else
+    return [(change.action,
+             change.previous_file.path, change.previous_file.revision,
+             change.current_file.path, change.current_file.revision)
+            for change in changeset.changes]
+
+
+def timed(function, changeset):
+    start = time.perf_counter()
+    function(changeset)
+    return time.perf_counter() - start
+
+
+def main(size=100000, reference_size=5000):
+    changeset = make_changeset(size)
+    print('optimize, {0} changes: {1:.3f}s'.format(
+        size, timed(ChangeSet.optimize, changeset)))
+
+    # The reference is quadratic, compare on a size it finishes in
+    changeset = make_changeset(reference_size)
+    expected = copy.deepcopy(changeset)
+    print('optimize, {0} changes: {1:.3f}s'.format(
+        reference_size, timed(ChangeSet.optimize, changeset)))
+    print('reference, {0} changes: {1:.3f}s'.format(
+        reference_size, timed(reference_optimize, expected)))
+    same = summarize(changeset) == summarize(expected)
+    print('same results: {0}'.format(same))
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,76 @@
+""" Compares two result files of bench_backends.py
+
+Run with `python benchmarks/compare_results.py before.json after.json`.
+Prints the change of the median time and of the peak memory of every
+operation measured in both, and exits with 1 if any got slower by more
+than `--threshold` (10% by default) or fails where it used to run.
+"""
+import argparse
+import json
+import sys
+
+
+def compare(before, after, threshold=0.1):
+    """ Rows of (backend, operation, time ratio, memory ratio, regressed,
+    error) for the operations measured in both results, ratios being after
+    over before. An operation failing where it used to run is a
+    regression, its row has the error and no ratios"""
+    rows = []
+    for backend, result in sorted(after['results'].items()):
+        previous = before['results'].get(backend)
+        if previous is None:
+            continue
+        for operation, measured in sorted(result['operations'].items()):
+            old = previous['operations'].get(operation)
+            if 'error' in measured:
+                if old is None or 'error' not in old:
+                    rows.append((backend, operation, None, None, True,
+                                 measured['error']))
+                continue
+            if old is None or 'error' in old:
+                continue
+            time_ratio = ratio(measured['median'], old['median'])
+            memory_ratio = ratio(measured['peak_memory'], old['peak_memory'])
+            rows.append((backend, operation, time_ratio, memory_ratio,
+                         time_ratio is not None and
+                         time_ratio > 1 + threshold, None))
+    return rows
+
+
+def ratio(new, old):
+    return new / old if old else None
+
+
+def percent(value):
+    return '-' if value is None else '{0:+.1f}%'.format((value - 1) * 100)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    arguments = parser.parse_args(arguments)
+    with open(arguments.before) as before_file:
+        before = json.load(before_file)
+    with open(arguments.after) as after_file:
+        after = json.load(after_file)
+
+    if before['shape'] != after['shape']:
+        print('warning: the repositories were generated with different '
+              'shapes', file=sys.stderr)
+    rows = compare(before, after, arguments.threshold)
+    for (backend, operation, time_ratio, memory_ratio, regressed,
+         error) in rows:
+        if error is not None:
+            print('{0:<4} {1:<18} ERROR {2}  REGRESSION'.format(
+                backend, operation, error))
+            continue
+        print('{0:<4} {1:<18} time {2:>8} memory {3:>8}{4}'.format(
+            backend, operation, percent(time_ratio), percent(memory_ratio),
+            '  REGRESSION' if regressed else ''))
+    return 1 if any(row[4] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
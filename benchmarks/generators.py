@@ -0,0 +1,485 @@
+""" Synthetic repositories of a configurable shape, for every backend
+
+A Shape describes the history wanted (commits, files, how often files are
+copied, moved and removed, large binary files, branches). `plan` turns it
+into a list of events which doesn't depend on the version control system,
+the same seed always giving the same history, and each Generator replays
+those events into a repository of its kind:
+
+    generator = GENERATORS['hg']()
+    repository = generator.generate(directory, Shape(commits=500))
+
+Only the Git and Hg generators have been run so far. SVNGenerator and
+CVSGenerator are unverified: they were written without svn or cvs at hand
+and may need fixing the first time they run.
+"""
+import os
+import random
+import shlex
+import shutil
+import subprocess
+
+import codeminer_tools.repositories.cvs as cvs
+import codeminer_tools.repositories.git as git
+import codeminer_tools.repositories.hg as hg
+import codeminer_tools.repositories.svn as svn
+
+WORDS = ('alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta',
+         'theta', 'iota', 'kappa', 'lambda', 'mu', 'return', 'if', 'else',
+         'for', 'while', 'int', 'char', 'void', '{', '}', ';', '=')
+
+AUTHOR = 'Benchmark Author'
+EMAIL = 'benchmark@example.com'
+
+# Seconds between two commits of a generated history
+COMMIT_INTERVAL = 3600
+FIRST_COMMIT = 946684800
+
+
+class Shape:
+    """ What a synthetic history looks like
+
+    Parameters
+    ----------
+    commits : int
+        Commits on the main line, the first adding every file
+    files : int
+        Text files the history starts with
+    changes : int
+        Changes per commit after the first
+    copy_ratio, move_ratio, remove_ratio : float
+        Share of the changes which copy, move or remove a file. The rest
+        modify one, adds keep the number of files from going down
+    binary_files : int
+        Large binary files, added by the first commit and modified now
+        and then
+    binary_size : int
+        Size of each binary file in bytes
+    branches : int
+        Branches forked from the main line, each getting a commit before
+        being merged back
+    lines : int
+        Lines of each text file
+    seed : int
+        Seed of the random choices
+    """
+
+    def __init__(self, commits=100, files=50, changes=5, copy_ratio=0.1,
+                 move_ratio=0.1, remove_ratio=0.05, binary_files=0,
+                 binary_size=1024 ** 2, branches=0, lines=50, seed=0):
+        self.commits = commits
+        self.files = files
+        self.changes = changes
+        self.copy_ratio = copy_ratio
+        self.move_ratio = move_ratio
+        self.remove_ratio = remove_ratio
+        self.binary_files = binary_files
+        self.binary_size = binary_size
+        self.branches = branches
+        self.lines = lines
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class Commit:
+    """ Operations of one commit: ('write', path, data),
+    ('copy', source, destination), ('move', source, destination) and
+    ('remove', path). Files written for the first time are added"""
+
+    def __init__(self, number, operations, branch=None):
+        self.number = number
+        self.operations = operations
+        self.branch = branch
+
+    @property
+    def message(self):
+        return 'Commit {0}'.format(self.number)
+
+    @property
+    def timestamp(self):
+        return FIRST_COMMIT + self.number * COMMIT_INTERVAL
+
+
+def plan(shape):
+    """ Events building a history of shape: Commit objects, and
+    ('branch', name) / ('merge', name) around the commits of a branch"""
+    rng = random.Random(shape.seed)
+    text_files = []
+    binary_files = []
+    names = iter(range(10 ** 9))
+
+    def text():
+        return '\n'.join(' '.join(rng.choice(WORDS) for _ in range(8))
+                         for _ in range(shape.lines)).encode() + b'\n'
+
+    def new_path():
+        # A few directories, so moves and copies cross them
+        return 'dir{0}/file{1}.c'.format(rng.randrange(5), next(names))
+
+    def modify(data):
+        lines = data.split(b'\n')
+        for _ in range(max(1, len(lines) // 10)):
+            lines[rng.randrange(len(lines))] = ' '.join(
+                rng.choice(WORDS) for _ in range(8)).encode()
+        return b'\n'.join(lines)
+
+    contents = {}
+    operations = []
+    for _ in range(shape.files):
+        path = new_path()
+        text_files.append(path)
+        contents[path] = text()
+        operations.append(('write', path, contents[path]))
+    for number in range(shape.binary_files):
+        path = 'binary/blob{0}.bin'.format(number)
+        binary_files.append(path)
+        operations.append(('write', path, rng.randbytes(shape.binary_size)))
+    events = [Commit(0, operations)]
+
+    def changes():
+        operations = []
+        touched = set()
+        for _ in range(shape.changes):
+            choice = rng.random()
+            available = [x for x in text_files if x not in touched]
+            if not available or len(text_files) < shape.files // 2:
+                path = new_path()
+                contents[path] = text()
+                text_files.append(path)
+                touched.add(path)
+                operations.append(('write', path, contents[path]))
+                continue
+            source = rng.choice(available)
+            touched.add(source)
+            if choice < shape.copy_ratio:
+                destination = new_path()
+                contents[destination] = contents[source]
+                text_files.append(destination)
+                touched.add(destination)
+                operations.append(('copy', source, destination))
+            elif choice < shape.copy_ratio + shape.move_ratio:
+                destination = new_path()
+                contents[destination] = contents.pop(source)
+                text_files.remove(source)
+                text_files.append(destination)
+                touched.add(destination)
+                operations.append(('move', source, destination))
+            elif choice < (shape.copy_ratio + shape.move_ratio +
+                           shape.remove_ratio):
+                del contents[source]
+                text_files.remove(source)
+                operations.append(('remove', source))
+            else:
+                contents[source] = modify(contents[source])
+                operations.append(('write', source, contents[source]))
+        if binary_files and rng.random() < 0.1:
+            operations.append(('write', rng.choice(binary_files),
+                               rng.randbytes(shape.binary_size)))
+        return operations
+
+    # Main line commits the branches fork from, spread evenly
+    step = max(1, shape.commits // (shape.branches + 1))
+    branch_at = {step * (x + 1): 'branch{0}'.format(x)
+                 for x in range(shape.branches)}
+    number = 1
+    for main_commit in range(1, shape.commits):
+        if main_commit in branch_at:
+            name = branch_at[main_commit]
+            events.append(('branch', name))
+            events.append(Commit(number, changes(), name))
+            events.append(('merge', name))
+            number += 1
+        events.append(Commit(number, changes()))
+        number += 1
+    return events
+
+
+def run(command, cwd, env=None):
+    subprocess.run(command, cwd=cwd, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+class Generator:
+    """ Replays plan events into a repository. Subclasses implement the
+    version control operations: create, add, copy, move, remove, commit,
+    branch, merge and open"""
+
+    name = None
+    # Commands needed to generate and read this kind of repository
+    commands = ()
+
+    @classmethod
+    def available(cls):
+        """ None if the repository can be generated here, otherwise why"""
+        for command in cls.commands:
+            if shutil.which(command) is None:
+                return '{0} not found'.format(command)
+        return None
+
+    def generate(self, directory, shape):
+        """ Create a repository of shape in directory and open it"""
+        self.create(directory)
+        for event in plan(shape):
+            if isinstance(event, Commit):
+                self.apply(event)
+            elif event[0] == 'branch':
+                self.branch(event[1])
+            else:
+                self.merge(event[1])
+        return self.open()
+
+    def apply(self, commit):
+        added = []
+        binary = []
+        for operation in commit.operations:
+            if operation[0] == 'write':
+                path, data = operation[1], operation[2]
+                full_path = os.path.join(self.work, path)
+                new = not os.path.exists(full_path)
+                if new:
+                    self.make_directories(os.path.dirname(path))
+                with open(full_path, 'wb') as output:
+                    output.write(data)
+                if new:
+                    (binary if path.endswith('.bin') else added).append(path)
+                else:
+                    self.modified(path)
+            elif operation[0] == 'copy':
+                self.make_directories(os.path.dirname(operation[2]))
+                self.copy(operation[1], operation[2])
+            elif operation[0] == 'move':
+                self.make_directories(os.path.dirname(operation[2]))
+                self.move(operation[1], operation[2])
+            else:
+                self.remove(operation[1])
+        if added:
+            self.add(added)
+        if binary:
+            self.add(binary, binary=True)
+        self.commit(commit)
+
+    def make_directories(self, directory):
+        os.makedirs(os.path.join(self.work, directory), exist_ok=True)
+
+    def modified(self, path):
+        pass
+
+
+class GitGenerator(Generator):
+
+    name = 'git'
+    commands = ('git',)
+
+    def create(self, directory):
+        self.work = os.path.join(directory, 'git')
+        os.makedirs(self.work)
+        self.env = dict(os.environ, GIT_AUTHOR_NAME=AUTHOR,
+                        GIT_AUTHOR_EMAIL=EMAIL, GIT_COMMITTER_NAME=AUTHOR,
+                        GIT_COMMITTER_EMAIL=EMAIL)
+        self.git('init -q -b main')
+
+    def git(self, command, *paths):
+        run(['git'] + shlex.split(command) + list(paths), self.work, self.env)
+
+    def add(self, paths, binary=False):
+        self.git('add --', *paths)
+
+    def modified(self, path):
+        self.git('add --', path)
+
+    def copy(self, source, destination):
+        shutil.copy(os.path.join(self.work, source),
+                    os.path.join(self.work, destination))
+        self.git('add --', destination)
+
+    def move(self, source, destination):
+        self.git('mv', source, destination)
+
+    def remove(self, path):
+        self.git('rm -q --', path)
+
+    def commit(self, commit):
+        date = '{0} +0000'.format(commit.timestamp)
+        self.env['GIT_AUTHOR_DATE'] = self.env['GIT_COMMITTER_DATE'] = date
+        self.git('commit -q --allow-empty -m', commit.message)
+
+    def branch(self, name):
+        self.git('checkout -q -b', name)
+
+    def merge(self, name):
+        self.git('checkout -q main')
+        self.git('merge -q --no-ff -m', 'Merge ' + name, name)
+
+    def open(self):
+        return git.open_repository(self.work)
+
+
+class HgGenerator(Generator):
+
+    name = 'hg'
+    commands = ('hg',)
+
+    def create(self, directory):
+        self.work = os.path.join(directory, 'hg')
+        os.makedirs(self.work)
+        self.timestamp = FIRST_COMMIT
+        self.hg('init')
+
+    def hg(self, command, *paths):
+        run(['hg'] + shlex.split(command) + list(paths), self.work,
+            dict(os.environ, HGPLAIN='1'))
+
+    def add(self, paths, binary=False):
+        self.hg('add', *paths)
+
+    def copy(self, source, destination):
+        self.hg('copy', source, destination)
+
+    def move(self, source, destination):
+        self.hg('move', source, destination)
+
+    def remove(self, path):
+        self.hg('remove', path)
+
+    def commit(self, commit):
+        self.timestamp = commit.timestamp
+        self.hg('commit -m', commit.message, '-u', AUTHOR, '-d',
+                '{0} 0'.format(commit.timestamp))
+
+    def branch(self, name):
+        self.hg('branch', name)
+
+    def merge(self, name):
+        self.hg('update -q default')
+        self.hg('merge -q', name)
+        self.hg('commit -m', 'Merge ' + name, '-u', AUTHOR, '-d',
+                '{0} 0'.format(self.timestamp + 1))
+
+    def open(self):
+        return hg.HgRepository(hg.hglib.open(self.work))
+
+
+class SVNGenerator(Generator):
+    """ Trunk and branches layout, the working copy is a checkout of trunk
+    switched to a branch for its commit"""
+
+    name = 'svn'
+    commands = ('svn', 'svnadmin')
+
+    def create(self, directory):
+        server = os.path.join(directory, 'svnroot')
+        run(['svnadmin', 'create', server], directory)
+        self.url = 'file://' + server
+        run(['svn', 'mkdir', '-q', '-m', 'Layout', self.url + '/trunk',
+             self.url + '/branches'], directory)
+        self.work = os.path.join(directory, 'svn')
+        run(['svn', 'checkout', '-q', self.url + '/trunk', self.work],
+            directory)
+
+    def svn(self, command, *paths):
+        run(['svn'] + shlex.split(command) + list(paths), self.work)
+
+    def make_directories(self, directory):
+        if directory and not os.path.exists(
+                os.path.join(self.work, directory)):
+            self.svn('mkdir -q --parents', directory)
+
+    def add(self, paths, binary=False):
+        self.svn('add -q', *paths)
+        if binary:
+            self.svn('propset -q svn:mime-type application/octet-stream',
+                     *paths)
+
+    def copy(self, source, destination):
+        self.svn('copy -q', source, destination)
+
+    def move(self, source, destination):
+        self.svn('move -q', source, destination)
+
+    def remove(self, path):
+        self.svn('remove -q', path)
+
+    def commit(self, commit):
+        self.svn('commit -q -m', commit.message)
+        self.svn('update -q')
+
+    def branch(self, name):
+        self.svn('copy -q -m', 'Branch ' + name, self.url + '/trunk',
+                 self.url + '/branches/' + name)
+        self.svn('switch -q', self.url + '/branches/' + name)
+
+    def merge(self, name):
+        self.svn('switch -q', self.url + '/trunk')
+        self.svn('merge -q', self.url + '/branches/' + name)
+        self.svn('commit -q -m', 'Merge ' + name)
+        self.svn('update -q')
+
+    def open(self):
+        return svn.open_repository(self.work)
+
+
+class CVSGenerator(Generator):
+    """ One module, branches made with `tag -b` and merged back with
+    `update -j`"""
+
+    name = 'cvs'
+    commands = ('cvs',)
+
+    def create(self, directory):
+        self.root = os.path.join(directory, 'cvsroot')
+        run(['cvs', '-d', self.root, 'init'], directory)
+        os.makedirs(os.path.join(self.root, 'module'))
+        run(['cvs', '-d', self.root, 'checkout', '-d', 'cvs', 'module'],
+            directory)
+        self.work = os.path.join(directory, 'cvs')
+
+    def cvs(self, command, *paths):
+        run(['cvs', '-Q', '-d', self.root] + shlex.split(command) +
+            list(paths), self.work)
+
+    def make_directories(self, directory):
+        # Every level has to be added on its own
+        parts = directory.split('/') if directory else []
+        for depth in range(1, len(parts) + 1):
+            path = '/'.join(parts[:depth])
+            if not os.path.exists(os.path.join(self.work, path, 'CVS')):
+                os.makedirs(os.path.join(self.work, path), exist_ok=True)
+                self.cvs('add', path)
+
+    def add(self, paths, binary=False):
+        self.cvs('add -kb' if binary else 'add', *paths)
+
+    def copy(self, source, destination):
+        # CVS has no copies, the file is added again
+        shutil.copy(os.path.join(self.work, source),
+                    os.path.join(self.work, destination))
+        self.cvs('add', destination)
+
+    def move(self, source, destination):
+        self.copy(source, destination)
+        self.remove(source)
+
+    def remove(self, path):
+        os.remove(os.path.join(self.work, path))
+        self.cvs('remove', path)
+
+    def commit(self, commit):
+        self.cvs('commit -m', commit.message)
+
+    def branch(self, name):
+        self.cvs('tag -b', name)
+        self.cvs('update -r', name)
+
+    def merge(self, name):
+        self.cvs('update -A')
+        self.cvs('update -d -j', name)
+        self.cvs('commit -m', 'Merge ' + name)
+
+    def open(self):
+        return cvs.open_repository(self.work)
+
+
+GENERATORS = {generator.name: generator for generator in (
+    CVSGenerator, GitGenerator, HgGenerator, SVNGenerator)}
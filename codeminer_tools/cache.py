@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import zlib
+
+# Default upper bound on the compressed size of everything cached (bytes)
+DEFAULT_MAX_SIZE = 1024 ** 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+CREATE TABLE IF NOT EXISTS meta (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (id, total_size)
+    SELECT 0, COALESCE(SUM(size), 0) FROM objects;
+"""
+
+
+class ResultCache:
+    """ Persistent, content-addressed cache of immutable command results
+
+    Things like `svn cat URL@REV` or `cvs co -p -rX.Y` can never change once
+    the revision exists, so their output is worth keeping between runs.
+    Entries are keyed by (repository origin, command, revision, ...) and
+    point at zlib-compressed objects named after the SHA-256 of their
+    contents, so identical outputs are only stored once. Once the objects
+    grow beyond `max_size` bytes the least recently used entries are
+    evicted.
+
+    The index is an SQLite database and objects are written atomically, so
+    several processes can share a cache directory. An object evicted by
+    another process is treated as a miss.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE, compression_level=6):
+        self.path = path
+        self.max_size = max_size
+        self.compression_level = compression_level
+        self.objects_path = os.path.join(path, 'objects')
+        os.makedirs(self.objects_path, exist_ok=True)
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self):
+        # SQLite connections can't be shared across fork()
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                os.path.join(self.path, 'index.db'), timeout=60,
+                isolation_level=None, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        """ Close this process's connection to the index, the next use
+        opens another"""
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._pid = None
+
+    @staticmethod
+    def key(origin, *identity):
+        """ Cache key for the result of `identity` (command, path, revision,
+        ...) in the repository at `origin`"""
+        return hashlib.sha256(
+            json.dumps([origin] + [str(x) for x in identity]).encode()
+        ).hexdigest()
+
+    def get(self, key):
+        """ Cached bytes for key, or None"""
+        row = self.connection.execute(
+            'SELECT digest FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        try:
+            with open(self._object_path(row[0]), 'rb') as cached:
+                data = zlib.decompress(cached.read())
+        except FileNotFoundError:
+            self._forget(row[0])
+            return None
+
+        self.connection.execute(
+            'UPDATE entries SET last_used = ? WHERE key = ?',
+            (time.time(), key))
+        return data
+
+    def put(self, key, data):
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(digest)
+        compressed = zlib.compress(data, self.compression_level)
+
+        connection = self.connection
+        # Objects are only written and removed holding the write lock, so
+        # an evict in another process can't remove this one between the
+        # check and the insert
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if os.path.exists(object_path):
+                size = os.path.getsize(object_path)
+            else:
+                self._write_object(object_path, compressed)
+                size = len(compressed)
+            inserted = connection.execute(
+                'INSERT OR IGNORE INTO objects (digest, size) VALUES (?, ?)',
+                (digest, size)).rowcount
+            if inserted:
+                self._add_size(size)
+            connection.execute(
+                'INSERT OR REPLACE INTO entries (key, digest, last_used) '
+                'VALUES (?, ?, ?)', (key, digest, time.time()))
+            total = self.size()
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        if total > self.max_size:
+            self.evict()
+
+    def _write_object(self, object_path, compressed):
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        handle, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(object_path))
+        with os.fdopen(handle, 'wb') as temporary:
+            temporary.write(compressed)
+        os.replace(temporary_path, object_path)
+
+    def _forget(self, digest):
+        """ Drop the rows of an object whose file is gone"""
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # It may have been written again since the failed read
+            if not os.path.exists(self._object_path(digest)):
+                connection.execute(
+                    'DELETE FROM entries WHERE digest = ?', (digest,))
+                self._delete_object(digest)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def fetch(self, key, producer):
+        """ Cached bytes for key, calling `producer` to fill it on a miss"""
+        data = self.get(key)
+        if data is None:
+            data = producer()
+            self.put(key, data)
+        return data
+
+    def size(self):
+        """ Total compressed size of the cached objects"""
+        return self.connection.execute(
+            'SELECT total_size FROM meta WHERE id = 0').fetchone()[0]
+
+    def _add_size(self, delta):
+        # Running total of objects.size, kept in the writes' transaction
+        # rather than summed over the whole table on every put
+        self.connection.execute(
+            'UPDATE meta SET total_size = total_size + ? WHERE id = 0',
+            (delta,))
+
+    def _delete_object(self, digest):
+        """ Drop the row of an object, returns its size (0 if it had
+        none)"""
+        row = self.connection.execute(
+            'SELECT size FROM objects WHERE digest = ?', (digest,)).fetchone()
+        if row is None:
+            return 0
+        self.connection.execute(
+            'DELETE FROM objects WHERE digest = ?', (digest,))
+        self._add_size(-row[0])
+        return row[0]
+
+    def evict(self, target=None):
+        """ Drop least recently used entries until the objects fit in
+        `target` bytes (default `max_size`)"""
+        if target is None:
+            target = self.max_size
+
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # Objects no entry refers to any more
+            removed = [digest for digest, in connection.execute(
+                'SELECT digest FROM objects WHERE digest NOT IN '
+                '(SELECT digest FROM entries)').fetchall()]
+            for digest in removed:
+                self._delete_object(digest)
+            total = self.size()
+            while total > target:
+                rows = connection.execute(
+                    'SELECT key, digest FROM entries ORDER BY last_used '
+                    'LIMIT 100').fetchall()
+                if not rows:
+                    break
+                for key, digest in rows:
+                    connection.execute(
+                        'DELETE FROM entries WHERE key = ?', (key,))
+                    referenced = connection.execute(
+                        'SELECT 1 FROM entries WHERE digest = ? LIMIT 1',
+                        (digest,)).fetchone()
+                    if referenced is None:
+                        total -= self._delete_object(digest)
+                        removed.append(digest)
+                    if total <= target:
+                        break
+            # Still holding the write lock, see put
+            for digest in removed:
+                try:
+                    os.remove(self._object_path(digest))
+                except FileNotFoundError:
+                    pass
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def clear(self):
+        self.evict(target=-1)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_path, digest[:2], digest[2:])
@@ -1,22 +1,124 @@
+import asyncio
+import io
 import subprocess
+import threading
+import weakref
+
+from codeminer_tools.clients.instrumentation import CommandEvent
+from codeminer_tools.clients import instrumentation as instruments
+
+
+# Default size of the chunks handed out by iter_chunks
+CHUNK_SIZE = 64 * 1024
+
+# Default number of subcommands an AsyncCommandLineClient runs at once
+ASYNC_CONCURRENCY = 16
+
+
+class CommandLineException(Exception):
+    pass
+
+
+class CommandOutput(io.RawIOBase):
+    """ Readable file object over the standard output of a running command
+
+    Output is read straight from the pipe, so arbitrarily large outputs can
+    be processed with bounded memory. Error output is collected in the
+    background so the command can't stall on a full stderr pipe. Once the
+    output is exhausted the exit code is checked and, with `check`,
+    `exception` is raised with the error output if the command failed.
+    Closing the stream early kills the command. If given, `event` is
+    completed and recorded to `instrumentation` once the command is done.
+    """
+
+    def __init__(self, process, exception=CommandLineException, event=None,
+                 instrumentation=None, check=True):
+        super().__init__()
+        self.process = process
+        self.exception = exception
+        self.check = check
+        self.event = event
+        self.instrumentation = instrumentation
+        self.finished = False
+        self.bytes_read = 0
+        self._errors = []
+        self._errors_thread = None
+        if process.stderr is not None:
+            self._errors_thread = threading.Thread(
+                target=self._drain_errors, daemon=True)
+            self._errors_thread.start()
+
+    @property
+    def errors(self):
+        return b''.join(self._errors)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.finished:
+            return 0
+        count = self.process.stdout.readinto1(buffer)
+        if not count:
+            self._finish()
+        self.bytes_read += count
+        return count
+
+    def close(self):
+        if not self.closed and not self.finished:
+            # Nobody is going to read the rest of the output
+            self.process.kill()
+            self._finish(check=False)
+        super().close()
+
+    def _drain_errors(self):
+        for chunk in iter(lambda: self.process.stderr.read(CHUNK_SIZE), b''):
+            self._errors.append(chunk)
+
+    def _finish(self, check=True):
+        if self.finished:
+            return
+        self.finished = True
+        self.process.stdout.close()
+        self.process.wait()
+        if self._errors_thread is not None:
+            self._errors_thread.join()
+            self.process.stderr.close()
+        if self.event is not None:
+            self.event.finished(self.process.returncode, self.bytes_read,
+                                len(self.errors))
+            self.instrumentation.record(self.event)
+        if check and self.check and self.process.returncode != 0:
+            raise self.exception(self.errors)
+
+
+def iter_chunks(stream, size=CHUNK_SIZE):
+    """ Iterate over a stream in chunks of at most `size` bytes"""
+    return iter(lambda: stream.read(size), b'')
+
+
+def _loggable(arguments):
+    """ Copy of a command's arguments safe to log (no passwords)"""
+    arguments = list(arguments)
+    for index, argument in enumerate(arguments[:-1]):
+        if argument == '--password':
+            arguments[index + 1] = '********'
+    return arguments
 
 
 class CommandLineClient:
 
-    def __init__(self, command, env={}):
+    exception = CommandLineException
+
+    def __init__(self, command, env={}, instrumentation=None):
         self.command = command
         self.env = env
+        # Receives a CommandEvent for every subcommand run through execute
+        if instrumentation is None:
+            instrumentation = instruments.default
+        self.instrumentation = instrumentation
 
-    def run_subcommand(
-            self,
-            subcommand,
-            *args,
-            flags=[],
-            cwd=None,
-            stdin=None,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            **kwargs):
+    def build_command(self, subcommand, *args, flags=[], **kwargs):
         command = [self.command, subcommand]
 
         if flags:
@@ -34,7 +136,111 @@ class CommandLineClient:
         for arg in args:
             command.append(arg)
 
-        print('$ {command}'.format(command=' '.join(command)))
+        return command
+
+    def run_subcommand(
+            self,
+            subcommand,
+            *args,
+            flags=[],
+            cwd=None,
+            stdin=None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            event=None,
+            **kwargs):
+        command = self.build_command(subcommand, *args, flags=flags, **kwargs)
+        if event is not None:
+            event.arguments = _loggable(command[2:])
+
+        process = subprocess.Popen(command, stdin=stdin, stdout=stdout,
+                                   stderr=stderr, cwd=cwd, env=self.env)
+        if event is not None:
+            event.spawned()
+        return process
+
+    def execute(self, subcommand, *args, stream=False, check=True,
+                **kwargs):
+        """ Run a subcommand to completion, or stream its output
+
+        Takes the same arguments as `run_subcommand`. Without `stream` the
+        output is collected and (stdout, stderr) returned. With `stream` a
+        buffered file object reading from the pipe is returned instead,
+        which can be read, iterated by line or passed to `iter_chunks`.
+        Either way a non-zero exit code raises `exception` (unless `check`
+        is False), and the run is reported to `instrumentation`.
+        """
+        event = CommandEvent(self.command, subcommand)
+        process = self.run_subcommand(subcommand, *args, event=event, **kwargs)
+        if stream:
+            return io.BufferedReader(CommandOutput(
+                process, self.exception, event, self.instrumentation,
+                check=check))
+
+        out, errs = process.communicate()
+        event.finished(process.returncode, len(out or b''), len(errs or b''))
+        self.instrumentation.record(event)
+        if check and process.returncode != 0:
+            raise self.exception(errs)
+        else:
+            return out, errs
+
+
+class AsyncCommandLineClient(CommandLineClient):
+    """ Runs subcommands with asyncio instead of blocking on them
+
+    Meant to be mixed in ahead of a concrete client, for instance
+    `class AsyncSVNClient(AsyncCommandLineClient, SVNClient)`. Every client
+    method which goes through `execute` then returns a coroutine, so one
+    event loop can drive many commands. At most `concurrency` subcommands
+    of a client run at once.
+    """
+
+    def __init__(self, *args, concurrency=ASYNC_CONCURRENCY, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.concurrency = concurrency
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @property
+    def semaphore(self):
+        # Semaphores belong to an event loop, keep one per running loop
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[loop]
+
+    async def execute(
+            self,
+            subcommand,
+            *args,
+            flags=[],
+            cwd=None,
+            stdin=None,
+            stream=False,
+            check=True,
+            stderr=subprocess.PIPE,
+            **kwargs):
+        """ Coroutine counterpart of `CommandLineClient.execute`
+
+        The output is always collected, with `stream` it is handed back as
+        a file object so callers can treat both clients the same way.
+        """
+        command = self.build_command(subcommand, *args, flags=flags, **kwargs)
+        async with self.semaphore:
+            event = CommandEvent(self.command, subcommand,
+                                 _loggable(command[2:]))
+            process = await asyncio.create_subprocess_exec(
+                *command, stdin=stdin, stdout=subprocess.PIPE,
+                stderr=stderr, cwd=cwd, env=self.env)
+            event.spawned()
+            out, errs = await process.communicate()
+            event.finished(process.returncode, len(out or b''),
+                           len(errs or b''))
+        self.instrumentation.record(event)
 
-        return subprocess.Popen(command, stdin=stdin, stdout=stdout,
-                                stderr=stderr, cwd=cwd, env=self.env)
+        if check and process.returncode != 0:
+            raise self.exception(errs)
+        elif stream:
+            return io.BytesIO(out)
+        else:
+            return out, errs
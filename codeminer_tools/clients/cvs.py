@@ -2,15 +2,19 @@ import os
 import subprocess
 from typing import Dict, List, Optional, Union, Tuple
 
-from codeminer_tools.clients.commandline import CommandLineClient
+from codeminer_tools.clients.commandline import (AsyncCommandLineClient,
+                                                 CommandLineClient,
+                                                 CommandLineException)
 
 
-class CVSException(Exception):
+class CVSException(CommandLineException):
     pass
 
 
 class CVSClient(CommandLineClient):
 
+    exception = CVSException
+
     def __init__(self, cvs_root=None, binary='cvs', cwd=None):
         env = CVSClient.get_env_vars()
         if cvs_root is not None:
@@ -92,17 +96,11 @@ class CVSClient(CommandLineClient):
         for kwarg in kwargs:
             options[kwarg] = kwargs[kwarg]
 
-        result = self.run_subcommand('add', *arguments, flags=flags,
-                                     cwd=cwd, **options)
-
-        out, errs = result.communicate()
-        if result.returncode != 0:
-            raise CVSException(errs)
-        else:
-            return out, errs
+        return self.execute('add', *arguments, flags=flags, cwd=cwd,
+                            **options)
 
     def checkout(self,
-                 path: str = None,
+                 path: Union[List[str], str] = None,
                  reset: bool = False,
                  no_shorten: bool = False,
                  prune: bool = False,
@@ -118,6 +116,9 @@ class CVSClient(CommandLineClient):
                  dir: str = None,
                  kopt: str = None,
                  merge: bool = None,
+                 combine_output: bool = False,
+                 stream: bool = False,
+                 check: bool = True,
                  cwd=None,
                  *args: str,
                  **kwargs: str) -> Tuple[str,
@@ -126,6 +127,8 @@ class CVSClient(CommandLineClient):
 
         Parameters
         ----------
+        path : str or list of str, optional
+            Modules or module paths to check out
         reset : bool
             Reset any sticky tags/date/kopts.
         no_shorten : bool
@@ -156,6 +159,17 @@ class CVSClient(CommandLineClient):
             Use RCS kopt -k option on checkout. (is sticky)
         merge : str
             Merge in changes made between current revision and rev.
+        combine_output : bool
+            Send error output to the standard output pipe. With `stdout`
+            this keeps each file's "Checking out" header in front of its
+            contents.
+        stream : bool
+            Return a file object reading from the pipe instead of
+            (stdout, stderr).
+        check : bool
+            Raise CVSException if cvs returns an error code. Checking out
+            several files, a missing one fails the command but not the
+            others.
         cwd : str, optional
             Change working directory to this path before executing
             CVS comman
@@ -210,8 +224,12 @@ class CVSClient(CommandLineClient):
         if merge is not None:
             options['j'] = merge
 
-        if path is not None:
+        if isinstance(path, str):
             arguments.append(path)
+        elif path is not None:
+            arguments += path
+
+        stderr = subprocess.STDOUT if combine_output else subprocess.PIPE
 
         if cwd is None:
             cwd = self.cwd
@@ -222,14 +240,9 @@ class CVSClient(CommandLineClient):
         for kwarg in kwargs:
             options[kwarg] = kwargs[kwarg]
 
-        result = self.run_subcommand('checkout', *arguments, flags=flags,
-                                     cwd=cwd, **options)
-
-        out, errs = result.communicate()
-        if result.returncode != 0:
-            raise CVSException(errs)
-        else:
-            return out, errs
+        return self.execute('checkout', *arguments, flags=flags, cwd=cwd,
+                            stream=stream, check=check, stderr=stderr,
+                            **options)
 
     def commit(self, message: str, files: Union[List[str], str]=[],
                recursive: bool = False, local_directory: bool = False,
@@ -297,13 +310,8 @@ class CVSClient(CommandLineClient):
         for kwarg in kwargs:
             options[kwarg] = kwargs[kwarg]
 
-        result = self.run_subcommand('commit', *arguments, flags=flags,
-                                     cwd=cwd, **options)
-        out, errs = result.communicate()
-        if result.returncode != 0:
-            raise CVSException(errs)
-        else:
-            return out, errs
+        return self.execute('commit', *arguments, flags=flags, cwd=cwd,
+                            **options)
 
     def remove(self, files: Union[List[str], str]=[],
                delete: bool = False, local_directory: bool = False,
@@ -353,13 +361,8 @@ class CVSClient(CommandLineClient):
         for kwarg in kwargs:
             options[kwarg] = kwargs[kwarg]
 
-        result = self.run_subcommand('remove', *arguments, flags=flags,
-                                     cwd=cwd, **options)
-        out, errs = result.communicate()
-        if result.returncode != 0:
-            raise CVSException(errs)
-        else:
-            return out, errs
+        return self.execute('remove', *arguments, flags=flags, cwd=cwd,
+                            **options)
 
     def log(
             self,
@@ -387,6 +390,8 @@ class CVSClient(CommandLineClient):
                 List[str],
                 str]=[],
             xml: bool = False,
+            remote: bool = False,
+            stream: bool = False,
             cwd=None,
             *args,
             **kwargs):
@@ -426,6 +431,12 @@ class CVSClient(CommandLineClient):
             Return XML representation of the log. This
             is not a native operation and relies on
             cvs2cl perl script
+        remote : bool, optional
+            Run `rlog` against CVSROOT instead of `log` against
+            a working copy. `files` are then module paths.
+        stream : bool, optional
+            Return a file object reading from the pipe instead of
+            (stdout, stderr). Not supported with `xml`.
         cwd : str, optional
             Change working directory to this path before executing
             CVS comman
@@ -500,44 +511,134 @@ class CVSClient(CommandLineClient):
         for kwarg in kwargs:
             options[kwarg] = kwargs[kwarg]
 
-        log_process = self.run_subcommand('log', *arguments, flags=flags,
-                                          cwd=self.cwd, **options)
-
-        if xml:
-            cvs2cl = os.path.join(os.path.abspath(
-                os.path.dirname(__file__)), '..', 'tools', 'cvs2cl.pl')
-            xml_process = subprocess.Popen(['perl',
-                                            cvs2cl,
-                                            '--stdin',
-                                            '--stdout',
-                                            '--xml',
-                                            '--noxmlns',
-                                            '--lines-modified',
-                                            '--tags',
-                                            '--follow'],
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.PIPE,
-                                           stdin=log_process.stdout,
-                                           cwd=cwd,
-                                           env=self.env)
-
-            # Close stdout handle for log_process since it will be used by
-            # cvs2cl
-            log_process.stdout.close()
-            # Get stderr/stdout from cvs2cl
-            out, errs = xml_process.communicate()
-            # Close out log_process (communicate() ensured it was done)
-            # We only need this to get the return code populated
-            log_process.wait()
-            # Read and close the stderr which we had left open on log_process
-            cvs_error = log_process.stderr.read()
-            log_process.stderr.close()
-            if log_process.returncode != 0:
-                raise CVSException(errs)
-            return out, errs
+        subcommand = 'rlog' if remote else 'log'
+        if not xml:
+            return self.execute(subcommand, *arguments, flags=flags, cwd=cwd,
+                                stream=stream, **options)
+
+        log_process = self.run_subcommand(subcommand, *arguments, flags=flags,
+                                          cwd=cwd, **options)
+        cvs2cl = os.path.join(os.path.abspath(
+            os.path.dirname(__file__)), '..', 'tools', 'cvs2cl.pl')
+        xml_process = subprocess.Popen(['perl',
+                                        cvs2cl,
+                                        '--stdin',
+                                        '--stdout',
+                                        '--xml',
+                                        '--noxmlns',
+                                        '--lines-modified',
+                                        '--tags',
+                                        '--follow'],
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE,
+                                       stdin=log_process.stdout,
+                                       cwd=cwd,
+                                       env=self.env)
+
+        # Close stdout handle for log_process since it will be used by
+        # cvs2cl
+        log_process.stdout.close()
+        # Get stderr/stdout from cvs2cl
+        out, errs = xml_process.communicate()
+        # Close out log_process (communicate() ensured it was done)
+        # We only need this to get the return code populated
+        log_process.wait()
+        # Read and close the stderr which we had left open on log_process
+        cvs_error = log_process.stderr.read()
+        log_process.stderr.close()
+        if log_process.returncode != 0:
+            raise CVSException(errs)
+        return out, errs
+
+    def rlog(self, modules: Union[List[str], str], **kwargs):
+        """Print out history information for modules without a working copy
+
+        Takes the same parameters as `log`, with `modules` naming paths
+        relative to CVSROOT.
+        """
+        return self.log(files=modules, remote=True, **kwargs)
+
+    def rls(self,
+            modules: Union[List[str], str]=[],
+            entries: bool = False,
+            long: bool = False,
+            recursive: bool = False,
+            prune: bool = False,
+            revision: str = None,
+            date: str = None,
+            cwd=None,
+            *args: str,
+            **kwargs: str) -> Tuple[str,
+                                    str]:
+        """List files available from CVS
+
+        Parameters
+        ----------
+        modules : str or list of str, optional
+            Modules/directories to list, default is the top of CVSROOT
+        entries : bool, optional
+            Display in CVS/Entries format.
+        long : bool, optional
+            Display all details.
+        recursive : bool, optional
+            List recursively.
+        prune : bool, optional
+            Don't list empty directories.
+        revision : str, optional
+            Show files with revision or tag.
+        date : str, optional
+            Show files from date.
+        cwd : str, optional
+            Change working directory to this path before executing
+            CVS comman
+
+        Returns
+        -------
+        stdout : str
+            The standard output from the cvs command
+        stderr : str
+            The error output from the cvs command
+
+        Raises
+        ------
+        CVSException
+            If the cvs program returns an error code
+
+        """
+        options = {}
+        flags = []
+        arguments = []
+
+        if entries:
+            flags.append('e')
+        if long:
+            flags.append('l')
+        if recursive:
+            flags.append('R')
+        if prune:
+            flags.append('P')
+        if revision is not None:
+            options['r'] = revision
+        if date is not None:
+            options['D'] = date
+
+        if isinstance(modules, str):
+            arguments.append(modules)
         else:
-            out, errs = log_process.communicate()
-            if log_process.returncode != 0:
-                raise CVSException(errs)
+            arguments += modules
 
-        return out, errs
+        if cwd is None:
+            cwd = self.cwd
+
+        for arg in args:
+            flags.append(arg)
+
+        for kwarg in kwargs:
+            options[kwarg] = kwargs[kwarg]
+
+        return self.execute('rls', *arguments, flags=flags, cwd=cwd,
+                            **options)
+
+
+class AsyncCVSClient(AsyncCommandLineClient, CVSClient):
+    """ CVSClient whose commands are coroutines, see AsyncCommandLineClient"""
@@ -0,0 +1,166 @@
+import bisect
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger('codeminer_tools.commands')
+
+# Upper bounds of the histogram buckets used for durations (seconds)
+TIME_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60]
+
+# Upper bounds of the histogram buckets used for output sizes (bytes)
+SIZE_BUCKETS = [2 ** 10, 2 ** 14, 2 ** 18, 2 ** 22, 2 ** 26, 2 ** 30]
+
+
+class CommandEvent:
+    """ Timing and output statistics of a single subcommand run"""
+
+    def __init__(self, command, subcommand, arguments=None):
+        self.command = command
+        self.subcommand = subcommand
+        self.arguments = arguments if arguments is not None else []
+        self.started = time.time()
+        self.spawn_latency = None
+        self.wall_time = None
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+        self.returncode = None
+        self._clock = time.perf_counter()
+
+    @property
+    def name(self):
+        return '{command} {subcommand}'.format(
+            command=self.command, subcommand=self.subcommand)
+
+    def spawned(self):
+        self.spawn_latency = time.perf_counter() - self._clock
+
+    def finished(self, returncode, stdout_bytes=0, stderr_bytes=0):
+        self.wall_time = time.perf_counter() - self._clock
+        self.returncode = returncode
+        self.stdout_bytes = stdout_bytes
+        self.stderr_bytes = stderr_bytes
+
+    def as_dict(self):
+        return {
+            'command': self.command,
+            'subcommand': self.subcommand,
+            'arguments': self.arguments,
+            'started': self.started,
+            'spawn_latency': self.spawn_latency,
+            'wall_time': self.wall_time,
+            'stdout_bytes': self.stdout_bytes,
+            'stderr_bytes': self.stderr_bytes,
+            'returncode': self.returncode,
+        }
+
+    def __repr__(self):
+        return "<CommandEvent {name}: {wall_time}s>".format(
+            name=self.name, wall_time=self.wall_time)
+
+
+class Histogram:
+    """ Counts of values falling under each of a fixed set of bounds"""
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def as_dict(self):
+        labels = ['<={0}'.format(bound) for bound in self.bounds]
+        labels.append('>{0}'.format(self.bounds[-1]))
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.minimum,
+            'max': self.maximum,
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+class Instrumentation:
+    """ Aggregates CommandEvents into per-subcommand counters and histograms
+
+    Every client reports the subcommands it runs here (see
+    `CommandLineClient.instrumentation`). Listeners added with `subscribe`
+    receive each event as it is recorded. Safe to share between threads.
+    """
+
+    def __init__(self):
+        self.listeners = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def record(self, event):
+        logger.debug('%s (%.3fs, %d bytes, exit %s)', ' '.join(
+            [event.command, event.subcommand] + event.arguments),
+            event.wall_time or 0, event.stdout_bytes, event.returncode)
+
+        with self._lock:
+            counters = self.counters.setdefault(event.name, {
+                'count': 0, 'failures': 0, 'stdout_bytes': 0,
+                'stderr_bytes': 0, 'wall_time': 0})
+            counters['count'] += 1
+            counters['failures'] += 1 if event.returncode else 0
+            counters['stdout_bytes'] += event.stdout_bytes
+            counters['stderr_bytes'] += event.stderr_bytes
+            counters['wall_time'] += event.wall_time or 0
+
+            histograms = self.histograms.setdefault(event.name, {
+                'wall_time': Histogram(TIME_BUCKETS),
+                'spawn_latency': Histogram(TIME_BUCKETS),
+                'stdout_bytes': Histogram(SIZE_BUCKETS)})
+            if event.wall_time is not None:
+                histograms['wall_time'].add(event.wall_time)
+            if event.spawn_latency is not None:
+                histograms['spawn_latency'].add(event.spawn_latency)
+            histograms['stdout_bytes'].add(event.stdout_bytes)
+
+        for listener in self.listeners:
+            listener(event)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    'counters': dict(self.counters[name]),
+                    'histograms': {
+                        key: histogram.as_dict() for key, histogram
+                        in self.histograms[name].items()},
+                } for name in self.counters}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def dump(self, path):
+        with open(path, 'w') as output:
+            output.write(self.to_json(indent=2, sort_keys=True))
+
+
+# Shared by every client that wasn't given its own
+default = Instrumentation()
@@ -2,15 +2,19 @@ import os
 import subprocess
 from typing import Dict, List, Optional, Union, Tuple
 
-from codeminer_tools.clients.commandline import CommandLineClient
+from codeminer_tools.clients.commandline import (AsyncCommandLineClient,
+                                                 CommandLineClient,
+                                                 CommandLineException)
 
 
-class SVNException(Exception):
+class SVNException(CommandLineException):
     pass
 
 
 class SVNClient(CommandLineClient):
 
+    exception = SVNException
+
     def __init__(self, binary='svn', cwd=None, username=None, password=None):
         self.cwd = cwd
         self.name = 'SVN'
@@ -24,10 +28,14 @@ class SVNClient(CommandLineClient):
             target,
             revision=None,
             ignore_keywords=False,
+            stream=False,
             cwd=None,
             *args,
             **kwargs):
-        """Output the content of specified files or URLs."""
+        """Output the content of specified files or URLs.
+
+        With `stream` a file object reading from the pipe is returned instead
+        of (stdout, stderr)."""
         options = {}
         flags = []
         arguments = []
@@ -50,13 +58,8 @@ class SVNClient(CommandLineClient):
             flags.append(arg)
         for kwarg in kwargs:
             options[kwarg] = kwargs[kwarg]
-        result = self.run_subcommand('cat', *arguments, flags=flags,
-                                     cwd=cwd, **options)
-        out, errs = result.communicate()
-        if result.returncode != 0:
-            raise SVNException(errs)
-        else:
-            return out, errs
+        return self.execute('cat', *arguments, flags=flags, cwd=cwd,
+                            stream=stream, **options)
 
     def log(
             self,
@@ -81,6 +84,7 @@ class SVNClient(CommandLineClient):
             extension=None,
             search=None,
             search_and=None,
+            stream=False,
             cwd=None,
             *args,
             **kwargs):
@@ -122,6 +126,9 @@ class SVNClient(CommandLineClient):
                                            -p, --show-c-function: Show C function name
               --search ARG             : use ARG as search pattern (glob syntax)
               --search-and ARG         : combine ARG with the previous search pattern
+
+            With `stream` a file object reading from the pipe is returned
+            instead of (stdout, stderr).
             """
 
         options = {}
@@ -183,13 +190,8 @@ class SVNClient(CommandLineClient):
             flags.append(arg)
         for kwarg in kwargs:
             options[kwarg] = kwargs[kwarg]
-        result = self.run_subcommand('log', *arguments, flags=flags,
-                                     cwd=cwd, **options)
-        out, errs = result.communicate()
-        if result.returncode != 0:
-            raise SVNException(errs)
-        else:
-            return out, errs
+        return self.execute('log', *arguments, flags=flags, cwd=cwd,
+                            stream=stream, **options)
 
     def info(self, target=None, revision=None, recursive=False,
              depth=None, targets=None, incremental=False, xml=False,
@@ -235,13 +237,44 @@ class SVNClient(CommandLineClient):
             flags.append(arg)
         for kwarg in kwargs:
             options[kwarg] = kwargs[kwarg]
-        result = self.run_subcommand('info', *arguments, flags=flags,
-                                     cwd=cwd, **options)
-        out, errs = result.communicate()
-        if result.returncode != 0:
-            raise SVNException(errs)
-        else:
-            return out, errs
+        return self.execute('info', *arguments, flags=flags, cwd=cwd,
+                            **options)
+
+    def list(self, target=None, revision=None, verbose=False,
+             recursive=False, depth=None, xml=False, cwd=None, *args,
+             **kwargs):
+        """List directory entries in the repository."""
+        options = {}
+        flags = []
+        arguments = []
+
+        if target is not None:
+            if isinstance(target, str):
+                arguments.append(target)
+            else:
+                arguments += target
+        if revision is not None:
+            options['r'] = revision
+        if verbose:
+            flags.append('verbose')
+        if recursive:
+            flags.append('R')
+        if depth is not None:
+            options['depth'] = depth
+        if xml:
+            flags.append('xml')
+        if cwd is None:
+            cwd = self.cwd
+        if self.username is not None:
+            options['username'] = self.username
+        if self.password is not None:
+            options['password'] = self.password
+        for arg in args:
+            flags.append(arg)
+        for kwarg in kwargs:
+            options[kwarg] = kwargs[kwarg]
+        return self.execute('list', *arguments, flags=flags, cwd=cwd,
+                            **options)
 
     def checkout(
             self,
@@ -288,13 +321,8 @@ class SVNClient(CommandLineClient):
             flags.append(arg)
         for kwarg in kwargs:
             options[kwarg] = kwargs[kwarg]
-        result = self.run_subcommand('checkout', *arguments, flags=flags,
-                                     cwd=cwd, **options)
-        out, errs = result.communicate()
-        if result.returncode != 0:
-            raise SVNException(errs)
-        else:
-            return out, errs
+        return self.execute('checkout', *arguments, flags=flags, cwd=cwd,
+                            **options)
 
     def proplist(
             self,
@@ -348,13 +376,9 @@ class SVNClient(CommandLineClient):
             flags.append(arg)
         for kwarg in kwargs:
             options[kwarg] = kwargs[kwarg]
-        print("")
-        print(options)
-        result = self.run_subcommand('proplist', *arguments, flags=flags,
-                                     cwd=cwd, **options)
-        out, errs = result.communicate()
-        if result.returncode != 0:
-            raise SVNException(errs)
-        else:
-            print(out, errs)
-            return out, errs
+        return self.execute('proplist', *arguments, flags=flags, cwd=cwd,
+                            **options)
+
+
+class AsyncSVNClient(AsyncCommandLineClient, SVNClient):
+    """ SVNClient whose commands are coroutines, see AsyncCommandLineClient"""
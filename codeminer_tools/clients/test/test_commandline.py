@@ -0,0 +1,84 @@
+import asyncio
+import sys
+import time
+import unittest
+
+from codeminer_tools.clients import commandline
+
+
+class TestCommandLineStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.sut = commandline.CommandLineClient(sys.executable)
+
+    def test_execute_collects_output(self):
+        out, errs = self.sut.execute('-c', 'print("hello")')
+        self.assertEqual(out.strip(), b'hello')
+
+    def test_execute_raises_on_failure(self):
+        with self.assertRaises(commandline.CommandLineException) as context:
+            self.sut.execute(
+                '-c', 'import sys; sys.stderr.write("boom"); sys.exit(3)')
+        self.assertEqual(context.exception.args[0], b'boom')
+
+    def test_execute_unchecked(self):
+        out, errs = self.sut.execute(
+            '-c', 'print("partial"); import sys; sys.exit(1)', check=False)
+        self.assertEqual(out.strip(), b'partial')
+
+    def test_stream_lines(self):
+        stream = self.sut.execute(
+            '-c', 'for x in range(3): print(x)', stream=True)
+        self.assertEqual(list(stream), [b'0\n', b'1\n', b'2\n'])
+
+    def test_stream_chunks(self):
+        # Enough error output to fill the pipe if it wasn't drained
+        script = ('import sys\n'
+                  'sys.stderr.write("e" * 1000000)\n'
+                  'sys.stdout.write("x" * 1000000)\n')
+        stream = self.sut.execute('-c', script, stream=True)
+        chunks = list(commandline.iter_chunks(stream, size=4096))
+        self.assertTrue(all(len(chunk) <= 4096 for chunk in chunks))
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 1000000)
+
+    def test_stream_raises_on_failure(self):
+        stream = self.sut.execute(
+            '-c', 'import sys; print("partial"); sys.exit(1)', stream=True)
+        with self.assertRaises(commandline.CommandLineException):
+            stream.read()
+
+    def test_stream_close_early(self):
+        stream = self.sut.execute(
+            '-c', 'while True: print("y" * 80)', stream=True)
+        self.assertEqual(len(stream.read(100)), 100)
+        stream.close()
+        self.assertIsNotNone(stream.raw.process.returncode)
+
+
+class TestAsyncCommandLine(unittest.TestCase):
+
+    def test_execute(self):
+        sut = commandline.AsyncCommandLineClient(sys.executable)
+        out, errs = asyncio.run(sut.execute('-c', 'print("hello")'))
+        self.assertEqual(out.strip(), b'hello')
+
+    def test_execute_raises_on_failure(self):
+        sut = commandline.AsyncCommandLineClient(sys.executable)
+        with self.assertRaises(commandline.CommandLineException):
+            asyncio.run(sut.execute('-c', 'import sys; sys.exit(1)'))
+
+    def test_concurrency_limit(self):
+        sut = commandline.AsyncCommandLineClient(sys.executable, concurrency=2)
+
+        async def run():
+            return await asyncio.gather(
+                *[sut.execute('-c', 'import time; time.sleep(0.3)')
+                  for _ in range(4)])
+
+        start = time.time()
+        asyncio.run(run())
+        self.assertGreaterEqual(time.time() - start, 0.6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -44,6 +44,18 @@ class TestCVSCommandLines(unittest.TestCase):
         args, kwargs = commandline_mock.call_args
         self.assertEqual((['cvs', 'checkout', '-p', 'a.txt'],), args)
 
+    @mock.patch('codeminer_tools.clients.commandline.subprocess.Popen')
+    def test_checkout_files_combined_output(self, commandline_mock):
+        commandline_mock.return_value = mock.Mock(returncode=0, autospec=True)
+        commandline_mock.return_value.communicate = mock.Mock(return_value = (None, None))
+
+        self.sut = cvs.CVSClient(cwd='test_dir', cvs_root='test_root')
+        self.sut.checkout(path=['a.txt', 'b.txt'], stdout=True, revision='1.1',
+                          combine_output=True)
+        args, kwargs = commandline_mock.call_args
+        self.assertEqual((['cvs', 'checkout', '-p', '-r', '1.1', 'a.txt', 'b.txt'],), args)
+        self.assertEqual(kwargs['stderr'], subprocess.STDOUT)
+
     @mock.patch('codeminer_tools.clients.commandline.subprocess.Popen')
     def test_commit(self, commandline_mock):
         commandline_mock.return_value = mock.Mock(returncode=0, autospec=True)
@@ -0,0 +1,65 @@
+import json
+import sys
+import unittest
+
+from codeminer_tools.clients import commandline, instrumentation
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.instrumentation = instrumentation.Instrumentation()
+        self.sut = commandline.CommandLineClient(
+            sys.executable, instrumentation=self.instrumentation)
+        self.name = '{0} -c'.format(sys.executable)
+
+    def test_records_execute(self):
+        events = []
+        self.instrumentation.subscribe(events.append)
+        self.sut.execute('-c', 'print("x" * 9)')
+        self.assertEqual(len(events), 1)
+        event = events[0]
+        self.assertEqual(event.stdout_bytes, 10)
+        self.assertEqual(event.returncode, 0)
+        self.assertGreater(event.wall_time, 0)
+        self.assertLessEqual(event.spawn_latency, event.wall_time)
+
+    def test_records_failures(self):
+        with self.assertRaises(commandline.CommandLineException):
+            self.sut.execute('-c', 'import sys; sys.exit(2)')
+        counters = self.instrumentation.snapshot()[self.name]['counters']
+        self.assertEqual(counters['count'], 1)
+        self.assertEqual(counters['failures'], 1)
+
+    def test_records_stream_once_consumed(self):
+        stream = self.sut.execute('-c', 'print("x" * 99)', stream=True)
+        self.assertEqual(self.instrumentation.snapshot(), {})
+        stream.read()
+        counters = self.instrumentation.snapshot()[self.name]['counters']
+        self.assertEqual(counters['stdout_bytes'], 100)
+
+    def test_snapshot_json(self):
+        for _ in range(3):
+            self.sut.execute('-c', 'pass')
+        snapshot = json.loads(self.instrumentation.to_json())
+        histogram = snapshot[self.name]['histograms']['wall_time']
+        self.assertEqual(histogram['count'], 3)
+        self.assertEqual(sum(histogram['buckets'].values()), 3)
+
+    def test_passwords_are_masked(self):
+        events = []
+        self.instrumentation.subscribe(events.append)
+        self.sut.execute('-c', 'pass', '--password', 'secret')
+        self.assertNotIn('secret', events[0].arguments)
+
+    def test_histogram(self):
+        histogram = instrumentation.Histogram([1, 10])
+        for value in (0.5, 1, 5, 50):
+            histogram.add(value)
+        self.assertEqual(histogram.buckets, [2, 1, 1])
+        self.assertEqual(histogram.minimum, 0.5)
+        self.assertEqual(histogram.maximum, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import hashlib
+import re
+import sqlite3
+
+from codeminer_tools.repositories.change import ChangeType, to_epoch
+
+# Rows written per transaction while ingesting
+BATCH_SIZE = 10000
+
+# Expanded RCS/SVN keywords, normalized back to their bare form
+KEYWORD = re.compile(
+    br'\$(Author|Date|Header|Id|Locker|Log|Name|RCSfile|Revision|Source|'
+    br'State|LastChangedDate|LastChangedRevision|LastChangedBy|HeadURL|'
+    br'Rev|URL):[^$\n]*\$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repositories (
+    id INTEGER PRIMARY KEY,
+    origin TEXT NOT NULL UNIQUE,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS paths (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS occurrences (
+    hash BLOB NOT NULL,
+    timestamp REAL,
+    repository INTEGER NOT NULL,
+    path INTEGER NOT NULL,
+    revision TEXT,
+    UNIQUE (hash, repository, path, revision)
+);
+"""
+
+# Covers first-origin lookups, so they never touch the table itself
+INDEX = """
+CREATE INDEX IF NOT EXISTS occurrences_hash
+ON occurrences (hash, timestamp, repository, path, revision);
+"""
+
+
+def normalize(data):
+    """ Contents with the differences that don't survive a conversion
+    between version control systems removed: line endings, trailing
+    whitespace and expanded keywords"""
+    data = KEYWORD.sub(br'$\1$', data.replace(b'\r\n', b'\n'))
+    return b'\n'.join(line.rstrip() for line in data.split(b'\n'))
+
+
+def content_hash(data):
+    return hashlib.sha1(normalize(data)).digest()
+
+
+class Occurrence:
+
+    __slots__ = ('origin', 'path', 'revision', 'timestamp')
+
+    def __init__(self, origin, path, revision, timestamp):
+        self.origin = origin
+        self.path = path
+        self.revision = revision
+        self.timestamp = timestamp
+
+    def __eq__(self, other):
+        return ((self.origin, self.path, self.revision, self.timestamp) ==
+                (other.origin, other.path, other.revision, other.timestamp))
+
+    def __repr__(self):
+        return "<Occurrence {origin}: {path}@{revision}>".format(
+            origin=self.origin, path=self.path, revision=self.revision)
+
+
+class LineageIndex:
+    """ Where and when every version of every file was seen, across
+    repositories
+
+    Versions are keyed by the hash of their normalized contents, so the
+    same file imported from CVS into SVN and then into Git is recognised
+    in all three. `ingest` streams a repository's history in with bulk
+    inserts, `first_origin` answers from a covering index.
+
+        index = LineageIndex('lineage.db')
+        for repository in (cvs_repository, git_repository):
+            index.ingest(repository)
+        index.first_origin(open('main.c', 'rb').read())
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA + INDEX)
+        self._repositories = {}
+        self._paths = {}
+
+    def close(self):
+        self.connection.close()
+
+    def ingest(self, repository, history=None, batch_size=BATCH_SIZE):
+        """ Record every file version added or changed in a repository's
+        history (by default all of `walk_history`). Returns the number of
+        versions recorded, those already in the index aren't again"""
+        if history is None:
+            history = repository.walk_history()
+
+        def versions():
+            for changeset in history:
+                timestamp = to_epoch(changeset.timestamp)
+                for change in changeset.changes:
+                    if change.action == ChangeType.remove:
+                        continue
+                    current = change.current_file
+                    yield (content_hash(current.read()), repository.origin,
+                           repository.name, current.path, current.revision,
+                           timestamp)
+
+        return self.add_all(versions(), batch_size)
+
+    def add_all(self, versions, batch_size=BATCH_SIZE):
+        """ Record (hash, origin, name, path, revision, timestamp) tuples,
+        hash being the `content_hash` of the version. Returns how many
+        weren't recorded already"""
+        count = 0
+        batch = []
+        for version in versions:
+            batch.append(version)
+            if len(batch) >= batch_size:
+                count += self._insert(batch)
+                batch = []
+        if batch:
+            count += self._insert(batch)
+        return count
+
+    def occurrences(self, data=None, hash_=None):
+        """ Every Occurrence of some contents (or of their content_hash),
+        oldest first"""
+        if hash_ is None:
+            hash_ = content_hash(data)
+        return [Occurrence(*row) for row in self.connection.execute(
+            'SELECT repositories.origin, paths.path, revision, timestamp '
+            'FROM occurrences '
+            'JOIN repositories ON repositories.id = occurrences.repository '
+            'JOIN paths ON paths.id = occurrences.path '
+            'WHERE hash = ? ORDER BY timestamp', (hash_,))]
+
+    def first_origin(self, data=None, hash_=None):
+        """ Oldest Occurrence of some contents (or of their content_hash),
+        or None if they were never seen"""
+        if hash_ is None:
+            hash_ = content_hash(data)
+        # Versions without a timestamp only count if there's nothing else
+        for condition in ('timestamp IS NOT NULL', 'timestamp IS NULL'):
+            row = self.connection.execute(
+                'SELECT repositories.origin, paths.path, revision, timestamp '
+                'FROM (SELECT * FROM occurrences WHERE hash = ? AND ' +
+                condition + ' ORDER BY timestamp LIMIT 1) AS first '
+                'JOIN repositories ON repositories.id = first.repository '
+                'JOIN paths ON paths.id = first.path', (hash_,)).fetchone()
+            if row is not None:
+                return Occurrence(*row)
+        return None
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM occurrences').fetchone()[0]
+
+    def _insert(self, batch):
+        self.connection.execute('BEGIN')
+        try:
+            # Ingesting a repository again, or a retried job, adds nothing
+            inserted = self.connection.executemany(
+                'INSERT OR IGNORE INTO occurrences '
+                '(hash, timestamp, repository, path, revision) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(hash_, timestamp, self._repository_id(origin, name),
+                  self._path_id(path),
+                  None if revision is None else str(revision))
+                 for hash_, origin, name, path, revision, timestamp
+                 in batch]).rowcount
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            # Ids handed out in the transaction are gone with it
+            self._repositories.clear()
+            self._paths.clear()
+            raise
+        return inserted
+
+    def _repository_id(self, origin, name):
+        if origin not in self._repositories:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO repositories (origin, name) '
+                'VALUES (?, ?)', (origin, name))
+            self._repositories[origin] = self.connection.execute(
+                'SELECT id FROM repositories WHERE origin = ?',
+                (origin,)).fetchone()[0]
+        return self._repositories[origin]
+
+    def _path_id(self, path):
+        if path not in self._paths:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO paths (path) VALUES (?)', (path,))
+            self._paths[path] = self.connection.execute(
+                'SELECT id FROM paths WHERE path = ?', (path,)).fetchone()[0]
+        return self._paths[path]
@@ -0,0 +1,298 @@
+import concurrent.futures
+import functools
+import multiprocessing
+import queue
+import threading
+import time
+
+from codeminer_tools.lineage import content_hash
+from codeminer_tools.repositories.change import ChangeType, to_epoch
+from codeminer_tools.repositories.locks import (changeset_repositories,
+                                                client_lock, client_locks,
+                                                iter_locked)
+
+INLINE = 'inline'
+THREADS = 'threads'
+PROCESSES = 'processes'
+
+# Items allowed between a stage and the next before the producer blocks
+QUEUE_SIZE = 64
+
+# Seconds a blocked producer waits before checking it should stop
+POLL_INTERVAL = 0.1
+
+_END = object()
+
+
+class _Error:
+    """ Exception raised upstream, passed on to be raised downstream"""
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def _timed(function, item):
+    """ function(item) and the seconds it took, measured where it ran"""
+    start = time.perf_counter()
+    result = function(item)
+    return result, time.perf_counter() - start
+
+
+class StageStats:
+    """ Counters of a stage for the last run of its pipeline"""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        # Time spent in the stage's function, summed over its workers
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def received(self):
+        with self._lock:
+            if self.started is None:
+                self.started = time.perf_counter()
+            self.items_in += 1
+
+    def produced(self, count, busy):
+        with self._lock:
+            self.items_out += count
+            self.busy += busy
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        end = self.finished if self.finished is not None else \
+            time.perf_counter()
+        return end - self.started
+
+    @property
+    def throughput(self):
+        """ Items taken in per second"""
+        return self.items_in / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def utilization(self):
+        """ Share of the workers' time spent working rather than waiting,
+        close to 1 for the stage holding the pipeline back"""
+        if not self.elapsed:
+            return 0.0
+        return self.busy / (self.elapsed * self.workers)
+
+    def __str__(self):
+        return "{name}: {items_in} in, {items_out} out, {throughput:.1f}/s, " \
+            "{utilization:.0%} busy".format(
+                name=self.name, items_in=self.items_in,
+                items_out=self.items_out, throughput=self.throughput,
+                utilization=self.utilization)
+
+
+class Stage:
+    """ One step of a Pipeline, applying function to every item
+
+    Parameters
+    ----------
+    function : callable
+        Takes an item, returns the item passed on. With expand, returns
+        an iterable of items to pass on instead (possibly empty)
+    mode : str
+        INLINE runs function in the thread pulling from the stage,
+        THREADS in a pool of threads (for I/O) and PROCESSES in a pool of
+        processes (for CPU bound work, function and items have to be
+        picklable, see records.detach)
+    workers : int
+        Size of the pool
+    queue_size : int
+        Items in flight between this stage and the next
+    """
+
+    def __init__(self, function, mode=INLINE, workers=1, expand=False,
+                 name=None, queue_size=QUEUE_SIZE):
+        if mode not in (INLINE, THREADS, PROCESSES):
+            raise ValueError("Unknown stage mode {0}".format(mode))
+        self.function = function
+        self.mode = mode
+        self.workers = workers if mode != INLINE else 1
+        self.expand = expand
+        self.name = name or getattr(function, '__name__', repr(function))
+        self.queue_size = queue_size
+        self.stats = StageStats(self.name, self.workers)
+
+    def run(self, items):
+        """ Generator of what the stage makes of items, in their order"""
+        self.stats = StageStats(self.name, self.workers)
+        if self.mode == INLINE:
+            results = self._run_inline(items)
+        else:
+            results = self._run_pool(items)
+        try:
+            for result, busy in results:
+                if self.expand:
+                    result = list(result)
+                    self.stats.produced(len(result), busy)
+                    yield from result
+                else:
+                    self.stats.produced(1, busy)
+                    yield result
+        finally:
+            results.close()
+            self.stats.finished = time.perf_counter()
+
+    def _run_inline(self, items):
+        for item in items:
+            self.stats.received()
+            yield _timed(self.function, item)
+
+    def _run_pool(self, items):
+        if self.mode == THREADS:
+            executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        function = functools.partial(_timed, self.function)
+        # Futures in submission order. A feeder thread keeps submitting
+        # while the consumer waits on the oldest, so upstream stages keep
+        # running. The bound holds the feeder back when downstream is slow
+        pending = queue.Queue(self.queue_size)
+        stop = threading.Event()
+
+        def put(value):
+            while not stop.is_set():
+                try:
+                    pending.put(value, timeout=POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def feed():
+            try:
+                for item in items:
+                    self.stats.received()
+                    if not put(executor.submit(function, item)):
+                        return
+            except BaseException as exception:
+                put(_Error(exception))
+            else:
+                put(_END)
+            finally:
+                # The upstream generator is only ever run by this thread
+                close = getattr(items, 'close', None)
+                if close is not None:
+                    close()
+
+        feeder = threading.Thread(target=feed, name=self.name, daemon=True)
+        feeder.start()
+        try:
+            while True:
+                future = pending.get()
+                if future is _END:
+                    break
+                if isinstance(future, _Error):
+                    raise future.exception
+                yield future.result()
+        finally:
+            stop.set()
+            feeder.join()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class Pipeline:
+    """ Items from a source going through stages, all of them streaming
+
+    Nothing is materialized: each stage pulls from the one before it as
+    the pipeline is iterated, with at most `queue_size` items in flight
+    between two stages. THREADS and PROCESSES stages work in the
+    background, so a stage waiting on a repository overlaps with CPU bound
+    stages after it.
+
+        pipeline = Pipeline(repository.walk_history(),
+                            optimize(),
+                            fetch_versions(),
+                            hash_versions(workers=4))
+        index.add_all(pipeline)
+        for stats in pipeline.report():
+            print(stats)
+
+    With `prefetch`, the source is read ahead in a thread of its own into
+    a queue of that size.
+
+    Stages run in threads of their own, so anything calling into a
+    repository which isn't `thread_safe` (Git, Hg) holds its client_lock:
+    the source is advanced under the locks of the repositories its
+    changesets refer to, and the optimize and fetch_versions stages take
+    them too. Stages of your own touching repositories should as well.
+    """
+
+    def __init__(self, source, *stages, prefetch=None):
+        self.source = source
+        self.stages = list(stages)
+        self.prefetch = prefetch
+
+    def __iter__(self):
+        items = iter_locked(self.source)
+        if self.prefetch:
+            items = Stage(lambda item: item, THREADS, 1, name='source',
+                          queue_size=self.prefetch).run(items)
+        for stage in self.stages:
+            items = stage.run(items)
+        return items
+
+    def report(self):
+        """ StageStats of every stage, from the last run"""
+        return [stage.stats for stage in self.stages]
+
+
+def _optimize(changeset, **kwargs):
+    # Digests and similarity read the files
+    with client_locks(changeset_repositories(changeset)):
+        changeset.optimize(**kwargs)
+    return changeset
+
+
+def optimize(mode=INLINE, workers=1, **kwargs):
+    """ Stage applying ChangeSet.optimize, with its arguments"""
+    return Stage(functools.partial(_optimize, **kwargs), mode, workers,
+                 name='optimize')
+
+
+def _read_versions(changeset):
+    timestamp = to_epoch(changeset.timestamp)
+    versions = []
+    for change in changeset.changes:
+        if change.action == ChangeType.remove:
+            continue
+        current = change.current_file
+        with client_lock(current.repository):
+            data = current.read()
+        versions.append((current.repository.origin, current.repository.name,
+                         current.path, current.revision, timestamp, data))
+    return versions
+
+
+def fetch_versions(workers=1):
+    """ Stage reading the contents every change of a ChangeSet left behind
+
+    Passes on (origin, name, path, revision, timestamp, data) tuples, plain
+    data process stages can take. Reads of repositories which aren't
+    `thread_safe` take turns, more workers only help the others
+    """
+    return Stage(_read_versions, THREADS, workers, expand=True,
+                 name='fetch_versions')
+
+
+def _hash_version(version):
+    origin, name, path, revision, timestamp, data = version
+    return content_hash(data), origin, name, path, revision, timestamp
+
+
+def hash_versions(mode=PROCESSES, workers=None):
+    """ Stage turning fetched versions into the tuples
+    LineageIndex.add_all takes"""
+    return Stage(_hash_version, mode,
+                 workers or multiprocessing.cpu_count(),
+                 name='hash_versions')
@@ -1,5 +1,7 @@
+import datetime
 from enum import Enum
 
+from codeminer_tools.repositories import diff, similarity
 from codeminer_tools.repositories.file import RepositoryFile
 
 
@@ -12,16 +14,49 @@ class ChangeType(Enum):
     derived = 5   # File copied or moved from existing path and modified before commit
 
 
+def to_epoch(timestamp):
+    """ Seconds since the epoch of a ChangeSet timestamp. Backends give
+    them as epoch numbers (Git), datetimes (Mercurial) or ISO 8601 strings
+    (CVS, SVN)"""
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.timestamp()
+    value = timestamp.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
 class ChangeSet:
 
+    __slots__ = ('changes', 'tags', 'identifier', 'author', 'message',
+                 'timestamp')
+
     def __init__(self, changes, tags, identifier, author, message, timestamp):
         self.changes = changes
+        self.tags = tags
         self.identifier = identifier
         self.author = author
         self.message = message
         self.timestamp = timestamp
 
-    def optimize(self):
+    def optimize(self, threshold=None, sources=None):
+        """ Turn copies whose source was removed into moves, and copies or
+        moves which were modified into derived changes
+
+        Parameters
+        ----------
+        threshold : float, optional
+            Also pair adds with removes of files at least this similar
+            (between 0 and 1), for repositories which don't record copies.
+            Off by default
+        sources : iterable of RepositoryFile, optional
+            Files of the previous snapshot that adds left unpaired may have
+            been copied from. Only used with a threshold
+        """
         removes = []
         copies = []
         adds = []
@@ -37,30 +72,96 @@ class ChangeSet:
         # Look for copies that are really "moves"
         # Note, somewhat confusingly this logic allows the possibility
         # for a file to be "moved" to multiple other files
-        redundant = []
+        removed = {}
+        for remove in removes:
+            removed.setdefault(remove.previous_file.path, remove)
+
+        redundant = set()
         for copy in copies:
-            for remove in removes:
-                if copy.previous_file.path == remove.previous_file.path:
-                    copy.action = ChangeType.move
-                    redundant.append(remove)
-                    break
+            remove = removed.get(copy.previous_file.path)
+            if remove is not None:
+                copy.action = ChangeType.move
+                redundant.add(remove)
 
         # Filter out the redundant changes
         combined_changes = [x for x in self.changes if x not in redundant]
 
+        if threshold is not None:
+            combined_changes = self._detect_similar(
+                combined_changes, threshold, sources)
+
         # Go through and look for 'Derived' which are copy/move + modify
         for change in combined_changes:
             if ((change.action == ChangeType.move) or
-                    (change.action == ChangeType.copy)):
-                if (change.previous_file.read() != change.current_file.read()):
+                    (change.action == ChangeType.copy)) and \
+                    change.similarity is None:
+                if (change.previous_file.digest() !=
+                        change.current_file.digest()):
                     change.action = ChangeType.derived
 
         self.changes = combined_changes
 
+    def measure(self, max_cost=None):
+        """ Line counts and similarity of every modify and derived change,
+        see Change.measure"""
+        for change in self.changes:
+            if change.action in (ChangeType.modify, ChangeType.derived) and \
+                    (change.lines_added is None or change.similarity is None):
+                change.measure(max_cost)
+
+    @staticmethod
+    def _detect_similar(changes, threshold, sources):
+        adds = [change for change in changes
+                if change.action == ChangeType.add]
+        removes = [change for change in changes
+                   if change.action == ChangeType.remove]
+        if not adds:
+            return changes
+
+        # Index of the add => (file it came from, similarity, action)
+        targets = {index: add.current_file.read()
+                   for index, add in enumerate(adds)}
+        matches = {}
+        redundant = set()
+        for index, (origin, score) in similarity.find_matches(
+                targets, {index: remove.previous_file.read()
+                          for index, remove in enumerate(removes)},
+                threshold).items():
+            matches[index] = (removes[origin].previous_file, score,
+                              ChangeType.move)
+            redundant.add(removes[origin])
+
+        if sources is not None:
+            sources = list(sources)
+            unmatched = {index: data for index, data in targets.items()
+                         if index not in matches}
+            for index, (origin, score) in similarity.find_matches(
+                    unmatched, {index: source.read()
+                                for index, source in enumerate(sources)},
+                    threshold).items():
+                matches[index] = (sources[origin], score, ChangeType.copy)
+
+        replacements = {}
+        for index, (origin, score, action) in matches.items():
+            add = adds[index]
+            if origin.digest() != add.current_file.digest():
+                action = ChangeType.derived
+            change = Change(
+                add.current_file.repository, origin.path, origin.revision,
+                add.current_file.path, add.current_file.revision, action)
+            change.similarity = score
+            replacements[add] = change
+
+        return [replacements.get(change, change) for change in changes
+                if change not in redundant]
+
 
 class Change:
     """ Represents a change between to revisions of an object in a repository"""
 
+    __slots__ = ('previous_file', 'current_file', 'action', 'similarity',
+                 'lines_added', 'lines_removed')
+
     def __init__(
             self,
             repository,
@@ -74,12 +175,39 @@ class Change:
         self.current_file = RepositoryFile(
             repository, current_path, current_revision)
         self.action = action
+        # How similar the files are (0-1), when it is known. See
+        # ChangeSet.measure
+        self.similarity = None
+        self.lines_added = None
+        self.lines_removed = None
+
+    def measure(self, max_cost=None):
+        """ Fill in lines_added, lines_removed and similarity by diffing
+        the two revisions. Counts the repository already provided are
+        kept, only the previous revision is read then"""
+        if self.lines_added is None or self.lines_removed is None:
+            added, removed, score = diff.diff_lines(
+                self.previous_file.read(), self.current_file.read(),
+                max_cost)
+            self.lines_added = added
+            self.lines_removed = removed
+        else:
+            old_lines = len(diff.split_lines(self.previous_file.read()))
+            new_lines = old_lines - self.lines_removed + self.lines_added
+            score = diff.similarity(
+                old_lines, new_lines, old_lines - self.lines_removed)
+        if self.similarity is None:
+            self.similarity = score
 
     def __eq__(self, other):
         return ((self.action == other.action) and
                 (self.previous_file == other.previous_file) and
                 (self.current_file == other.current_file))
 
+    def __hash__(self):
+        # The action is left out as optimize() changes it in place
+        return hash((self.previous_file, self.current_file))
+
     def __repr__(self):
         return "{}: {}@{} => ({}) => {}: {}@{}".format(
             self.previous_file.repository.name, self.previous_file.path,
@@ -1,25 +1,36 @@
+import asyncio
+import calendar
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
-from io import BytesIO
+import io
 import os
 import re
 import shutil
 import subprocess
-
-import xml.etree.ElementTree as ET
+import tempfile
+import time
 
 from codeminer_tools.clients.commandline import CommandLineClient
-from codeminer_tools.clients.cvs import CVSClient
+from codeminer_tools.clients.cvs import (AsyncCVSClient, CVSClient,
+                                         CVSException)
 from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
 from codeminer_tools.repositories.repository import Repository
 
 
-def open_repository(path, cvs_root=None, workspace=None, **kwargs):
+def open_repository(path, cvs_root=None, workspace=None, checkout=False,
+                    **kwargs):
+    """ Open a CVS working copy, or a module of the repository at CVSROOT.
+
+    Modules are read directly from CVSROOT with `rlog` and `checkout -p` so
+    nothing is written to disk, unless `checkout` asks for a temporary
+    working copy instead."""
     if os.path.exists(path):
         return CVSRepository(path, cvs_root=cvs_root)
+    elif not checkout:
+        return CVSRepository(module=path, cvs_root=cvs_root)
     else:
-        basename = os.path.basename(path)
         checkout_path = tempfile.mkdtemp(dir=workspace)
-        client = CVSClient()
+        client = CVSClient(cvs_root=cvs_root)
         client.checkout(path=path, cwd=checkout_path)
         working_copy_path = os.path.join(checkout_path, os.path.basename(path))
         return CVSRepository(
@@ -28,129 +39,776 @@ def open_repository(path, cvs_root=None, workspace=None, **kwargs):
             cleanup=True)
 
 
+# Width of the separators `cvs log` places between revisions and files
+REVISION_SEPARATOR = '-' * 28
+FILE_SEPARATOR = '=' * 77
+
+# Default maximum gap (in seconds) between two file revisions of the same
+# commit. Same value cvsps uses for its "fuzz" factor.
+COMMIT_WINDOW = 300
+
+# Default number of `cvs rlog` processes run at once when collecting history.
+# CVS servers don't cope well with many concurrent connections.
+COLLECT_WORKERS = 4
+
+# Default number of files requested by a single `cvs checkout -p`
+FETCH_BATCH_SIZE = 100
+
+# A specific revision, branch numbers have an odd number of components
+REVISION_NUMBER = re.compile(r'^\d+\.\d+(\.\d+\.\d+)*$')
+
+# Header `cvs checkout -p` writes to stderr before the contents of each file
+CHECKOUT_HEADER = re.compile(
+    br'={67}\nChecking out ([^\n]*)\nRCS: *([^\n]*)\nVERS: *([^\n]*)\n'
+    br'\*{15}\n')
+
+# Diagnostics CVS writes to stderr, such as "cvs checkout: cannot find
+# module `x' - ignored" or "cvs [server aborted]: ..."
+CHECKOUT_MESSAGES = re.compile(
+    br'(?:cvs (?:checkout|server|\[(?:checkout|server) aborted\]): '
+    br'[^\n]*(?:\n|\Z))+\Z')
+
+
+class CVSRevision:
+    """ A single revision of a single file as reported by `cvs log`"""
+    __slots__ = ('path', 'revision', 'previous_revision', 'timestamp',
+                 'author', 'state', 'lines_added', 'lines_removed',
+                 'commitid', 'message', 'action')
+
+    def __init__(self, path, revision, timestamp, author, state,
+                 message, lines_added=None, lines_removed=None,
+                 commitid=None):
+        self.path = path
+        self.revision = revision
+        self.previous_revision = previous_version(revision)
+        self.timestamp = timestamp
+        self.author = author
+        self.state = state
+        self.message = message
+        self.lines_added = lines_added
+        self.lines_removed = lines_removed
+        self.commitid = commitid
+        self.action = None
+
+    def __repr__(self):
+        return "<CVSRevision {path}@{revision}>".format(
+            path=self.path, revision=self.revision)
+
+
+class CVSFileHeader:
+    """ The per-file header of `cvs log`: head, default branch and tags"""
+    __slots__ = ('path', 'head', 'branch', 'symbols')
+
+    def __init__(self, path, head, branch=None, symbols=None):
+        self.path = path
+        self.head = head
+        self.branch = branch
+        self.symbols = symbols if symbols is not None else {}
+
+    @property
+    def branches(self):
+        """ Branch tags mapped to their branch number. CVS stores them with
+        a magic zero, so 1.2.0.4 is really branch 1.2.4"""
+        branches = {}
+        for name, revision in self.symbols.items():
+            components = revision.split('.')
+            if len(components) > 2 and components[-2] == '0':
+                branches[name] = '.'.join(components[:-2] + components[-1:])
+        return branches
+
+    @property
+    def tags(self):
+        """ Non-branch tags mapped to the revision they mark"""
+        branches = self.branches
+        return {name: revision for name, revision in self.symbols.items()
+                if name not in branches}
+
+    def resolve(self, tag):
+        """ Revision (or branch number) a tag refers to in this file"""
+        if tag == 'HEAD':
+            return self.head
+        branches = self.branches
+        if tag in branches:
+            return branches[tag]
+        return self.symbols.get(tag)
+
+    def __repr__(self):
+        return "<CVSFileHeader {path}@{head}>".format(
+            path=self.path, head=self.head)
+
+
+def previous_version(version):
+    # See: http://www.astro.princeton.edu/~rhl/cvs-branches.html
+    components = [int(x) for x in version.split('.')]
+
+    if len(components) == 2:
+        # It's on the mainline branch
+        major, minor = components
+        if (minor == 0) or (minor == 1):
+            return None
+        else:
+            return "{major}.{minor}".format(major=major, minor=(minor - 1))
+    elif components[-1] == 1:
+        # It's the beginning of a branch (ex: 1.2.2.1 branches from 1.2)
+        return ".".join(str(x) for x in components[:-2])
+    else:
+        components[-1] -= 1
+        return ".".join(str(x) for x in components)
+
+
+def parse_timestamp(value):
+    """ Convert a `cvs log` date into seconds since the epoch. CVS 1.11
+    prints '2016/10/12 01:02:03' (always UTC) while CVS 1.12 prints
+    '2016-10-12 01:02:03 +0000'"""
+    value = value.strip().replace('/', '-')
+    offset = 0
+    if ' +' in value or ' -' in value:
+        value, zone = value.rsplit(' ', 1)
+        sign = -1 if zone[0] == '-' else 1
+        offset = sign * (int(zone[1:3]) * 3600 + int(zone[3:5]) * 60)
+    parsed = time.strptime(value, '%Y-%m-%d %H:%M:%S')
+    return calendar.timegm(parsed) - offset
+
+
+def format_timestamp(timestamp):
+    """ Same ISO 8601 format cvs2cl uses for its <isoDate> element"""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def parse_log(lines):
+    """ Parse the output of `cvs log` (or `cvs rlog`) into CVSRevisions
+
+    Parameters
+    ----------
+    lines : iterable of str
+        The log output, one line per item without line endings
+
+    Yields
+    ------
+    CVSRevision
+        Every revision selected by the log command, grouped by file
+    """
+    lines = iter(lines)
+    path = None
+    revisions = []
+
+    line = next(lines, None)
+    while line is not None:
+        if line.startswith('RCS file: '):
+            path = _rcs_path(line[len('RCS file: '):])
+            revisions = []
+        elif line.startswith('Working file: '):
+            path = line[len('Working file: '):]
+        elif line == REVISION_SEPARATOR:
+            line = next(lines, None)
+            if line is not None and line.startswith('revision '):
+                revision, line = _parse_revision(path, line, lines)
+                revisions.append(revision)
+            # Whatever follows still needs to be looked at
+            continue
+        elif line == FILE_SEPARATOR:
+            yield from _classify_revisions(revisions)
+            revisions = []
+        line = next(lines, None)
+
+    yield from _classify_revisions(revisions)
+
+
+def parse_headers(lines):
+    """ Parse the file headers printed by `cvs log -h` (or `cvs rlog -h`)
+
+    Parameters
+    ----------
+    lines : iterable of str
+        The log output, one line per item without line endings
+
+    Yields
+    ------
+    CVSFileHeader
+        One header per file
+    """
+    header = None
+    in_symbols = False
+    for line in lines:
+        if in_symbols and line.startswith('\t'):
+            name, revision = line.strip().split(':', 1)
+            header.symbols[name] = revision.strip()
+            continue
+        in_symbols = False
+
+        if line.startswith('RCS file: '):
+            header = CVSFileHeader(_rcs_path(line[len('RCS file: '):]), None)
+        elif line.startswith('Working file: '):
+            header.path = line[len('Working file: '):]
+        elif line.startswith('head:'):
+            header.head = line[len('head:'):].strip() or None
+        elif line.startswith('branch:'):
+            header.branch = line[len('branch:'):].strip() or None
+        elif line.startswith('symbolic names:'):
+            in_symbols = True
+        elif line == FILE_SEPARATOR and header is not None:
+            yield header
+            header = None
+
+
+def _rcs_path(rcs_file):
+    # `cvs rlog` doesn't print a "Working file", so fall back on the RCS
+    # file itself. Removed files live in the Attic.
+    if rcs_file.endswith(',v'):
+        rcs_file = rcs_file[:-2]
+    directory, name = os.path.split(rcs_file)
+    if os.path.basename(directory) == 'Attic':
+        directory = os.path.dirname(directory)
+    return os.path.join(directory, name)
+
+
+def _parse_revision(path, header, lines):
+    revision = header.split()[1]
+    fields = {}
+    for field in next(lines).split(';'):
+        if ':' in field:
+            key, value = field.split(':', 1)
+            fields[key.strip()] = value.strip()
+
+    lines_added = lines_removed = None
+    if 'lines' in fields:
+        added, removed = fields['lines'].split()
+        lines_added = int(added)
+        lines_removed = abs(int(removed))
+
+    # The message runs until the next separator. Like CVS itself, there is
+    # no way to tell a separator apart from a message containing one.
+    message = []
+    line = next(lines, None)
+    if line is not None and line.startswith('branches:'):
+        line = next(lines, None)
+    while line not in (None, REVISION_SEPARATOR, FILE_SEPARATOR):
+        message.append(line)
+        line = next(lines, None)
+
+    revision = CVSRevision(
+        path, revision, parse_timestamp(fields['date']), fields['author'],
+        fields['state'], '\n'.join(message), lines_added=lines_added,
+        lines_removed=lines_removed, commitid=fields.get('commitid'))
+    return revision, line
+
+
+def _classify_revisions(revisions):
+    states = {revision.revision: revision.state for revision in revisions}
+    for revision in revisions:
+        previous_state = states.get(revision.previous_revision)
+        if revision.state == 'dead':
+            if revision.previous_revision is None:
+                # File was initially added on a branch. The trunk gets a
+                # placeholder dead revision which isn't a real change.
+                continue
+            revision.action = ChangeType.remove
+        elif revision.previous_revision is None or previous_state == 'dead':
+            revision.action = ChangeType.add
+        else:
+            revision.action = ChangeType.modify
+        yield revision
+
+
+def group_revisions(revisions, window=COMMIT_WINDOW):
+    """ Reconstruct commits from individual file revisions
+
+    CVS has no notion of a commit, so file revisions sharing an author and
+    log message that were checked in within `window` seconds of each other
+    are considered a single changeset. Revisions carrying a commitid (CVS
+    1.12+) are grouped by it instead. Revisions are sorted once and swept
+    linearly, so this is O(n log n) in the number of file revisions.
+
+    Parameters
+    ----------
+    revisions : iterable of CVSRevision
+        File revisions in any order
+    window : int, optional
+        Maximum gap in seconds between consecutive revisions of a commit
+
+    Returns
+    -------
+    list of list of CVSRevision
+        The reconstructed commits, oldest first
+    """
+    ordered = sorted(revisions, key=lambda revision: (
+        revision.commitid or '', revision.author, revision.message,
+        revision.timestamp))
+
+    groups = []
+    group = None
+    paths = None
+    for revision in ordered:
+        if (group is None or
+                revision.commitid != group[-1].commitid or
+                revision.author != group[-1].author or
+                revision.message != group[-1].message or
+                revision.path in paths or
+                (revision.commitid is None and
+                 revision.timestamp - group[-1].timestamp > window)):
+            group = []
+            paths = set()
+            groups.append(group)
+        group.append(revision)
+        paths.add(revision.path)
+
+    groups.sort(key=lambda group: (group[0].timestamp, group[0].path))
+    return groups
+
+
+def split_checkout_output(output):
+    """ Split the combined output of `cvs checkout -p` on several files
+
+    The headers on stderr are all that tells where a file's contents end,
+    so both streams have to share a pipe. Error messages, of a file that
+    couldn't be found say, come in between and are split back out: those
+    ending the output or the contents before a header, which a file
+    ending in such a line can't be told apart from.
+
+    Parameters
+    ----------
+    output : bytes
+        Standard output and error of the checkout sent to a single pipe
+
+    Returns
+    -------
+    tuple of (dict, list of str)
+        Module path to (revision, contents) for every file checked out,
+        and the error messages
+    """
+    files = {}
+    messages = []
+
+    def split_messages(data):
+        found = CHECKOUT_MESSAGES.search(data)
+        if found is None:
+            return data
+        messages.extend(found.group().decode('utf-8', 'replace').splitlines())
+        return data[:found.start()]
+
+    headers = list(CHECKOUT_HEADER.finditer(output))
+    split_messages(output[:headers[0].start()] if headers else output)
+    for index, header in enumerate(headers):
+        end = (headers[index + 1].start() if index + 1 < len(headers)
+               else len(output))
+        path = header.group(1).decode('utf-8', 'replace')
+        revision = header.group(3).decode()
+        files[path] = (revision, split_messages(output[header.end():end]))
+    return files, messages
+
+
+def repository_directory(cvs_root):
+    """ Extract the directory part of a CVSROOT such as
+    ':pserver:user@host:2401/cvsroot' or ':local:/cvsroot'"""
+    directory = cvs_root.rsplit(':', 1)[-1]
+    return re.sub(r'^\d+', '', directory).rstrip('/')
+
+
+def is_local_root(cvs_root):
+    return ((not cvs_root.startswith(':')) or
+            cvs_root.startswith(':local:') or
+            cvs_root.startswith(':fork:'))
+
+
+def is_revision_number(revision):
+    """ Whether revision is a plain revision number (1.2, 1.2.2.1) rather
+    than a tag, branch or date, whose meaning can change"""
+    return revision is not None and \
+        REVISION_NUMBER.match(str(revision)) is not None
+
+
+def make_identifier(author, timestamp, message):
+    # There's no global revision ID in CVS, so make a commit ID
+    return hashlib.md5(
+        author.encode() +
+        timestamp.encode() +
+        message.encode()).hexdigest()
+
+
 class CVSRepository(Repository):
 
-    def __init__(self, path, cvs_root=None, cleanup=False):
+    thread_safe = True
+
+    def __init__(self, path=None, cvs_root=None, cleanup=False, module=None):
+        self.cleanup = cleanup
+        if cvs_root is None and path is not None:
+            cvs_root = self._read_admin_file(path, 'Root')
+        if cvs_root is None:
+            cvs_root = os.environ.get('CVSROOT')
+        if path is None and (module is None or cvs_root is None):
+            raise ValueError(
+                "A module and CVSROOT are needed without a working copy")
         self.client = CVSClient(cvs_root=cvs_root, cwd=path)
+        self.async_client = AsyncCVSClient(
+            cvs_root=cvs_root, cwd=path, concurrency=COLLECT_WORKERS)
+        self.cvs_root = cvs_root
+        self.module = module
         self.path = path
-        self.cleanup = cleanup
+        self.name = 'CVS'
+        self._headers = None
+        # Window to identifier to changeset, see get_changeset
+        self._changesets = {}
 
     def __del__(self):
         if self.cleanup:
             shutil.rmtree(self.path)
 
-    def get_changeset(self, rev='HEAD'):
-        out, errs = self.client.log(revisions=rev, xml=True)
-        print(out, errs)
-
-        tags = None
-        author, timestamp, message, changes = self._read_log_xml(out, limit=1)
-        # There's no global revision ID in CVS, so make a commit ID
-        revision_id = hashlib.md5(
-            author.encode() +
-            timestamp.encode() +
-            message.encode()).hexdigest()
-        return ChangeSet(
-            changes,
-            tags,
-            revision_id,
-            author,
-            message,
-            timestamp)
+    @property
+    def origin(self):
+        if self.cvs_root is None:
+            return os.path.abspath(self.path)
+        return '/'.join([self.cvs_root, self.get_module_name()])
 
-    def get_previous_version(self, version):
-        # See: http://www.astro.princeton.edu/~rhl/cvs-branches.html
-        components = [int(x) for x in version.split('.')]
-
-        if len(components) == 2:
-            # It's on the mainline branch
-            major, minor = components
-            if (minor == 0) or (minor == 1):
-                return None
-            else:
-                return "{major}.{minor}".format(major=major, minor=(minor - 1))
-        elif (components[-2] == 0 and components[-1] == 2):
-            # It's the beginning of a branch
-            return ".".join(components[:-2])
-        else:
-            components[-1] -= 1
-            return ".".join(components)
+    def get_history_state(self, window=COMMIT_WINDOW):
+        """ The newest revision date on the server minus `window`, before
+        which every revision is taken to be visible, with the head
+        revisions dated since. None for a module without revisions"""
+        # A bare -r selects the latest revision of every file
+        heads = self.collect_revisions(revisions='')
+        if not heads:
+            return None
+        since = max(head.timestamp for head in heads) - window
+        return {'since': since,
+                'seen': sorted([head.path, head.revision] for head in heads
+                               if head.timestamp >= since)}
+
+    def walk_history(self, window=COMMIT_WINDOW, workers=COLLECT_WORKERS,
+                     since=None):
+        """ Changesets in commit order. Given a state from
+        get_history_state, only those committed around or after it: the
+        commits still open then are grouped again from an extra window of
+        revisions and come out with the same identifiers, those whose file
+        revisions were all seen then are left out"""
+        kwargs = {}
+        if since is not None:
+            seen = {tuple(revision) for revision in since['seen']}
+            since = since['since']
+            kwargs['dates'] = '>={0}'.format(time.strftime(
+                '%Y-%m-%d %H:%M:%S UTC', time.gmtime(since - window)))
+        revisions = self.collect_revisions(workers=workers, **kwargs)
+        for group in group_revisions(revisions, window=window):
+            if since is not None and all(
+                    revision.timestamp < since or
+                    (revision.path, revision.revision) in seen
+                    for revision in group):
+                continue
+            yield self._make_changeset(group)
+
+    def collect_revisions(self, workers=COLLECT_WORKERS, **kwargs):
+        """ Gather the file revisions of the whole module
+
+        A single `cvs log` is one long serial request, so the module is
+        split into its top level files and one shard per top level
+        directory, each fetched with `cvs rlog` from a bounded pool of
+        workers. Keyword arguments are passed on to `CVSClient.rlog`.
+        """
+        if self.cvs_root is None:
+            # Without a CVSROOT all we can do is log the working copy
+            log = self.client.log(stream=True, **kwargs)
+            return list(self._read_log(log))
+
+        revisions = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                lambda shard: self._rlog(*shard, **kwargs), self._shards())
+            for shard_revisions in results:
+                revisions.extend(shard_revisions)
+        return revisions
+
+    async def awalk_history(self, window=COMMIT_WINDOW):
+        revisions = await self.acollect_revisions()
+        for group in group_revisions(revisions, window=window):
+            yield self._make_changeset(group)
+
+    async def acollect_revisions(self, **kwargs):
+        """ Coroutine counterpart of `collect_revisions`. Concurrency is
+        bounded by `async_client.concurrency`"""
+        if self.cvs_root is None:
+            out, errs = await self.async_client.log(**kwargs)
+            return list(self._read_log(out))
+
+        async def rlog(module_path, local):
+            out, errs = await self.async_client.rlog(
+                module_path, local=local, **kwargs)
+            return self._module_revisions(out)
+
+        # Listing the directories is a blocking rls (or listdir)
+        shards = await asyncio.get_running_loop().run_in_executor(
+            None, self._shards)
+        revisions = []
+        results = await asyncio.gather(*[rlog(*shard) for shard in shards])
+        for shard_revisions in results:
+            revisions.extend(shard_revisions)
+        return revisions
+
+    def list_directories(self, module_path):
+        """ Names of the directories directly under a module path"""
+        if is_local_root(self.cvs_root):
+            directory = os.path.join(
+                repository_directory(self.cvs_root), module_path)
+            return sorted(
+                name for name in os.listdir(directory)
+                if name != 'Attic' and
+                os.path.isdir(os.path.join(directory, name)))
+
+        # Entries format marks directories as 'D/name////'
+        out, errs = self.client.rls(module_path, entries=True)
+        return [line.split('/')[1] for line in out.decode().splitlines()
+                if line.startswith('D/')]
+
+    def get_changeset(self, rev='HEAD', window=COMMIT_WINDOW):
+        """ Latest changeset among the file revisions `rev` selects, or the
+        one walk_history handed out a 32 digit identifier for. None if
+        there is no such changeset"""
+        if re.match(r'^[0-9a-f]{32}$', rev):
+            changesets = self._changesets.get(window)
+            if changesets is None or rev not in changesets:
+                # Built once, again only for identifiers it doesn't know
+                changesets = {changeset.identifier: changeset for changeset
+                              in self.walk_history(window=window)}
+                self._changesets[window] = changesets
+            return changesets.get(rev)
+
+        revisions = self.collect_revisions(revisions=rev)
+        groups = group_revisions(revisions, window=window)
+        return self._make_changeset(groups[-1]) if groups else None
+
+    async def aget_changeset(self, rev='HEAD', window=COMMIT_WINDOW):
+        if re.match(r'^[0-9a-f]{32}$', rev):
+            changesets = self._changesets.get(window)
+            if changesets is None or rev not in changesets:
+                changesets = {changeset.identifier: changeset async
+                              for changeset in self.awalk_history(
+                                  window=window)}
+                self._changesets[window] = changesets
+            return changesets.get(rev)
 
-        minor = int(minor)
-        major = int(major)
-        return "{major}.{minor}".format(major, minor - 1)
+        revisions = await self.acollect_revisions(revisions=rev)
+        groups = group_revisions(revisions, window=window)
+        return self._make_changeset(groups[-1]) if groups else None
+
+    def get_previous_version(self, version):
+        return previous_version(version)
 
     def get_file_contents(self, path, revision=None):
         repository_name = self.get_module_name()
         real_path = os.path.join(repository_name, path)
-        out, stderr = self.client.checkout(
+
+        def checkout(stream=False):
+            return self.client.checkout(
+                path=real_path,
+                revision=revision,
+                stdout=True,
+                stream=stream,
+                kopt='k'  # No keyword substitution
+            )
+
+        if self.cache is not None and is_revision_number(revision):
+            return io.BytesIO(self.cached(
+                lambda: checkout()[0], 'checkout', path, revision))
+        return checkout(stream=True)
+
+    async def aget_file_contents(self, path, revision=None):
+        cached = self.cache is not None and is_revision_number(revision)
+        if cached:
+            data = self.cache.get(self._cache_key('checkout', path, revision))
+            if data is not None:
+                return io.BytesIO(data)
+
+        real_path = os.path.join(self.get_module_name(), path)
+        out, errs = await self.async_client.checkout(
             path=real_path,
             revision=revision,
             stdout=True,
             kopt='k'  # No keyword substitution
         )
-        return BytesIO(out)
+        if cached:
+            self.cache.put(self._cache_key('checkout', path, revision), out)
+        return io.BytesIO(out)
+
+    def get_headers(self, refresh=False):
+        """ Map of path to CVSFileHeader for every file of the module
+
+        Built from a single `rlog -h` over the whole module and cached, so
+        head and tag lookups don't each cost a CVS round trip. Pass
+        `refresh` to pick up commits made since.
+        """
+        if self._headers is None or refresh:
+            if self.cvs_root is None:
+                log = self.client.log(header_only=True, stream=True)
+            else:
+                log = self.client.rlog(
+                    self.get_module_name(), header_only=True, stream=True)
+            headers = {}
+            for header in parse_headers(self._read_lines(log)):
+                header.path = self._module_relative(header.path)
+                headers[header.path] = header
+            self._headers = headers
+        return self._headers
+
+    def get_files_contents(self, files, workers=COLLECT_WORKERS,
+                           batch_size=FETCH_BATCH_SIZE):
+        """ Fetch many file revisions with as few CVS invocations as possible
+
+        Requests are grouped by revision (or tag) so that each group costs a
+        single `cvs checkout -p` on up to `batch_size` files. Standard error
+        is sent down the same pipe so the per-file headers mark where each
+        file's contents start, see split_checkout_output. Batches run on at
+        most `workers` processes.
+
+        Parameters
+        ----------
+        files : iterable of (str, str)
+            Pairs of path and revision. A revision of None means HEAD.
+        workers : int, optional
+            Maximum number of concurrent CVS processes
+        batch_size : int, optional
+            Maximum number of files per CVS process
+
+        Returns
+        -------
+        dict
+            (path, revision) to the file contents. Files which don't exist
+            at the requested revision are left out.
+        """
+        contents = {}
+        by_revision = {}
+        for path, revision in files:
+            if self.cache is not None and is_revision_number(revision):
+                data = self.cache.get(
+                    self._cache_key('checkout', path, revision))
+                if data is not None:
+                    contents[(path, revision)] = data
+                    continue
+            by_revision.setdefault(revision, set()).add(path)
+
+        batches = []
+        for revision, paths in by_revision.items():
+            paths = sorted(paths)
+            for start in range(0, len(paths), batch_size):
+                batches.append((revision, paths[start:start + batch_size]))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for revision, batch in executor.map(
+                    lambda batch: (batch[0], self._checkout_batch(*batch)),
+                    batches):
+                for path, data in batch.items():
+                    contents[(path, revision)] = data
+                    if self.cache is not None and \
+                            is_revision_number(revision):
+                        self.cache.put(
+                            self._cache_key('checkout', path, revision), data)
+        return contents
 
     def get_head_version(self, path):
-        args = ['-rHEAD', path]
-        out, errs = self.client.log(files=path)
-        version = re.search(
-            b"^head:\s+((?:\d+\.)+\d+)",
-            out,
-            re.MULTILINE).group(1).decode()
-        return version
+        return self.get_headers()[path].head
+
+    def get_tag_revision(self, path, tag):
+        """ Revision a tag (or branch number a branch tag) refers to for
+        path, or None if the file isn't tagged"""
+        return self.get_headers()[path].resolve(tag)
 
     def get_module_name(self):
         """ It's possible that the directory containing the local copy does
         not have the same name as the "module" (see the -d flag). Fortunately
         we can recover the name by peeking into the CVS filesystem"""
+        if self.module is not None:
+            return self.module
         repository_file_path = os.path.join(self.path, 'CVS', 'Repository')
         with open(repository_file_path, 'r') as repository_file:
             return repository_file.read().strip()
 
-    def _read_log_xml(self, log, limit=None):
-        tree = ET.fromstring(log)
+    def _read_lines(self, output):
+        """ Decoded lines of a command's output, given as bytes or a stream"""
+        if isinstance(output, bytes):
+            return output.decode('utf-8', 'replace').split('\n')
+        text = io.TextIOWrapper(output, encoding='utf-8', errors='replace',
+                                newline='\n')
+        return (line[:-1] if line.endswith('\n') else line for line in text)
 
-        author = tree.find('entry/author').text
-        date = tree.find('entry/isoDate').text
-        message = tree.find('entry/msg').text
+    def _read_log(self, log):
+        return parse_log(self._read_lines(log))
 
+    def _shards(self):
+        module = self.get_module_name()
+        shards = [(module, True)]
+        for directory in self.list_directories(module):
+            shards.append(('/'.join([module, directory]), False))
+        return shards
+
+    def _rlog(self, module_path, local, **kwargs):
+        log = self.client.rlog(module_path, local=local, stream=True,
+                               **kwargs)
+        return self._module_revisions(log)
+
+    def _module_revisions(self, log):
+        revisions = list(self._read_log(log))
+        for revision in revisions:
+            revision.path = self._module_relative(revision.path)
+        return revisions
+
+    def _checkout_batch(self, revision, paths):
+        module = self.get_module_name()
+        out, errs = self.client.checkout(
+            path=['/'.join([module, path]) for path in paths],
+            revision=revision,
+            stdout=True,
+            combine_output=True,
+            # Files missing at this revision fail the command, not the batch
+            check=False,
+            kopt='k'  # No keyword substitution
+        )
+        files, messages = split_checkout_output(out)
+        aborted = [message for message in messages if 'aborted]' in message]
+        if aborted:
+            raise CVSException('\n'.join(aborted).encode())
+        prefix = module + '/'
+        return {module_path[len(prefix):]: data
+                for module_path, (version, data) in files.items()}
+
+    def _cache_key(self, *identity):
+        return self.cache.key(self.origin, *identity)
+
+    def _module_relative(self, path):
+        # rlog only names the RCS files, make them relative to the module
+        if self.cvs_root is None:
+            return path
+        prefix = '/'.join([repository_directory(self.cvs_root),
+                           self.get_module_name(), ''])
+        if path.startswith(prefix):
+            return path[len(prefix):]
+        return path
+
+    @staticmethod
+    def _read_admin_file(path, name):
+        admin_file_path = os.path.join(path, 'CVS', name)
+        if not os.path.exists(admin_file_path):
+            return None
+        with open(admin_file_path, 'r') as admin_file:
+            return admin_file.read().strip()
+
+    def _make_changeset(self, group):
+        first = group[0]
+        timestamp = format_timestamp(first.timestamp)
         changes = list()
-        for count, path in enumerate(tree.findall('entry/file')):
-            if limit is not None and count >= limit:
-                break
-            state = path.find('cvsstate').text
-            lines_added = path.find('linesadded')
-            lines_removed = path.find('linesremoved')
-            revision = path.find('revision').text
-            name = path.find('name').text
-
-            if lines_added:
-                lines_added = lines_added.text
-            if lines_removed:
-                lines_removed = lines_removed.text
-
-            if state == 'dead':
-                # Removed
-                action = ChangeType.remove
-                current_path = name
-                current_revision = revision
-                previous_path = name
-                previous_revision = self.get_previous_version(revision)
-            elif lines_added is None and lines_removed is None:
-                action = ChangeType.add
-                current_path = name
-                current_revision = str(revision)
+        for revision in sorted(group, key=lambda revision: revision.path):
+            if revision.action == ChangeType.add:
                 previous_path = None
                 previous_revision = None
             else:
-                action = ChangeType.modify
-                current_path = name
-                current_revision = str(revision)
-                previous_path = name
-                previous_revision = self.get_previous_version(revision)
-
-            changes.append(Change(self, previous_path, previous_revision,
-                                  current_path, current_revision, action))
-
-        return author, date, message, changes
+                previous_path = revision.path
+                previous_revision = revision.previous_revision
+            change = Change(self, previous_path, previous_revision,
+                            revision.path, revision.revision, revision.action)
+            if revision.action == ChangeType.modify:
+                # Straight from the log, no need to diff
+                change.lines_added = revision.lines_added
+                change.lines_removed = revision.lines_removed
+            changes.append(change)
+        return ChangeSet(
+            changes,
+            None,
+            make_identifier(first.author, timestamp, first.message),
+            first.author,
+            first.message,
+            timestamp)
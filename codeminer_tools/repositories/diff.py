@@ -0,0 +1,102 @@
+from collections import Counter
+
+# Bound on the edit distance diff_lines searches for: a share of the lines
+# that differ, at least MIN_COST and at most MAX_COST. Beyond it the counts
+# are estimated instead. Myers' loop over diagonals alone takes O(D ** 2)
+# steps, which in Python gets slow long before D reaches the thousands
+MIN_COST = 50
+MAX_COST = 400
+COST_SHARE = 0.25
+
+
+def split_lines(data):
+    """ Lines of data the way `diff` and CVS count them, a final newline
+    doesn't start another line"""
+    lines = data.split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    return lines
+
+
+def hash_lines(*texts):
+    """ Each text as a list of integers, equal lines getting equal
+    integers across all of them"""
+    ids = {}
+    return [[ids.setdefault(line, len(ids)) for line in split_lines(text)]
+            for text in texts]
+
+
+def cost_limit(n, m):
+    """ Default max_cost of diff_lines for sequences of n and m lines"""
+    return min(MAX_COST, max(MIN_COST, int((n + m) * COST_SHARE)))
+
+
+def edit_distance(a, b, max_cost=None):
+    """ Smallest number of lines to remove from and add to sequence a to
+    get sequence b, using Myers' O((N + M) D) algorithm
+
+    Returns None if it is larger than max_cost (unbounded if None).
+    """
+    n, m = len(a), len(b)
+    limit = n + m if max_cost is None else min(n + m, max_cost)
+    offset = limit + 1
+    # Furthest x reached on each diagonal k = x - y
+    v = [0] * (2 * limit + 3)
+    for cost in range(limit + 1):
+        for k in range(-cost, cost + 1, 2):
+            if k == -cost or (k != cost and
+                              v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return cost
+    return None
+
+
+def diff_lines(old, new, max_cost=None):
+    """ Line statistics of the change from old to new contents (bytes)
+
+    Returns
+    -------
+    tuple of (int, int, float)
+        Lines added, lines removed and the similarity: the share of lines
+        the two have in common, between 0 and 1. Past max_cost edits (by
+        default see cost_limit) the counts are an estimate from the lines
+        both have, regardless of order.
+    """
+    a, b = hash_lines(old, new)
+
+    # Common prefix and suffix cost nothing to diff
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while (end < len(a) - start and end < len(b) - start and
+           a[-1 - end] == b[-1 - end]):
+        end += 1
+    middle_a = a[start:len(a) - end]
+    middle_b = b[start:len(b) - end]
+
+    if max_cost is None:
+        max_cost = cost_limit(len(middle_a), len(middle_b))
+    cost = edit_distance(middle_a, middle_b, max_cost)
+    if cost is None:
+        common = sum((Counter(middle_a) & Counter(middle_b)).values())
+    else:
+        common = (len(middle_a) + len(middle_b) - cost) // 2
+    common += start + end
+
+    return (len(b) - common, len(a) - common,
+            similarity(len(a), len(b), common))
+
+
+def similarity(old_lines, new_lines, common):
+    if old_lines + new_lines == 0:
+        return 1.0
+    return 2 * common / (old_lines + new_lines)
@@ -1,20 +1,148 @@
+from collections import OrderedDict
+from io import BytesIO
+import threading
+import weakref
+
+# Default upper bound on the size of the contents kept in memory (bytes)
+CONTENT_CACHE_SIZE = 64 * 1024 ** 2
+
+# Files larger than this are never kept in memory (bytes)
+CONTENT_CACHE_ENTRY_SIZE = 4 * 1024 ** 2
+
+# Size of the chunks size() reads when no metadata has it
+CHUNK_SIZE = 64 * 1024
+
+
+class ContentCache:
+    """ Least recently used file contents, up to `max_size` bytes in total
+
+    Keyed by (repository, path, revision). Repositories are only weakly
+    referenced, so caching their files doesn't keep them (and their
+    checkouts) alive. Contents over `max_entry_size` bytes are never
+    cached. Safe to share between threads.
+    """
+
+    def __init__(self, max_size=CONTENT_CACHE_SIZE,
+                 max_entry_size=CONTENT_CACHE_ENTRY_SIZE):
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(repository, path, revision):
+        return (weakref.ref(repository), path, revision)
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_entry_size:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared by every RepositoryFile, see RepositoryFile.cache
+content_cache = ContentCache()
+
+
 class RepositoryFile:
 
+    __slots__ = ('repository', 'path', 'revision', 'tags')
+
+    # ContentCache for read(), None to always fetch
+    cache = content_cache
+
     def __init__(self, repository, path, revision, tags=None):
         self.repository = repository
         self.path = path
         self.revision = revision
         self.tags = tags
 
-    def read(self):
+    def open(self):
+        """ Readable file object over the contents, streamed from the
+        repository unless they are cached"""
+        if self._cached():
+            data = self.cache.get(self._cache_key())
+            if data is not None:
+                return BytesIO(data)
         return self.repository.get_file_contents(
-            self.path, revision=self.revision).read()
+            self.path, revision=self.revision)
+
+    def read(self):
+        if not self._cached():
+            return self.open().read()
+
+        key = self._cache_key()
+        data = self.cache.get(key)
+        if data is None:
+            data = self.open().read()
+            self.cache.put(key, data)
+        return data
+
+    def size(self):
+        """ Size of the contents in bytes, from repository metadata where
+        possible. Otherwise they are streamed and counted, not kept"""
+        size = self.repository.get_file_size(self.path, revision=self.revision)
+        if size is not None:
+            return size
+        if self._cached():
+            data = self.cache.get(self._cache_key())
+            if data is not None:
+                return len(data)
+        stream = self.open()
+        return sum(len(chunk) for chunk
+                   in iter(lambda: stream.read(CHUNK_SIZE), b''))
+
+    def content_id(self):
+        """ Identifier of the contents from repository metadata (blob SHA,
+        checksum...), or None if the repository doesn't have one handy"""
+        return self.repository.get_content_id(self.path, revision=self.revision)
+
+    def digest(self):
+        """ Identifier of the contents, reading them only if there's no
+        content_id. Equal digests mean equal contents"""
+        content_id = self.content_id()
+        if content_id is not None:
+            return content_id
+        return self.repository.content_digest(self.read())
 
     def __eq__(self, other):
         return ((self.repository == other.repository) and
                 (self.path == other.path) and
                 (self.revision == other.revision))
 
+    def __hash__(self):
+        return hash((self.path, self.revision))
+
+    def _cached(self):
+        # Without a revision the file is whatever is current, which moves
+        return self.cache is not None and self.revision is not None
+
+    def _cache_key(self):
+        return self.cache.key(self.repository, self.path, self.revision)
+
     def __repr__(self):
         return "<{type} : {path}@{rev}>".format(
             type=self.repository.name, path=self.path, rev=self.revision)
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import tempfile
 import shutil
@@ -5,25 +6,27 @@ from io import StringIO
 
 import git
 
-from codeminer_tools.repositories.repository import change_dir, Repository
+from codeminer_tools.repositories.repository import Repository
 from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
 
 
 def open_repository(path, workspace=None, **kwargs):
     cleanup = False
+    origin = path
     if not os.path.exists(path):
         checkout_path = tempfile.mkdtemp(dir=workspace)
         client = git.Repo.clone_from(path, checkout_path, **kwargs)
         path = checkout_path
         cleanup = True
-    return GitRepository(path, cleanup=cleanup)
+    return GitRepository(path, cleanup=cleanup, origin=origin)
 
 
 class GitRepository(Repository):
 
-    def __init__(self, path, cleanup=False):
+    def __init__(self, path, cleanup=False, origin=None):
         self.cleanup = cleanup
-        self.path = path
+        self.path = os.path.abspath(path)
+        self.origin = origin if origin is not None else path
         self.client = git.Repo(path)
         self.name = 'GIT'
 
@@ -31,22 +34,33 @@ class GitRepository(Repository):
         if self.cleanup:
             shutil.rmtree(self.path)
 
-    @change_dir
-    def walk_history(self):
+    def get_history_state(self):
+        return {head.name: head.commit.hexsha for head in self.client.heads}
+
+    def walk_history(self, since=None):
+        """ Commits of every head, newest first. Given a `since` from
+        get_history_state, only the commits which weren't reachable then"""
+        exclude = []
+        if since is not None:
+            exclude = ['^' + commit for commit in since.values()]
         for head in self.client.heads:
-            for commit in self.client.iter_commits(head):
+            for commit in self.client.iter_commits(
+                    [head.commit.hexsha] + exclude):
                 yield self.process_commit(commit)
 
-    @change_dir
     def get_head_revision(self):
         return self.client.commit().binsha
 
-    @change_dir
     def get_changeset(self, revision='HEAD'):
-        commit = self.client.commit(revision)
+        commit = self.commit(revision)
         return self.process_commit(commit)
 
-    @change_dir
+    def commit(self, revision=None):
+        # Changes carry the binary SHAs process_commit hands out
+        if isinstance(revision, bytes):
+            revision = revision.hex()
+        return self.client.commit(revision)
+
     def process_commit(self, commit):
         author = commit.author
         message = commit.message
@@ -128,9 +142,25 @@ class GitRepository(Repository):
             message=message,
             timestamp=date)
 
-    @change_dir
+    def get_content_id(self, path, revision=None):
+        try:
+            return self.commit(revision).tree[path].hexsha
+        except (KeyError, ValueError, git.BadName):
+            return None
+
+    def get_file_size(self, path, revision=None):
+        try:
+            return self.commit(revision).tree[path].size
+        except (KeyError, ValueError, git.BadName):
+            return None
+
+    def content_digest(self, data):
+        # Same as the blob SHA git would give the contents
+        return hashlib.sha1(
+            'blob {0}\0'.format(len(data)).encode() + data).hexdigest()
+
     def get_file_contents(self, path, revision=None):
-        commit = self.client.commit(revision)
+        commit = self.commit(revision)
         for blob in commit.tree.traverse(
                 predicate=lambda obj,
                 depth: obj.path == path):
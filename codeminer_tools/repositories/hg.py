@@ -1,4 +1,3 @@
-import os
 import tempfile
 import shutil
 from io import BytesIO
@@ -6,47 +5,51 @@ from io import BytesIO
 import hglib
 from hglib.util import b
 
+from codeminer_tools.clients import instrumentation
+from codeminer_tools.clients.instrumentation import CommandEvent
 from codeminer_tools.repositories.repository import Repository
 from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
 
 
-def change_dir(function):
-    def wrap_inner(*args, **kwargs):
-        self = args[0]
-        old_path = os.getcwd()
-        os.chdir(self.path)
-        result = function(*args, **kwargs)
-        os.chdir(old_path)
-        return result
-    return wrap_inner
-
-
 def create_repository(path=None, **kwargs):
-    return HgRepository(hglib.init(dest=path, **kwargs), cleanup=False)
+    return HgRepository(hglib.init(dest=path, **kwargs), cleanup=False,
+                        origin=path)
 
 
 def open_repository(path, workspace=None, **kwargs):
     checkout_path = tempfile.mkdtemp(dir=workspace)
     client = hglib.clone(source=path, dest=checkout_path, **kwargs)
     client.open()
-    return HgRepository(client, cleanup=True)
+    return HgRepository(client, cleanup=True, origin=path)
 
 
 class HgRepository(Repository):
 
-    def __init__(self, client, cleanup=False):
+    def __init__(self, client, cleanup=False, origin=None):
         self.client = client
         self.cleanup = cleanup
         self.path = client.root().decode()
+        # Where the repository came from, clones share cache entries
+        self.origin = origin if origin is not None else self.path
         self.name = 'Hg'
 
     def __del__(self):
         if self.cleanup:
             shutil.rmtree(self.path)
 
-    @change_dir
-    def walk_history(self):
-        for record in self.client.log(follow=True):
+    def get_history_state(self):
+        records = self.client.log(revrange=b('.'))
+        return records[0].node.decode() if records else None
+
+    def walk_history(self, since=None):
+        """ Ancestors of the working directory, newest first. Given a
+        `since` node from get_history_state, only those added since"""
+        if since is None:
+            log = self.client.log(follow=True)
+        else:
+            log = self.client.log(
+                revrange=b('reverse(::. - ::{0})'.format(since)))
+        for record in log:
             revision = record.rev.decode()
             node = record.node.decode()
             tags = record.tags.decode()
@@ -57,7 +60,6 @@ class HgRepository(Repository):
             changes = self.get_status(revision=revision)
             yield ChangeSet(changes, tags, revision, author, desc, date)
 
-    @change_dir
     def get_changeset(self, revision=None):
         parent_revision = None
 
@@ -78,7 +80,6 @@ class HgRepository(Repository):
 
         return ChangeSet(changes, tags, revision, author, desc, date)
 
-    @change_dir
     def get_status(self, revision=None):
         parent_revision = None
         if revision is not None:
@@ -136,8 +137,17 @@ class HgRepository(Repository):
             changes.append(change)
         return changes
 
-    @change_dir
     def get_file_contents(self, path, revision=None):
+        if self.cache is None:
+            return self._cat(path, revision)
+        # Revision numbers and names are local, only the node is immutable
+        node = self.client.log(
+            revrange=b(str(revision if revision is not None else '.')),
+            limit=1)[0].node.decode()
+        return BytesIO(self.cached(
+            lambda: self._cat(path, node).read(), 'cat', path, node))
+
+    def _cat(self, path, revision=None):
         # Note: Should ideally use the library's "cat" function, but it
         # has a bug in that it doesn't provide a "cwd" argument. This implementation
         # is based on the library's with the fix implemented.
@@ -156,5 +166,10 @@ class HgRepository(Repository):
             cwd=self.path,
             hidden=self.client.hidden,
             *files)
-        print("hg " + ' '.join([x.decode() for x in args]))
-        return BytesIO(self.client.rawcommand(args))
+        # The command server has no process to spawn, but still report
+        # the command like the other clients do
+        event = CommandEvent('hg', 'cat', [x.decode() for x in args[1:]])
+        out = self.client.rawcommand(args)
+        event.finished(0, len(out))
+        instrumentation.default.record(event)
+        return BytesIO(out)
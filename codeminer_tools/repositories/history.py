@@ -0,0 +1,353 @@
+import datetime
+import json
+import re
+import sqlite3
+
+from codeminer_tools.repositories.change import (ChangeType, Change,
+                                                 ChangeSet, to_epoch)
+
+# Columns without a declared type keep whatever Python type they are
+# given, so str, bytes (Git SHAs) and int revisions all round-trip
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repositories (
+    id INTEGER PRIMARY KEY,
+    origin TEXT NOT NULL UNIQUE,
+    name TEXT,
+    state TEXT
+);
+CREATE TABLE IF NOT EXISTS changesets (
+    id INTEGER PRIMARY KEY,
+    repository INTEGER NOT NULL,
+    identifier NOT NULL,
+    author TEXT,
+    message TEXT,
+    timestamp,
+    timestamp_kind TEXT,
+    epoch REAL,
+    tags TEXT,
+    UNIQUE (repository, identifier)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    changeset INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    action INTEGER NOT NULL,
+    previous_path TEXT,
+    previous_revision,
+    current_path TEXT,
+    current_revision,
+    lines_added INTEGER,
+    lines_removed INTEGER,
+    similarity REAL
+);
+CREATE INDEX IF NOT EXISTS changesets_epoch ON changesets (repository, epoch);
+CREATE INDEX IF NOT EXISTS changesets_author
+ON changesets (repository, author, epoch);
+CREATE INDEX IF NOT EXISTS changes_changeset ON changes (changeset, position);
+CREATE INDEX IF NOT EXISTS changes_current_path
+ON changes (current_path, changeset);
+CREATE INDEX IF NOT EXISTS changes_previous_path
+ON changes (previous_path, changeset);
+CREATE INDEX IF NOT EXISTS changes_action ON changes (action, changeset);
+"""
+
+# Changesets loaded at a time, their changes come from a single query
+LOAD_BLOCK = 500
+
+GLOB_TOKENS = re.compile(r'\*\*/|\*\*|\*|\?|[^*?]+')
+
+
+def glob_prefix(pattern):
+    """ Literal start of a glob pattern, all matching paths begin with it"""
+    return re.split(r'[*?]', pattern, 1)[0]
+
+
+def glob_regex(pattern):
+    """ Compile a path glob: `*` and `?` stay within a directory, `**`
+    spans any number of them"""
+    parts = []
+    for token in GLOB_TOKENS.findall(pattern):
+        if token == '**/':
+            parts.append('(?:.*/)?')
+        elif token == '**':
+            parts.append('.*')
+        elif token == '*':
+            parts.append('[^/]*')
+        elif token == '?':
+            parts.append('[^/]')
+        else:
+            parts.append(re.escape(token))
+    return re.compile(''.join(parts) + r'\Z')
+
+
+def prefix_range(prefix):
+    """ (low, high) such that low <= path < high for paths starting with
+    prefix, which an index can answer"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def dump_timestamp(timestamp):
+    """ (value, kind) to store a ChangeSet timestamp as"""
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.isoformat(), 'datetime'
+    return timestamp, None
+
+
+def load_timestamp(value, kind):
+    if kind == 'datetime':
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+class HistoryCache:
+    """ Local store of mined ChangeSets, one history per repository origin
+
+    Along with the changesets the cache keeps the repository's history
+    state (see `Repository.get_history_state`) as of the last update, so
+    the next update only has to walk what was committed since. Changesets
+    are stored by identifier, one seen again replaces the stored copy.
+
+    Changesets are normalized on the way in: authors become strings and
+    changes keep their paths, revisions, action and line statistics.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def repository_id(self, repository):
+        self.connection.execute(
+            'INSERT OR IGNORE INTO repositories (origin, name) VALUES (?, ?)',
+            (repository.origin, repository.name))
+        return self.connection.execute(
+            'SELECT id FROM repositories WHERE origin = ?',
+            (repository.origin,)).fetchone()[0]
+
+    def state(self, repository):
+        """ History state stored by the last update, or None"""
+        row = self.connection.execute(
+            'SELECT state FROM repositories WHERE origin = ?',
+            (repository.origin,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def update(self, repository):
+        """ Walk and store what is new in repository, returns the number of
+        changesets walked"""
+        state = self.state(repository)
+        new_state = repository.get_history_state()
+        if state is None or new_state is None:
+            changesets = repository.walk_history()
+        else:
+            changesets = repository.walk_history(since=state)
+
+        repository_id = self.repository_id(repository)
+        count = 0
+        self.connection.execute('BEGIN')
+        try:
+            for changeset in changesets:
+                self._store(repository_id, changeset)
+                count += 1
+            self.connection.execute(
+                'UPDATE repositories SET state = ? WHERE id = ?',
+                (None if new_state is None else json.dumps(new_state),
+                 repository_id))
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        return count
+
+    def replay(self, repository):
+        """ Stored changesets of repository, oldest first. Their changes
+        refer to `repository` so their files can still be read"""
+        rows = self.connection.execute(
+            'SELECT changesets.id, identifier, author, message, timestamp, '
+            'timestamp_kind, tags FROM changesets '
+            'JOIN repositories ON repositories.id = changesets.repository '
+            'WHERE origin = ? ORDER BY epoch, changesets.id',
+            (repository.origin,))
+        yield from self._load(repository, rows)
+
+    def query(self, repository, author=None, path_glob=None, since=None,
+              until=None, actions=None):
+        """ Stored changesets of repository matching every filter given,
+        oldest first
+
+        The filters are answered from indexes on the author, time, paths
+        and change types rather than by replaying the whole history.
+
+        Parameters
+        ----------
+        author : str, optional
+            Exact author, as stored (`str` of the backend's author)
+        path_glob : str, optional
+            Glob the previous or current path of a change must match, for
+            instance 'src/**' or '**/*.c'
+        since, until : optional
+            Time range, including since and excluding until. Anything
+            `to_epoch` understands (epoch, datetime or ISO 8601 string)
+        actions : iterable of ChangeType, optional
+            Kinds of change to look for
+
+        Yields
+        ------
+        ChangeSet
+            With only the changes matching path_glob and actions
+        """
+        conditions = ['repositories.origin = ?']
+        parameters = [repository.origin]
+        joins = ''
+        if author is not None:
+            conditions.append('changesets.author = ?')
+            parameters.append(author)
+        if since is not None:
+            conditions.append('changesets.epoch >= ?')
+            parameters.append(to_epoch(since))
+        if until is not None:
+            conditions.append('changesets.epoch < ?')
+            parameters.append(to_epoch(until))
+
+        change_conditions = []
+        prefix = glob_prefix(path_glob) if path_glob is not None else ''
+        if prefix:
+            low, high = prefix_range(prefix)
+            change_conditions.append(
+                '((changes.current_path >= ? AND changes.current_path < ?) OR '
+                '(changes.previous_path >= ? AND changes.previous_path < ?))')
+            parameters.extend([low, high, low, high])
+        if actions is not None:
+            actions = set(actions)
+            change_conditions.append('changes.action IN ({0})'.format(
+                ', '.join('?' * len(actions))))
+            parameters.extend(action.value for action in actions)
+        if change_conditions:
+            joins = 'JOIN changes ON changes.changeset = changesets.id '
+            conditions.extend(change_conditions)
+
+        rows = self.connection.execute(
+            'SELECT DISTINCT changesets.id, identifier, author, message, '
+            'timestamp, timestamp_kind, tags, epoch FROM changesets '
+            'JOIN repositories ON repositories.id = changesets.repository ' +
+            joins + 'WHERE ' + ' AND '.join(conditions) +
+            ' ORDER BY epoch, changesets.id', parameters)
+
+        regex = glob_regex(path_glob) if path_glob is not None else None
+
+        def selected(change):
+            if actions is not None and change.action not in actions:
+                return False
+            return regex is None or any(
+                path is not None and regex.match(path) for path in
+                (change.previous_file.path, change.current_file.path))
+
+        for changeset in self._load(repository,
+                                    (row[:-1] for row in rows)):
+            changeset.changes = [change for change in changeset.changes
+                                 if selected(change)]
+            if changeset.changes or (regex is None and actions is None):
+                yield changeset
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM changesets').fetchone()[0]
+
+    def _store(self, repository_id, changeset):
+        timestamp, kind = dump_timestamp(changeset.timestamp)
+        author = changeset.author
+        existing = self.connection.execute(
+            'SELECT id FROM changesets WHERE repository = ? AND '
+            'identifier = ?', (repository_id, changeset.identifier)).fetchone()
+        if existing is not None:
+            self.connection.execute(
+                'DELETE FROM changes WHERE changeset = ?', existing)
+            self.connection.execute(
+                'DELETE FROM changesets WHERE id = ?', existing)
+
+        changeset_id = self.connection.execute(
+            'INSERT INTO changesets (repository, identifier, author, '
+            'message, timestamp, timestamp_kind, epoch, tags) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (repository_id, changeset.identifier,
+             None if author is None else str(author), changeset.message,
+             timestamp, kind, to_epoch(changeset.timestamp),
+             json.dumps(changeset.tags))).lastrowid
+        self.connection.executemany(
+            'INSERT INTO changes (changeset, position, action, '
+            'previous_path, previous_revision, current_path, '
+            'current_revision, lines_added, lines_removed, similarity) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(changeset_id, position, change.action.value,
+              change.previous_file.path, change.previous_file.revision,
+              change.current_file.path, change.current_file.revision,
+              change.lines_added, change.lines_removed, change.similarity)
+             for position, change in enumerate(changeset.changes)])
+
+    def _load(self, repository, rows):
+        """ ChangeSets of changeset rows, read LOAD_BLOCK at a time along
+        with the changes of the whole block"""
+        rows = iter(rows)
+        while True:
+            block = [row for _, row in zip(range(LOAD_BLOCK), rows)]
+            if not block:
+                return
+            changes = {row[0]: [] for row in block}
+            for (changeset_id, action, previous_path, previous_revision,
+                 current_path, current_revision, lines_added, lines_removed,
+                 similarity) in self.connection.execute(
+                    'SELECT changeset, action, previous_path, '
+                    'previous_revision, current_path, current_revision, '
+                    'lines_added, lines_removed, similarity FROM changes '
+                    'WHERE changeset IN ({0}) ORDER BY changeset, '
+                    'position'.format(', '.join('?' * len(changes))),
+                    list(changes)):
+                change = Change(repository, previous_path, previous_revision,
+                                current_path, current_revision,
+                                ChangeType(action))
+                change.lines_added = lines_added
+                change.lines_removed = lines_removed
+                change.similarity = similarity
+                changes[changeset_id].append(change)
+            for (changeset_id, identifier, author, message, timestamp, kind,
+                 tags) in block:
+                yield ChangeSet(changes[changeset_id], json.loads(tags),
+                                identifier, author, message,
+                                load_timestamp(timestamp, kind))
+
+
+class CachedRepository:
+    """ Repository whose history is kept in a HistoryCache
+
+    walk_history first brings the cache up to date, walking only what the
+    repository gained since the last time, then replays every changeset
+    from the cache, oldest first. Everything else is passed through to
+    the wrapped repository.
+
+        repository = CachedRepository(svn.open_repository(url),
+                                      HistoryCache('history.db'))
+        for changeset in repository.walk_history():
+            ...
+    """
+
+    def __init__(self, repository, history):
+        self.repository = repository
+        self.history = history
+
+    def walk_history(self, update=True):
+        if update:
+            self.history.update(self.repository)
+        return self.history.replay(self.repository)
+
+    def query(self, update=False, **filters):
+        """ Stored changesets matching filters, see HistoryCache.query"""
+        if update:
+            self.history.update(self.repository)
+        return self.history.query(self.repository, **filters)
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
@@ -0,0 +1,63 @@
+import contextlib
+import threading
+import weakref
+
+# Lock of every repository which isn't thread_safe, see client_lock
+_locks = weakref.WeakKeyDictionary()
+_locks_lock = threading.Lock()
+
+
+def client_lock(repository):
+    """ Lock to hold around anything calling into repository from one of
+    several threads: walking its history, reading files, optimizing its
+    changesets. Shared by everyone using the repository object, reentrant,
+    and a context doing nothing for repositories which are `thread_safe`
+    """
+    if repository is None or getattr(repository, 'thread_safe', True):
+        return contextlib.nullcontext()
+    with _locks_lock:
+        lock = _locks.get(repository)
+        if lock is None:
+            lock = _locks[repository] = threading.RLock()
+        return lock
+
+
+def changeset_repositories(changeset):
+    """ Repositories the changes of a changeset refer to"""
+    repositories = {}
+    for change in getattr(changeset, 'changes', ()):
+        for repository_file in (change.previous_file, change.current_file):
+            repository = repository_file.repository
+            if repository is not None:
+                repositories.setdefault(id(repository), repository)
+    return list(repositories.values())
+
+
+@contextlib.contextmanager
+def client_locks(repositories):
+    """ client_lock of every repository, always taken in the same order"""
+    with contextlib.ExitStack() as stack:
+        for repository in sorted(repositories, key=id):
+            stack.enter_context(client_lock(repository))
+        yield
+
+
+def iter_locked(changesets):
+    """ Iterate changesets, advancing the iterator under the client_lock
+    of every repository its changesets so far referred to
+
+    A walk_history generator runs the backend's client each time it is
+    advanced. Other threads only touch the repositories of changesets they
+    were handed, so the walk never runs alongside them.
+    """
+    changesets = iter(changesets)
+    repositories = {}
+    while True:
+        with client_locks(repositories.values()):
+            try:
+                changeset = next(changesets)
+            except StopIteration:
+                return
+        for repository in changeset_repositories(changeset):
+            repositories.setdefault(id(repository), repository)
+        yield changeset
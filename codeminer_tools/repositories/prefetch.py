@@ -0,0 +1,168 @@
+import collections
+import concurrent.futures
+import threading
+
+from codeminer_tools.repositories.change import ChangeType
+from codeminer_tools.repositories.locks import client_lock, iter_locked
+
+# Changesets whose contents are requested ahead of the one handed back
+LOOKAHEAD = 8
+
+# Concurrent content requests
+WORKERS = 4
+
+# Contents read ahead but not yet handed back, in bytes. Files still being
+# read count as the average size of those read so far. Looking ahead stops
+# once it is reached, the last changeset requested can go over it
+MEMORY_BUDGET = 64 * 1024 ** 2
+
+
+def changeset_files(changeset, previous=False):
+    """ Files of a changeset with contents: what every change left behind,
+    and with previous what it started from"""
+    files = []
+    for change in changeset.changes:
+        if change.action != ChangeType.remove:
+            files.append(change.current_file)
+        if previous and change.previous_file.path is not None:
+            files.append(change.previous_file)
+    return files
+
+
+class Prefetcher:
+    """ Iterates changesets along with the contents of their files, read
+    ahead while the previous ones are being worked on
+
+    Yields (changeset, contents) pairs, contents mapping each
+    RepositoryFile of the changeset (see `changeset_files`) to its bytes.
+    Up to `lookahead` changesets ahead are requested from a pool of
+    `workers` threads, and no further while `memory_budget` bytes of read
+    ahead (or expected) contents wait to be handed back.
+
+    Repositories with a batch API (`get_files_contents`, CVS) get one
+    request per changeset, files it doesn't find are left out of contents.
+    Others are read file by file through `RepositoryFile.read`. Reads of
+    repositories which aren't `thread_safe` take turns under their
+    client_lock, which changesets are also pulled under: walking the
+    history runs the same client.
+
+        for changeset, contents in Prefetcher(repository.walk_history()):
+            for change in changeset.changes:
+                analyse(contents[change.current_file])
+
+    Errors reading a file are raised when its changeset is reached.
+    """
+
+    def __init__(self, changesets, lookahead=LOOKAHEAD, workers=WORKERS,
+                 memory_budget=MEMORY_BUDGET, previous=False):
+        self.changesets = changesets
+        self.lookahead = lookahead
+        self.workers = workers
+        self.memory_budget = memory_budget
+        self.previous = previous
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Bytes read ahead, waiting in the window
+        self.loaded = 0
+        # Files requested and not read yet
+        self.pending = 0
+        self._bytes_read = 0
+        self._files_read = 0
+
+    def in_flight(self):
+        """ Bytes read ahead or being read, estimated for the latter. None
+        until a first file is read"""
+        with self._lock:
+            if not self._files_read:
+                return None
+            return self.loaded + (
+                self.pending * self._bytes_read / self._files_read)
+
+    def __iter__(self):
+        self._reset()
+        changesets = iter_locked(self.changesets)
+        window = collections.deque()
+        executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+        try:
+            exhausted = False
+            while True:
+                while (not exhausted and len(window) < self.lookahead and
+                       (not window or self._below_budget())):
+                    changeset = next(changesets, None)
+                    if changeset is None:
+                        exhausted = True
+                    else:
+                        window.append(
+                            (changeset, self._request(executor, changeset)))
+                if not window:
+                    return
+                changeset, requests = window.popleft()
+                contents = {}
+                size = 0
+                for future in requests:
+                    result = future.result()
+                    size += sum(len(data) for data in result.values())
+                    contents.update(result)
+                yield changeset, contents
+                with self._lock:
+                    self.loaded -= size
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _below_budget(self):
+        in_flight = self.in_flight()
+        # Without an idea of the file sizes, only the next changeset
+        return in_flight is not None and in_flight < self.memory_budget
+
+    def _request(self, executor, changeset):
+        by_repository = collections.OrderedDict()
+        # A file can be both the previous of a change and the current of
+        # another, it is only read once
+        for repository_file in dict.fromkeys(
+                changeset_files(changeset, self.previous)):
+            by_repository.setdefault(
+                id(repository_file.repository), []).append(repository_file)
+
+        with self._lock:
+            self.pending += sum(len(files) for files in by_repository.values())
+        requests = []
+        for files in by_repository.values():
+            repository = files[0].repository
+            if hasattr(repository, 'get_files_contents'):
+                requests.append(executor.submit(self._read_batch, files))
+            else:
+                requests.extend(executor.submit(self._read, repository_file)
+                                for repository_file in files)
+        return requests
+
+    def _read(self, repository_file):
+        with client_lock(repository_file.repository):
+            data = repository_file.read()
+        self._loaded(1, len(data))
+        return {repository_file: data}
+
+    def _read_batch(self, files):
+        repository = files[0].repository
+        with client_lock(repository):
+            found = repository.get_files_contents(
+                [(x.path, x.revision) for x in files])
+        contents = {x: found[(x.path, x.revision)] for x in files
+                    if (x.path, x.revision) in found}
+        self._loaded(len(files),
+                     sum(len(data) for data in contents.values()))
+        return contents
+
+    def _loaded(self, files, size):
+        with self._lock:
+            self.pending -= files
+            self.loaded += size
+            self._files_read += files
+            self._bytes_read += size
+
+
+def prefetch(changesets, **kwargs):
+    """ (changeset, contents) pairs with contents read ahead, see
+    Prefetcher"""
+    return iter(Prefetcher(changesets, **kwargs))
@@ -0,0 +1,249 @@
+import importlib
+import os
+import threading
+
+from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
+from codeminer_tools.repositories.file import RepositoryFile
+
+# Modules providing open_repository for each backend name
+BACKENDS = {
+    'cvs': 'codeminer_tools.repositories.cvs',
+    'git': 'codeminer_tools.repositories.git',
+    'hg': 'codeminer_tools.repositories.hg',
+    'svn': 'codeminer_tools.repositories.svn',
+}
+
+
+class RepositoryRegistry:
+    """ How to open each repository a record can refer to, and the handles
+    opened in this process
+
+    Records only carry a repository identifier (its origin by default).
+    The registry maps identifiers to an opener: a backend name from
+    BACKENDS or any picklable callable, with its arguments. Each process
+    opens a repository the first time one of its records is attached and
+    keeps the handle, a forked child starts with none of its parent's.
+
+        registry.register(url, 'svn', url)
+        with multiprocessing.Pool(initializer=initialize,
+                                  initargs=(registry.specs,)) as pool:
+            pool.map(analyse, [detach(changeset) for changeset in history])
+    """
+
+    def __init__(self):
+        self.specs = {}
+        self._handles = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def register(self, identifier, opener, *args, **kwargs):
+        self.specs[identifier] = (opener, args, kwargs)
+
+    def add(self, repository, opener=None, *args, **kwargs):
+        """ Use an already open repository in this process, and register
+        how other processes can open it if opener is given"""
+        if opener is not None:
+            self.register(repository.origin, opener, *args, **kwargs)
+        self._check_process()
+        self._handles[repository.origin] = repository
+
+    def get(self, identifier):
+        """ This process's handle on a repository, opened if needed"""
+        self._check_process()
+        with self._lock:
+            if identifier not in self._handles:
+                try:
+                    opener, args, kwargs = self.specs[identifier]
+                except KeyError:
+                    raise KeyError(
+                        "No repository registered as {0}".format(identifier))
+                if isinstance(opener, str):
+                    opener = importlib.import_module(
+                        BACKENDS[opener]).open_repository
+                self._handles[identifier] = opener(*args, **kwargs)
+            return self._handles[identifier]
+
+    def _check_process(self):
+        # Clients (hglib servers, subprocess pipes) can't cross a fork
+        if self._pid != os.getpid():
+            self._handles = {}
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+
+# Used by records unless they are given another registry
+registry = RepositoryRegistry()
+
+
+def initialize(specs):
+    """ multiprocessing initializer giving a worker the registrations of
+    its parent (needed with the spawn start method)"""
+    registry.specs.update(specs)
+
+
+class FileRecord:
+    """ RepositoryFile as plain data"""
+
+    __slots__ = ('repository', 'path', 'revision')
+
+    def __init__(self, repository, path, revision):
+        self.repository = repository
+        self.path = path
+        self.revision = revision
+
+    @classmethod
+    def detach(cls, repository_file, repository=None):
+        if repository is None:
+            repository = repository_file.repository.origin
+        return cls(repository, repository_file.path, repository_file.revision)
+
+    def attach(self, registry=registry):
+        return RepositoryFile(registry.get(self.repository), self.path,
+                              self.revision)
+
+    def read(self, registry=registry):
+        return self.attach(registry).read()
+
+    def __getstate__(self):
+        return (self.repository, self.path, self.revision)
+
+    def __setstate__(self, state):
+        self.repository, self.path, self.revision = state
+
+    def __eq__(self, other):
+        return self.__getstate__() == other.__getstate__()
+
+    def __repr__(self):
+        return "<FileRecord {repository}: {path}@{revision}>".format(
+            repository=self.repository, path=self.path,
+            revision=self.revision)
+
+
+class ChangeRecord:
+    """ Change as plain data, referring to its repository by identifier"""
+
+    __slots__ = ('repository', 'action', 'previous_path', 'previous_revision',
+                 'current_path', 'current_revision', 'lines_added',
+                 'lines_removed', 'similarity')
+
+    def __init__(self, repository, action, previous_path, previous_revision,
+                 current_path, current_revision, lines_added=None,
+                 lines_removed=None, similarity=None):
+        self.repository = repository
+        self.action = action
+        self.previous_path = previous_path
+        self.previous_revision = previous_revision
+        self.current_path = current_path
+        self.current_revision = current_revision
+        self.lines_added = lines_added
+        self.lines_removed = lines_removed
+        self.similarity = similarity
+
+    @classmethod
+    def detach(cls, change, repository=None):
+        if repository is None:
+            repository = change.current_file.repository.origin
+        return cls(repository, change.action, change.previous_file.path,
+                   change.previous_file.revision, change.current_file.path,
+                   change.current_file.revision, change.lines_added,
+                   change.lines_removed, change.similarity)
+
+    def attach(self, registry=registry):
+        change = Change(registry.get(self.repository), self.previous_path,
+                        self.previous_revision, self.current_path,
+                        self.current_revision, self.action)
+        change.lines_added = self.lines_added
+        change.lines_removed = self.lines_removed
+        change.similarity = self.similarity
+        return change
+
+    @property
+    def previous_file(self):
+        return FileRecord(self.repository, self.previous_path,
+                          self.previous_revision)
+
+    @property
+    def current_file(self):
+        return FileRecord(self.repository, self.current_path,
+                          self.current_revision)
+
+    def __getstate__(self):
+        # The action goes as its value, cheaper to pickle than the enum
+        return (self.repository, self.action.value, self.previous_path,
+                self.previous_revision, self.current_path,
+                self.current_revision, self.lines_added, self.lines_removed,
+                self.similarity)
+
+    def __setstate__(self, state):
+        (self.repository, action, self.previous_path,
+         self.previous_revision, self.current_path, self.current_revision,
+         self.lines_added, self.lines_removed, self.similarity) = state
+        self.action = ChangeType(action)
+
+    def __eq__(self, other):
+        return self.__getstate__() == other.__getstate__()
+
+    def __repr__(self):
+        return "<ChangeRecord {repository}: {previous}@{previous_rev} => " \
+            "({action}) => {current}@{current_rev}>".format(
+                repository=self.repository, previous=self.previous_path,
+                previous_rev=self.previous_revision, action=self.action,
+                current=self.current_path,
+                current_rev=self.current_revision)
+
+
+class ChangeSetRecord:
+    """ ChangeSet as plain data, cheap to pickle and send to workers"""
+
+    __slots__ = ('repository', 'identifier', 'author', 'message',
+                 'timestamp', 'tags', 'changes')
+
+    def __init__(self, repository, identifier, author, message, timestamp,
+                 tags, changes):
+        self.repository = repository
+        self.identifier = identifier
+        self.author = author
+        self.message = message
+        self.timestamp = timestamp
+        self.tags = tags
+        self.changes = changes
+
+    @classmethod
+    def detach(cls, changeset, repository=None):
+        changes = [ChangeRecord.detach(change, repository)
+                   for change in changeset.changes]
+        if repository is None and changes:
+            repository = changes[0].repository
+        author = changeset.author
+        return cls(repository, changeset.identifier,
+                   None if author is None else str(author),
+                   changeset.message, changeset.timestamp, changeset.tags,
+                   changes)
+
+    def attach(self, registry=registry):
+        return ChangeSet([change.attach(registry) for change in self.changes],
+                         self.tags, self.identifier, self.author,
+                         self.message, self.timestamp)
+
+    def __getstate__(self):
+        return (self.repository, self.identifier, self.author, self.message,
+                self.timestamp, self.tags, self.changes)
+
+    def __setstate__(self, state):
+        (self.repository, self.identifier, self.author, self.message,
+         self.timestamp, self.tags, self.changes) = state
+
+    def __repr__(self):
+        return "<ChangeSetRecord {repository}: {identifier}>".format(
+            repository=self.repository, identifier=self.identifier)
+
+
+def detach(obj, repository=None):
+    """ Plain data record of a ChangeSet, Change or RepositoryFile"""
+    if isinstance(obj, ChangeSet):
+        return ChangeSetRecord.detach(obj, repository)
+    elif isinstance(obj, Change):
+        return ChangeRecord.detach(obj, repository)
+    elif isinstance(obj, RepositoryFile):
+        return FileRecord.detach(obj, repository)
+    raise TypeError("Can't detach {0!r}".format(obj))
@@ -1,19 +1,44 @@
-import os
+import hashlib
 
 
-def change_dir(function):
-    def wrap_inner(*args, **kwargs):
-        self = args[0]
-        old_path = os.getcwd()
-        os.chdir(self.path)
-        result = function(*args, **kwargs)
-        os.chdir(old_path)
-        return result
-    return wrap_inner
+class Repository:
+    # Optional codeminer_tools.cache.ResultCache for results which can't
+    # change, such as the contents of a file at a given revision
+    cache = None
 
+    # Whether methods may be called from several threads at once. Backends
+    # talking to a single client process (GitPython, the Hg command server)
+    # may not, those spawning a process per command may
+    thread_safe = False
 
-class Repository:
     def __init__(self, username=None, password=None, workspace=None):
         self.username = username
         self.password = password
-        self.workspace = workspace
\ No newline at end of file
+        self.workspace = workspace
+
+    def get_history_state(self):
+        """ Marker of how far history goes, which walk_history(since=...)
+        takes to only return what came after it. None if the backend can't
+        walk incrementally"""
+        return None
+
+    def get_file_size(self, path, revision=None):
+        """ Size in bytes of a file known without reading it, or None"""
+        return None
+
+    def get_content_id(self, path, revision=None):
+        """ Identifier of a file's contents known without reading them, or
+        None. Files with the same contents get the same identifier"""
+        return None
+
+    def content_digest(self, data):
+        """ Digest of file contents, comparable with get_content_id"""
+        return hashlib.sha1(data).hexdigest()
+
+    def cached(self, producer, *identity):
+        """ Bytes returned by `producer`, going through the cache (if any)
+        under the key of `identity` in this repository's origin"""
+        if self.cache is None:
+            return producer()
+        return self.cache.fetch(self.cache.key(self.origin, *identity),
+                                producer)
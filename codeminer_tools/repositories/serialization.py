@@ -0,0 +1,410 @@
+import datetime
+import json
+import mmap
+import struct
+import zlib
+
+from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
+
+MAGIC = b'CMCS\x02'
+TRAILER_MAGIC = b'CMCE'
+
+# Changesets per block. Blocks are the unit of compression and of random
+# access: seeking to a changeset decodes the block it is in
+BLOCK_SIZE = 1000
+
+# Identifier index entries per page. Only the first key of each page is
+# binary searched, the page is then scanned
+INDEX_PAGE_SIZE = 128
+
+# Block header: flags, decoded length, stored length
+BLOCK_HEADER = struct.Struct('<BII')
+# Block table entry: offset, number of changesets
+BLOCK_ENTRY = struct.Struct('<QI')
+# Page table entry: offset of the page
+PAGE_ENTRY = struct.Struct('<Q')
+# Trailer: offset and length of the block table, offset and length of the
+# page table, magic
+TRAILER = struct.Struct('<QQQQ4s')
+FLOAT = struct.Struct('<d')
+
+COMPRESSED = 1
+
+# Value tags
+NONE, STRING, BYTES, INTEGER, FLOAT_VALUE, DATETIME, TRUE, FALSE = range(8)
+
+
+def encode_varint(value, output):
+    while value >= 0x80:
+        output.append((value & 0x7f) | 0x80)
+        value >>= 7
+    output.append(value)
+
+
+def decode_varint(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def index_key(identifier):
+    """ Bytes a changeset identifier is sorted and looked up by in the
+    index"""
+    if isinstance(identifier, bytes):
+        return b'b' + identifier
+    elif isinstance(identifier, str):
+        return b's' + identifier.encode('utf-8', 'surrogatepass')
+    # Numbers, SVN revisions say
+    return b'r' + repr(identifier).encode()
+
+
+class BlockEncoder:
+    """ Builds one block: a table of the strings used in it, then the
+    changesets referring to them by index"""
+
+    def __init__(self):
+        self.strings = {}
+        self.records = bytearray()
+        self.count = 0
+
+    def string(self, value, output):
+        index = self.strings.setdefault(value, len(self.strings))
+        encode_varint(index, output)
+
+    def value(self, value, output):
+        # bool is an int, check it first
+        if value is None:
+            output.append(NONE)
+        elif value is True:
+            output.append(TRUE)
+        elif value is False:
+            output.append(FALSE)
+        elif isinstance(value, str):
+            output.append(STRING)
+            self.string(value, output)
+        elif isinstance(value, bytes):
+            output.append(BYTES)
+            encode_varint(len(value), output)
+            output.extend(value)
+        elif isinstance(value, int):
+            output.append(INTEGER)
+            # Zigzag, so small negative numbers stay small
+            encode_varint(value * 2 if value >= 0 else -value * 2 - 1, output)
+        elif isinstance(value, float):
+            output.append(FLOAT_VALUE)
+            output.extend(FLOAT.pack(value))
+        elif isinstance(value, datetime.datetime):
+            output.append(DATETIME)
+            self.string(value.isoformat(), output)
+        else:
+            # Authors can be backend objects (git.Actor)
+            output.append(STRING)
+            self.string(str(value), output)
+
+    def add(self, changeset):
+        output = self.records
+        self.value(changeset.identifier, output)
+        self.value(changeset.author, output)
+        self.value(changeset.message, output)
+        self.value(changeset.timestamp, output)
+        self.value(json.dumps(changeset.tags), output)
+        encode_varint(len(changeset.changes), output)
+        for change in changeset.changes:
+            output.append(change.action.value)
+            self.value(change.previous_file.path, output)
+            self.value(change.previous_file.revision, output)
+            self.value(change.current_file.path, output)
+            self.value(change.current_file.revision, output)
+            self.value(change.lines_added, output)
+            self.value(change.lines_removed, output)
+            self.value(change.similarity, output)
+        self.count += 1
+
+    def encode(self):
+        output = bytearray()
+        encode_varint(len(self.strings), output)
+        for string in self.strings:
+            encoded = string.encode('utf-8', 'surrogatepass')
+            encode_varint(len(encoded), output)
+            output.extend(encoded)
+        encode_varint(self.count, output)
+        output.extend(self.records)
+        return bytes(output)
+
+
+class BlockDecoder:
+
+    def __init__(self, data, repository=None):
+        self.data = data
+        self.repository = repository
+        count, offset = decode_varint(data, 0)
+        self.strings = []
+        for _ in range(count):
+            length, offset = decode_varint(data, offset)
+            self.strings.append(
+                bytes(data[offset:offset + length]).decode(
+                    'utf-8', 'surrogatepass'))
+            offset += length
+        self.count, self.offset = decode_varint(data, offset)
+
+    def value(self):
+        data = self.data
+        tag = data[self.offset]
+        self.offset += 1
+        if tag == NONE:
+            return None
+        elif tag == TRUE:
+            return True
+        elif tag == FALSE:
+            return False
+        elif tag == STRING:
+            index, self.offset = decode_varint(data, self.offset)
+            return self.strings[index]
+        elif tag == BYTES:
+            length, self.offset = decode_varint(data, self.offset)
+            value = bytes(data[self.offset:self.offset + length])
+            self.offset += length
+            return value
+        elif tag == INTEGER:
+            value, self.offset = decode_varint(data, self.offset)
+            return value // 2 if value % 2 == 0 else -(value + 1) // 2
+        elif tag == FLOAT_VALUE:
+            value, = FLOAT.unpack_from(data, self.offset)
+            self.offset += FLOAT.size
+            return value
+        elif tag == DATETIME:
+            index, self.offset = decode_varint(data, self.offset)
+            return datetime.datetime.fromisoformat(self.strings[index])
+        raise ValueError("Unknown value tag {0}".format(tag))
+
+    def __iter__(self):
+        for _ in range(self.count):
+            yield self.changeset()
+
+    def changeset(self):
+        identifier = self.value()
+        author = self.value()
+        message = self.value()
+        timestamp = self.value()
+        tags = json.loads(self.value())
+        count, self.offset = decode_varint(self.data, self.offset)
+        changes = []
+        for _ in range(count):
+            action = ChangeType(self.data[self.offset])
+            self.offset += 1
+            change = Change(self.repository, self.value(), self.value(),
+                            self.value(), self.value(), action)
+            change.lines_added = self.value()
+            change.lines_removed = self.value()
+            change.similarity = self.value()
+            changes.append(change)
+        return ChangeSet(changes, tags, identifier, author, message,
+                         timestamp)
+
+
+class ChangeSetWriter:
+    """ Streams ChangeSets to a file in a compact block format
+
+    Changesets are buffered into blocks of `block_size`, each with its own
+    table of the strings (paths, authors, revisions...) it uses and
+    optionally zlib-compressed. Closing the writer appends a table of the
+    blocks and a sorted index of the changeset identifiers, which
+    ChangeSetReader searches in place to seek. Apart from the index keys
+    only the block being built is kept in memory.
+
+        with ChangeSetWriter('history.cms') as writer:
+            for changeset in repository.walk_history():
+                writer.write(changeset)
+    """
+
+    def __init__(self, path, block_size=BLOCK_SIZE, compress=True,
+                 compression_level=6):
+        self.path = path
+        self.block_size = block_size
+        self.compress = compress
+        self.compression_level = compression_level
+        self.output = open(path, 'wb')
+        self.output.write(MAGIC)
+        self.blocks = []
+        self.keys = []
+        self.block = BlockEncoder()
+
+    def write(self, changeset):
+        self.keys.append((index_key(changeset.identifier), len(self.blocks),
+                          self.block.count))
+        self.block.add(changeset)
+        if self.block.count >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if not self.block.count:
+            return
+        data = self.block.encode()
+        flags = 0
+        stored = data
+        if self.compress:
+            compressed = zlib.compress(data, self.compression_level)
+            if len(compressed) < len(data):
+                flags |= COMPRESSED
+                stored = compressed
+        self.blocks.append((self.output.tell(), self.block.count))
+        self.output.write(BLOCK_HEADER.pack(flags, len(data), len(stored)))
+        self.output.write(stored)
+        self.block = BlockEncoder()
+
+    def close(self):
+        if self.output.closed:
+            return
+        self.flush()
+        blocks_offset = self.output.tell()
+        for offset, count in self.blocks:
+            self.output.write(BLOCK_ENTRY.pack(offset, count))
+
+        # A changeset written again replaces the earlier one: the sort is
+        # stable, keep the last of each key
+        self.keys.sort(key=lambda entry: entry[0])
+        pages = []
+        page = bytearray()
+        entries = 0
+        for index, (key, block, position) in enumerate(self.keys):
+            if index + 1 < len(self.keys) and self.keys[index + 1][0] == key:
+                continue
+            if entries % INDEX_PAGE_SIZE == 0:
+                self.output.write(page)
+                pages.append(self.output.tell())
+                page = bytearray()
+            encode_varint(len(key), page)
+            page.extend(key)
+            encode_varint(block, page)
+            encode_varint(position, page)
+            entries += 1
+        self.output.write(page)
+        self.keys = []
+
+        pages_offset = self.output.tell()
+        for offset in pages:
+            self.output.write(PAGE_ENTRY.pack(offset))
+        self.output.write(TRAILER.pack(blocks_offset, len(self.blocks),
+                                       pages_offset, len(pages),
+                                       TRAILER_MAGIC))
+        self.output.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ChangeSetReader:
+    """ Reads files written by ChangeSetWriter through mmap
+
+    Iterating decodes the blocks in order. Indexing by changeset
+    identifier, or `seek`, binary searches the index pages in the mapping
+    and only decodes the block holding it. Changes are attached to
+    `repository` (None by default) so their files can be read when it is
+    given.
+    """
+
+    def __init__(self, path, repository=None):
+        self.path = path
+        self.repository = repository
+        with open(path, 'rb') as input_file:
+            self.data = mmap.mmap(input_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError("{0} is not a changeset file".format(path))
+        (blocks_offset, block_count, self.pages_offset, self.page_count,
+         magic) = TRAILER.unpack_from(self.data, len(self.data) - TRAILER.size)
+        if magic != TRAILER_MAGIC:
+            raise ValueError("{0} is truncated".format(path))
+        self.blocks = [
+            BLOCK_ENTRY.unpack_from(self.data,
+                                    blocks_offset + number * BLOCK_ENTRY.size)
+            for number in range(block_count)]
+        # Index pages run from the end of the block table to the page table
+        self.index_end = self.pages_offset
+
+    def close(self):
+        self.data.close()
+
+    def block(self, number):
+        offset, count = self.blocks[number]
+        flags, length, stored = BLOCK_HEADER.unpack_from(self.data, offset)
+        start = offset + BLOCK_HEADER.size
+        data = self.data[start:start + stored]
+        if flags & COMPRESSED:
+            data = zlib.decompress(data, bufsize=length)
+        return BlockDecoder(data, self.repository)
+
+    def _page(self, number):
+        offset, = PAGE_ENTRY.unpack_from(
+            self.data, self.pages_offset + number * PAGE_ENTRY.size)
+        return offset
+
+    def _entry(self, offset):
+        length, offset = decode_varint(self.data, offset)
+        key = self.data[offset:offset + length]
+        block, offset = decode_varint(self.data, offset + length)
+        position, offset = decode_varint(self.data, offset)
+        return key, block, position, offset
+
+    def locate(self, identifier):
+        """ (block, position) of the changeset with identifier, or None"""
+        key = index_key(identifier)
+        # Last page starting at or before key
+        low, high = 0, self.page_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(self._page(middle))[0] <= key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            return None
+        offset = self._page(low - 1)
+        end = (self._page(low) if low < self.page_count
+               else self.index_end)
+        while offset < end:
+            entry_key, block, position, offset = self._entry(offset)
+            if entry_key == key:
+                return block, position
+            elif entry_key > key:
+                break
+        return None
+
+    def seek(self, identifier):
+        """ Changesets from the one with identifier onwards"""
+        location = self.locate(identifier)
+        if location is None:
+            raise KeyError(identifier)
+        block, position = location
+        for number in range(block, len(self.blocks)):
+            for index, changeset in enumerate(self.block(number)):
+                if number > block or index >= position:
+                    yield changeset
+
+    def __getitem__(self, identifier):
+        return next(self.seek(identifier))
+
+    def __contains__(self, identifier):
+        return self.locate(identifier) is not None
+
+    def __iter__(self):
+        for number in range(len(self.blocks)):
+            yield from self.block(number)
+
+    def __len__(self):
+        return sum(count for offset, count in self.blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,143 @@
+import hashlib
+import random
+
+# Default minimum similarity for ChangeSet.optimize to pair files up
+DEFAULT_THRESHOLD = 0.5
+
+# LSH bands the signature is split in, and rows (hash values) per band.
+# Two files of Jaccard similarity J share a bucket with probability
+# 1 - (1 - J ** ROWS) ** BANDS: 99.7% at J = 0.5 but 1.4% at J = 0.07,
+# files sharing a few boilerplate lines. Bands of 2 rows let through 27%
+# of the latter, and 4 rows dropped 13% of the pairs at the threshold
+BANDS = 40
+ROWS = 3
+
+# Number of hash functions in a MinHash signature
+NUM_PERMUTATIONS = BANDS * ROWS
+
+# Candidates whose estimated similarity is this far below the threshold
+# aren't scored. Three standard deviations of the estimate at J = 0.5
+ESTIMATE_SLACK = 0.15
+
+# Prime modulus of the universal hash functions
+PRIME = (1 << 61) - 1
+
+# Fixed seed, signatures are comparable between runs and processes
+SEED = 0x5eed
+
+
+def line_hashes(data):
+    """ Set of the hashes of the non-blank lines of data, ignoring
+    surrounding whitespace"""
+    hashes = set()
+    for line in data.split(b'\n'):
+        line = line.strip()
+        if line:
+            hashes.add(int.from_bytes(
+                hashlib.blake2b(line, digest_size=8).digest(), 'little'))
+    return hashes
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+class MinHash:
+    """ Fixed-size signatures of sets whose agreement estimates their
+    Jaccard similarity"""
+
+    def __init__(self, num_permutations=NUM_PERMUTATIONS, seed=SEED):
+        generator = random.Random(seed)
+        self.permutations = [
+            (generator.randrange(1, PRIME), generator.randrange(0, PRIME))
+            for _ in range(num_permutations)]
+
+    def signature(self, hashes):
+        return tuple(min((a * value + b) % PRIME for value in hashes)
+                     for a, b in self.permutations)
+
+    @staticmethod
+    def estimate(first, second):
+        return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+class LSHIndex:
+    """ Buckets MinHash signatures by band so that similar ones can be
+    found without comparing every pair"""
+
+    def __init__(self, bands=BANDS):
+        self.bands = bands
+        self.buckets = {}
+
+    def _bands(self, signature):
+        rows = len(signature) // self.bands
+        for band in range(self.bands):
+            yield band, signature[band * rows:(band + 1) * rows]
+
+    def add(self, key, signature):
+        for band in self._bands(signature):
+            self.buckets.setdefault(band, []).append(key)
+
+    def candidates(self, signature):
+        found = set()
+        for band in self._bands(signature):
+            found.update(self.buckets.get(band, ()))
+        return found
+
+
+def find_matches(targets, sources, threshold=DEFAULT_THRESHOLD,
+                 minhash=None, bands=BANDS):
+    """ Most similar source of each target
+
+    Sources are indexed with MinHash/LSH so each target is only compared
+    with the few sources likely to be similar. Candidates whose signatures
+    estimate them well below `threshold` are dropped, the others are
+    scored by the exact Jaccard similarity of their sets of lines. Empty
+    files are never matched.
+
+    Parameters
+    ----------
+    targets : dict
+        Key to the contents (bytes) of the files to find an origin for
+    sources : dict
+        Key to the contents (bytes) of the possible origins
+    threshold : float, optional
+        Minimum similarity, between 0 and 1, of a match
+
+    Returns
+    -------
+    dict
+        Target key to (source key, similarity) for the targets with a match
+    """
+    if minhash is None:
+        minhash = MinHash()
+
+    index = LSHIndex(bands)
+    source_lines = {}
+    source_signatures = {}
+    for key, data in sources.items():
+        lines = line_hashes(data)
+        if lines:
+            source_lines[key] = lines
+            source_signatures[key] = minhash.signature(lines)
+            index.add(key, source_signatures[key])
+
+    matches = {}
+    for key, data in targets.items():
+        lines = line_hashes(data)
+        if not lines:
+            continue
+        signature = minhash.signature(lines)
+        best = None
+        for candidate in sorted(index.candidates(signature)):
+            if (minhash.estimate(signature, source_signatures[candidate]) <
+                    threshold - ESTIMATE_SLACK):
+                continue
+            score = jaccard(lines, source_lines[candidate])
+            if score >= threshold and (best is None or score > best[1]):
+                best = (candidate, score)
+        if best is not None:
+            matches[key] = best
+    return matches
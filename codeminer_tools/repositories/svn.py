@@ -11,11 +11,18 @@ import xmltodict
 
 from codeminer_tools.repositories.repository import Repository
 from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
-from codeminer_tools.clients.svn import SVNClient, SVNException
+from codeminer_tools.clients.svn import (AsyncSVNClient, SVNClient,
+                                         SVNException)
+
+
+def open_repository(path, workspace=None, **kwargs):
+    return SVNRepository(path, workspace=workspace, **kwargs)
 
 
 class SVNRepository(Repository):
 
+    thread_safe = True
+
     def __init__(self, path, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if os.path.exists(path):
@@ -32,6 +39,9 @@ class SVNRepository(Repository):
             self.working_copy = os.path.join(checkout_path, os.path.basename(path))
             self.cleanup = True
         self.client = SVNClient(username=self.username, password=self.password, cwd=self.working_copy)
+        self.async_client = AsyncSVNClient(
+            username=self.username, password=self.password,
+            cwd=self.working_copy)
         self.origin = self.info()['url']
         self.name = 'SVN'
 
@@ -50,16 +60,70 @@ class SVNRepository(Repository):
         out, err = self.client.info(xml=True, target=path, revision=revision)
         return xmltodict.parse(out)['info']['entry']
 
-    def walk_history(self):
-        out, err = self.client.log(xml=True, verbose=True)
+    def get_history_state(self):
+        return int(self.info()['@revision'])
+
+    def walk_history(self, since=None):
+        """ Changesets newest first, only those after revision `since`
+        (see get_history_state) if given"""
+        revision = None
+        if since is not None:
+            revision = self._revisions_after(since, self.get_history_state())
+            if revision is None:
+                return
+        log = self.client.log(xml=True, verbose=True, revision=revision,
+                              stream=True)
         for revision, author, timestamp, message, changes in self._read_log_xml(
-                out):
+                log):
             yield ChangeSet(changes, None, revision, author, message, timestamp)
 
     def get_changeset(self, revision=None):
-        out, err = self.client.log(
-            xml=True, revision=revision, verbose=True, limit=1)
-        print(out, err)
+        def log():
+            out, err = self.client.log(
+                xml=True, revision=revision, verbose=True, limit=1)
+            return out
+
+        if self._is_immutable(revision):
+            out = self.cached(log, 'log', revision)
+        else:
+            out = log()
+        revision, author, timestamp, message, changes = self._read_log_xml(
+            out).__next__()
+        return ChangeSet(changes, None, revision, author, message, timestamp)
+
+    @staticmethod
+    def _revisions_after(since, head):
+        # Log range of the revisions after `since`, None if there are none
+        if int(since) >= head:
+            return None
+        return '{0}:{1}'.format(head, int(since) + 1)
+
+    async def awalk_history(self, since=None):
+        revision = None
+        if since is not None:
+            out, err = await self.async_client.info(xml=True)
+            revision = self._revisions_after(
+                since, int(xmltodict.parse(out)['info']['entry']['@revision']))
+            if revision is None:
+                return
+        out, err = await self.async_client.log(
+            xml=True, verbose=True, revision=revision)
+        for revision, author, timestamp, message, changes in self._read_log_xml(
+                out):
+            yield ChangeSet(changes, None, revision, author, message, timestamp)
+
+    async def aget_changeset(self, revision=None):
+        # Same cache entries as get_changeset
+        cached = self.cache is not None and self._is_immutable(revision)
+        out = None
+        if cached:
+            key = self.cache.key(self.origin, 'log', revision)
+            out = self.cache.get(key)
+        if out is None:
+            out, err = await self.async_client.log(
+                xml=True, revision=revision, verbose=True, limit=1)
+            if cached:
+                self.cache.put(key, out)
         revision, author, timestamp, message, changes = self._read_log_xml(
             out).__next__()
         return ChangeSet(changes, None, revision, author, message, timestamp)
@@ -76,9 +140,13 @@ class SVNRepository(Repository):
         return properties
 
     def _read_log_xml(self, log):
-        tree = ET.fromstring(log)
-        for logentry in tree.findall('logentry'):
-            yield self._read_logentry_xml(logentry)
+        # Parse incrementally so a full history log never sits in memory
+        if isinstance(log, bytes):
+            log = BytesIO(log)
+        for event, element in ET.iterparse(log):
+            if element.tag == 'logentry':
+                yield self._read_logentry_xml(element)
+                element.clear()
 
     def _read_logentry_xml(self, logentry):
         # SVN does *not* require author, date, or messages... it's
@@ -137,8 +205,39 @@ class SVNRepository(Repository):
         return revision, author, date, message, changes
 
     def get_file_contents(self, path, revision=None):
+        target = path
         if revision:
-            path = '{path}@{revision}'.format(path=path, revision=revision)
+            target = '{path}@{revision}'.format(path=path, revision=revision)
         # , ignore_keywords=True only works SVN 1.7+
-        out, err = self.client.cat(path)
+        if self.cache is not None and self._is_immutable(revision):
+            return BytesIO(self.cached(
+                lambda: self.client.cat(target)[0], 'cat', path, revision))
+        return self.client.cat(target, stream=True)
+
+    def get_file_size(self, path, revision=None):
+        if revision:
+            path = '{path}@{revision}'.format(path=path, revision=revision)
+        out, err = self.client.list(target=path, xml=True)
+        size = xmltodict.parse(out)['lists']['list']['entry'].get('size')
+        return int(size) if size is not None else None
+
+    @staticmethod
+    def _is_immutable(revision):
+        # Only numbered revisions, HEAD/BASE/dates move
+        return revision is not None and str(revision).isdigit()
+
+    async def aget_file_contents(self, path, revision=None):
+        # Same cache entries as get_file_contents
+        cached = self.cache is not None and self._is_immutable(revision)
+        if cached:
+            key = self.cache.key(self.origin, 'cat', path, revision)
+            data = self.cache.get(key)
+            if data is not None:
+                return BytesIO(data)
+        target = path
+        if revision:
+            target = '{path}@{revision}'.format(path=path, revision=revision)
+        out, err = await self.async_client.cat(target)
+        if cached:
+            self.cache.put(key, out)
         return BytesIO(out)
@@ -0,0 +1,115 @@
+from array import array
+
+from codeminer_tools.repositories.change import ChangeType, Change
+
+# Stored in place of a missing path or revision (adds and removes)
+NONE = -1
+
+# ChangeType by value, for turning the action column back into enums
+ACTIONS = {action.value: action for action in ChangeType}
+
+
+class Interner:
+    """ Gives each distinct value a small integer id"""
+
+    __slots__ = ('values', 'ids')
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def intern(self, value):
+        if value is None:
+            return NONE
+        identifier = self.ids.get(value)
+        if identifier is None:
+            identifier = len(self.values)
+            self.ids[value] = identifier
+            self.values.append(value)
+        return identifier
+
+    def lookup(self, identifier):
+        if identifier == NONE:
+            return None
+        return self.values[identifier]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ChangeTable:
+    """ Columnar store of the changes of a repository's history
+
+    Each change costs a few machine integers instead of three objects:
+    paths, revisions and changeset identifiers are interned once and
+    referred to by id from arrays, and the action is kept as its
+    ChangeType value. Change objects are only built when a row is looked
+    at, so whole histories can be kept in memory and scanned.
+
+        table = ChangeTable(repository)
+        for changeset in repository.walk_history():
+            table.add_changeset(changeset)
+        moves = [change for change in table
+                 if change.action == ChangeType.move]
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.paths = Interner()
+        self.revisions = Interner()
+        self.changesets = Interner()
+        self.previous_path = array('l')
+        self.previous_revision = array('l')
+        self.current_path = array('l')
+        self.current_revision = array('l')
+        self.action = array('b')
+        self.changeset = array('l')
+
+    def append(self, change, changeset=None):
+        """ Add a change, optionally with the identifier of its changeset"""
+        self.previous_path.append(
+            self.paths.intern(change.previous_file.path))
+        self.previous_revision.append(
+            self.revisions.intern(change.previous_file.revision))
+        self.current_path.append(self.paths.intern(change.current_file.path))
+        self.current_revision.append(
+            self.revisions.intern(change.current_file.revision))
+        self.action.append(change.action.value)
+        self.changeset.append(self.changesets.intern(changeset))
+
+    def extend(self, changes, changeset=None):
+        for change in changes:
+            self.append(change, changeset)
+
+    def add_changeset(self, changeset):
+        self.extend(changeset.changes, changeset.identifier)
+
+    def changeset_of(self, index):
+        """ Identifier of the changeset the change at index belongs to"""
+        return self.changesets.lookup(self.changeset[index])
+
+    def rows(self, identifier):
+        """ Indices of the changes of a changeset"""
+        changeset = self.changesets.ids.get(identifier)
+        if changeset is None:
+            return []
+        return [index for index, value in enumerate(self.changeset)
+                if value == changeset]
+
+    def __len__(self):
+        return len(self.action)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Change(
+            self.repository,
+            self.paths.lookup(self.previous_path[index]),
+            self.revisions.lookup(self.previous_revision[index]),
+            self.paths.lookup(self.current_path[index]),
+            self.revisions.lookup(self.current_revision[index]),
+            ACTIONS[self.action[index]])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
@@ -0,0 +1,149 @@
+import datetime
+import hashlib
+from io import BytesIO
+import mock
+import unittest
+
+from codeminer_tools.repositories.change import (ChangeType, Change,
+                                                 ChangeSet, to_epoch)
+from codeminer_tools.repositories.file import RepositoryFile
+
+
+class TestChangeSetOptimize(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = mock.Mock()
+        self.repository.name = 'Mock'
+        self.repository.get_content_id.return_value = None
+        self.repository.content_digest.side_effect = \
+            lambda data: hashlib.sha1(data).hexdigest()
+        self.repository.get_file_contents.side_effect = \
+            lambda path, revision=None: BytesIO(b'contents')
+
+    def change(self, previous_path, current_path, action):
+        return Change(self.repository, previous_path, '1', current_path, '2',
+                      action)
+
+    def test_hashable(self):
+        first = self.change('a.txt', 'b.txt', ChangeType.copy)
+        second = self.change('a.txt', 'b.txt', ChangeType.copy)
+        self.assertEqual(hash(first), hash(second))
+        self.assertEqual(len({first, second}), 1)
+
+    def test_copy_and_remove_is_move(self):
+        copy = self.change('a.txt', 'b.txt', ChangeType.copy)
+        remove = self.change('a.txt', None, ChangeType.remove)
+        add = self.change(None, 'c.txt', ChangeType.add)
+        changeset = ChangeSet([copy, remove, add], None, '2', 'author',
+                              'message', 0)
+        changeset.optimize()
+        self.assertEqual(changeset.changes, [
+            self.change('a.txt', 'b.txt', ChangeType.move), add])
+
+    def test_moved_to_several_files(self):
+        changeset = ChangeSet([
+            self.change('a.txt', 'b.txt', ChangeType.copy),
+            self.change('a.txt', 'c.txt', ChangeType.copy),
+            self.change('a.txt', None, ChangeType.remove),
+            self.change('d.txt', None, ChangeType.remove)],
+            None, '2', 'author', 'message', 0)
+        changeset.optimize()
+        self.assertEqual(changeset.changes, [
+            self.change('a.txt', 'b.txt', ChangeType.move),
+            self.change('a.txt', 'c.txt', ChangeType.move),
+            self.change('d.txt', None, ChangeType.remove)])
+
+    def test_modified_copy_is_derived(self):
+        self.repository.get_file_contents.side_effect = \
+            lambda path, revision=None: BytesIO(path.encode())
+        changeset = ChangeSet(
+            [self.change('a.txt', 'b.txt', ChangeType.copy)],
+            None, '2', 'author', 'message', 0)
+        changeset.optimize()
+        self.assertEqual(changeset.changes[0].action, ChangeType.derived)
+
+    def test_digest_without_reading(self):
+        self.repository.get_content_id.side_effect = \
+            lambda path, revision=None: 'same'
+        changeset = ChangeSet(
+            [self.change('a.txt', 'b.txt', ChangeType.copy)],
+            None, '2', 'author', 'message', 0)
+        changeset.optimize()
+        self.assertEqual(changeset.changes[0].action, ChangeType.copy)
+        self.assertFalse(self.repository.get_file_contents.called)
+
+    def test_detect_similar(self):
+        contents = {
+            ('a.txt', '1'): b'a\nb\nc\nd',
+            ('b.txt', '2'): b'a\nb\nc\nd',
+            ('c.txt', '1'): b'e\nf\ng\nh',
+            ('d.txt', '2'): b'e\nf\ng\ni',
+            ('e.txt', '2'): b'unrelated',
+            ('f.txt', '1'): b'j\nk\nl\nm',
+            ('g.txt', '2'): b'j\nk\nl\nm'}
+        self.repository.get_file_contents.side_effect = \
+            lambda path, revision=None: BytesIO(contents[(path, revision)])
+        changeset = ChangeSet([
+            self.change(None, 'b.txt', ChangeType.add),
+            self.change('a.txt', None, ChangeType.remove),
+            self.change(None, 'd.txt', ChangeType.add),
+            self.change('c.txt', None, ChangeType.remove),
+            self.change(None, 'e.txt', ChangeType.add),
+            self.change(None, 'g.txt', ChangeType.add)],
+            None, '2', 'author', 'message', 0)
+        changeset.optimize(
+            threshold=0.5,
+            sources=[RepositoryFile(self.repository, 'f.txt', '1')])
+        self.assertEqual(changeset.changes, [
+            self.change('a.txt', 'b.txt', ChangeType.move),
+            self.change('c.txt', 'd.txt', ChangeType.derived),
+            self.change(None, 'e.txt', ChangeType.add),
+            self.change('f.txt', 'g.txt', ChangeType.copy)])
+        self.assertEqual(changeset.changes[0].similarity, 1.0)
+        self.assertEqual(changeset.changes[1].similarity, 3 / 5)
+        self.assertIsNone(changeset.changes[2].similarity)
+
+    def test_no_detection_by_default(self):
+        changeset = ChangeSet([
+            self.change(None, 'b.txt', ChangeType.add),
+            self.change('a.txt', None, ChangeType.remove)],
+            None, '2', 'author', 'message', 0)
+        changeset.optimize()
+        self.assertEqual([change.action for change in changeset.changes],
+                         [ChangeType.add, ChangeType.remove])
+
+    def test_measure(self):
+        contents = {'1': b'a\nb\nc\n', '2': b'a\nc\nd\ne\n'}
+        self.repository.get_file_contents.side_effect = \
+            lambda path, revision=None: BytesIO(contents[revision])
+        modify = self.change('a.txt', 'a.txt', ChangeType.modify)
+        add = self.change(None, 'b.txt', ChangeType.add)
+        changeset = ChangeSet([modify, add], None, '2', 'author', 'message',
+                              0)
+        changeset.measure()
+        self.assertEqual((modify.lines_added, modify.lines_removed), (2, 1))
+        self.assertEqual(modify.similarity, 4 / 7)
+        self.assertIsNone(add.lines_added)
+
+    def test_measure_known_counts(self):
+        self.repository.get_file_contents.side_effect = \
+            lambda path, revision=None: BytesIO(b'a\nb\nc\n')
+        modify = self.change('a.txt', 'a.txt', ChangeType.modify)
+        modify.lines_added, modify.lines_removed = 2, 1
+        modify.measure()
+        self.assertEqual((modify.lines_added, modify.lines_removed), (2, 1))
+        self.assertEqual(modify.similarity, 4 / 7)
+        self.repository.get_file_contents.assert_called_once_with(
+            'a.txt', revision='1')
+
+
+class TestToEpoch(unittest.TestCase):
+
+    def test_formats(self):
+        self.assertEqual(to_epoch(978307200), 978307200.0)
+        self.assertEqual(to_epoch('2001-01-01T00:00:00Z'), 978307200.0)
+        self.assertEqual(to_epoch('2001-01-01T00:00:00.500000Z'),
+                         978307200.5)
+        self.assertEqual(to_epoch(datetime.datetime.fromtimestamp(978307200)),
+                         978307200.0)
+        self.assertIsNone(to_epoch(None))
@@ -0,0 +1,102 @@
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import codeminer_tools.repositories.git as git
+import codeminer_tools.repositories.hg as hg
+
+REPOSITORIES = 8
+COMMITS = 5
+
+
+def run(commands, cwd, env=None):
+    for command in commands:
+        subprocess.run(shlex.split(command), cwd=cwd, env=env,
+                       stdout=subprocess.DEVNULL, check=True)
+
+
+def write(path, data):
+    with open(path, 'w') as out_file:
+        out_file.write(data)
+
+
+class TestConcurrentMining(unittest.TestCase):
+    """ Repositories mined side by side from a thread pool shouldn't see
+    each other's files. Clients aren't shared between threads, each task
+    opens its own"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.cwd = os.getcwd()
+
+    def make_git(self, number):
+        path = os.path.join(self.path, 'git{0}'.format(number))
+        os.mkdir(path)
+        env = dict(os.environ, GIT_AUTHOR_NAME='Test Author',
+                   GIT_AUTHOR_EMAIL='test@test.com',
+                   GIT_COMMITTER_NAME='Test Commiter',
+                   GIT_COMMITTER_EMAIL='test@test.com')
+        run(['git init -q'], path, env)
+        for commit in range(COMMITS):
+            write(os.path.join(path, 'file.txt'),
+                  'repository {0} commit {1}\n'.format(number, commit))
+            run(['git add file.txt',
+                 'git commit -q -m "Commit {0}"'.format(commit)], path, env)
+        return path
+
+    def make_hg(self, number):
+        path = os.path.join(self.path, 'hg{0}'.format(number))
+        os.mkdir(path)
+        run(['hg init'], path)
+        for commit in range(COMMITS):
+            write(os.path.join(path, 'file.txt'),
+                  'repository {0} commit {1}\n'.format(number, commit))
+            if commit == 0:
+                run(['hg add file.txt'], path)
+            run(['hg commit -m "Commit {0}" -u "Test User"'.format(commit)],
+                path)
+        return path
+
+    def mine(self, repository):
+        revisions = [changeset.identifier
+                     for changeset in repository.walk_history()]
+        return len(revisions), repository.get_file_contents('file.txt').read()
+
+    def check(self, open_repository, paths):
+        with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+            # Two rounds so the threads overlap
+            results = list(pool.map(
+                lambda path: self.mine(open_repository(path)), paths * 2))
+        for index, (count, contents) in enumerate(results):
+            number = index % len(paths)
+            self.assertEqual(count, COMMITS)
+            self.assertEqual(contents, 'repository {0} commit {1}\n'.format(
+                number, COMMITS - 1).encode())
+        self.assertEqual(os.getcwd(), self.cwd)
+
+    def test_git(self):
+        paths = [self.make_git(number) for number in range(REPOSITORIES)]
+        self.check(git.GitRepository, paths)
+
+    def test_hg(self):
+        paths = [self.make_hg(number) for number in range(REPOSITORIES)]
+        self.check(lambda path: hg.HgRepository(hg.hglib.open(path)), paths)
+
+    def test_relative_path(self):
+        path = self.make_git(0)
+        os.chdir(self.path)
+        self.addCleanup(os.chdir, self.cwd)
+        repository = git.GitRepository('git0')
+        os.chdir(self.cwd)
+        self.assertEqual(repository.path, path)
+        self.assertEqual(self.mine(repository),
+                         (COMMITS, b'repository 0 commit 4\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,16 @@
+import asyncio
+from io import BytesIO
 import mock
 import os
 import shlex
 import shutil
 import stat
 import tempfile
+import threading
 import time
 import unittest
 
+from codeminer_tools.cache import ResultCache
 from codeminer_tools.repositories import cvs, change
 from test_utils import run_shell_command
 
@@ -152,5 +156,404 @@ class TestCVSReads(unittest.TestCase):
         file_obj = sut.get_file_contents("b.txt")
         self.assertEqual(file_obj.read(), b"asdf")
 
+
+SAMPLE_LOG = """
+RCS file: /cvsroot/test/a.txt,v
+Working file: a.txt
+head: 1.2
+branch:
+locks: strict
+access list:
+symbolic names:
+\tRELEASE_1: 1.1
+keyword substitution: kv
+total revisions: 2;\tselected revisions: 2
+description:
+----------------------------
+revision 1.2
+date: 2016/10/12 01:10:00;  author: jacob;  state: Exp;  lines: +2 -1
+Second commit
+----------------------------
+revision 1.1
+date: 2016/10/12 01:00:00;  author: jacob;  state: Exp;
+First commit
+spanning two lines
+=============================================================================
+
+RCS file: /cvsroot/test/Attic/b.txt,v
+Working file: b.txt
+head: 1.2
+branch:
+locks: strict
+access list:
+symbolic names:
+keyword substitution: kv
+total revisions: 2;\tselected revisions: 2
+description:
+----------------------------
+revision 1.2
+date: 2016-10-12 01:10:04 +0000;  author: jacob;  state: dead;  lines: +0 -0
+Second commit
+----------------------------
+revision 1.1
+date: 2016-10-12 01:00:03 +0000;  author: jacob;  state: Exp;
+First commit
+spanning two lines
+=============================================================================
+"""
+
+
+class TestCVSHistory(unittest.TestCase):
+
+    def test_parse_log(self):
+        revisions = list(cvs.parse_log(SAMPLE_LOG.splitlines()))
+        self.assertEqual(
+            [(x.path, x.revision, x.action) for x in revisions],
+            [('a.txt', '1.2', change.ChangeType.modify),
+             ('a.txt', '1.1', change.ChangeType.add),
+             ('b.txt', '1.2', change.ChangeType.remove),
+             ('b.txt', '1.1', change.ChangeType.add)])
+        self.assertEqual(revisions[0].lines_added, 2)
+        self.assertEqual(revisions[0].lines_removed, 1)
+        self.assertEqual(revisions[1].message,
+                         'First commit\nspanning two lines')
+        self.assertEqual(revisions[2].timestamp - revisions[0].timestamp, 4)
+
+    def test_parse_rlog_paths(self):
+        log = SAMPLE_LOG.replace('Working file: a.txt\n', '')
+        log = log.replace('Working file: b.txt\n', '')
+        revisions = list(cvs.parse_log(log.splitlines()))
+        self.assertEqual(revisions[0].path, '/cvsroot/test/a.txt')
+        self.assertEqual(revisions[2].path, '/cvsroot/test/b.txt')
+
+    def test_group_revisions(self):
+        revisions = list(cvs.parse_log(SAMPLE_LOG.splitlines()))
+        groups = cvs.group_revisions(revisions)
+        self.assertEqual(
+            [[(x.path, x.revision) for x in group] for group in groups],
+            [[('a.txt', '1.1'), ('b.txt', '1.1')],
+             [('a.txt', '1.2'), ('b.txt', '1.2')]])
+
+    def test_group_revisions_window(self):
+        revisions = list(cvs.parse_log(SAMPLE_LOG.splitlines()))
+        groups = cvs.group_revisions(revisions, window=2)
+        self.assertEqual(len(groups), 4)
+
+    def test_walk_history(self):
+        sut = cvs.CVSRepository('test_dir')
+        sut.client = mock.Mock()
+        sut.client.log.side_effect = lambda **kwargs: BytesIO(
+            SAMPLE_LOG.encode())
+        history = list(sut.walk_history())
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history[0].timestamp, '2016-10-12T01:00:00Z')
+        self.assertEqual(
+            history[1].changes, [
+                change.Change(sut, 'a.txt', '1.1', 'a.txt', '1.2',
+                              change.ChangeType.modify),
+                change.Change(sut, 'b.txt', '1.1', 'b.txt', '1.2',
+                              change.ChangeType.remove)])
+        self.assertEqual(history[1].changes[0].lines_added, 2)
+        self.assertEqual(history[1].changes[0].lines_removed, 1)
+        self.assertIsNone(history[1].changes[1].lines_added)
+        self.assertEqual(
+            [x.identifier for x in history],
+            [x.identifier for x in sut.walk_history()])
+
+    def test_walk_since(self):
+        new_file = SAMPLE_LOG.split('=' * 77)[0].replace('a.txt', 'c.txt')
+        new_file = new_file.replace(
+            '2016/10/12 01:10:00', '2016/10/12 01:12:00').replace(
+                'Second commit', 'Third commit')
+        sut = cvs.CVSRepository('test_dir')
+        sut.client = mock.Mock()
+        sut.client.log.side_effect = lambda **kwargs: BytesIO(
+            SAMPLE_LOG.encode())
+        state = sut.get_history_state()
+        sut.client.log.assert_called_with(revisions='', stream=True)
+        # Newest revision on the server, not the local clock
+        self.assertEqual(state['since'], cvs.parse_timestamp(
+            '2016-10-12 01:10:04 +0000') - cvs.COMMIT_WINDOW)
+        self.assertEqual(state['seen'], [['a.txt', '1.2'], ['b.txt', '1.2']])
+        self.assertEqual(list(sut.walk_history(since=state)), [])
+        sut.client.log.assert_called_with(
+            dates='>=2016-10-12 01:00:04 UTC', stream=True)
+
+        sut.client.log.side_effect = lambda **kwargs: BytesIO(
+            (SAMPLE_LOG + new_file + '=' * 77 + '\n').encode())
+        history = list(sut.walk_history(since=state))
+        self.assertEqual([[x.current_file.path for x in changeset.changes]
+                          for changeset in history], [['c.txt']])
+
+        # A commit still open then comes out again, grown
+        new_file = new_file.replace('Third commit', 'Second commit')
+        history = list(sut.walk_history(since=state))
+        self.assertEqual([[x.current_file.path for x in changeset.changes]
+                          for changeset in history],
+                         [['a.txt', 'b.txt', 'c.txt']])
+
+    def test_get_changeset(self):
+        sut = cvs.CVSRepository('test_dir')
+        sut.client = mock.Mock()
+        sut.client.log.side_effect = lambda **kwargs: BytesIO(
+            SAMPLE_LOG.encode())
+        identifiers = [x.identifier for x in sut.walk_history()]
+        sut.client.log.reset_mock()
+
+        self.assertEqual(sut.get_changeset(identifiers[0]).identifier,
+                         identifiers[0])
+        self.assertEqual(sut.get_changeset(identifiers[1]).identifier,
+                         identifiers[1])
+        # The history is only walked once
+        self.assertEqual(sut.client.log.call_count, 1)
+        self.assertIsNone(sut.get_changeset('0' * 32))
+
+        sut.client.log.side_effect = lambda **kwargs: BytesIO(b'')
+        self.assertIsNone(sut.get_changeset('NO_SUCH_TAG'))
+
+    @mock.patch.object(cvs.CVSRepository, 'get_module_name')
+    @mock.patch.object(cvs.CVSRepository, 'list_directories')
+    def test_collect_revisions_sharded(self, mock_list, mock_module):
+        mock_module.return_value = 'test'
+        mock_list.return_value = ['sub']
+        top = SAMPLE_LOG.split('=' * 77)[0] + '=' * 77
+        sub = SAMPLE_LOG.split('=' * 77)[1] + '=' * 77
+        sub = sub.replace('/cvsroot/test/Attic/', '/cvsroot/test/sub/Attic/')
+        logs = {'test': top, 'test/sub': sub}
+        sut = cvs.CVSRepository('test_dir', cvs_root=':pserver:u@h:/cvsroot')
+        sut.client = mock.Mock()
+        sut.client.rlog.side_effect = lambda path, local, stream: BytesIO(
+            logs[path].replace('Working file', 'Ignored').encode())
+        revisions = sut.collect_revisions(workers=2)
+        self.assertEqual(
+            sorted(x.path for x in revisions),
+            ['a.txt', 'a.txt', 'sub/b.txt', 'sub/b.txt'])
+        self.assertIn(mock.call('test', local=True, stream=True),
+                      sut.client.rlog.call_args_list)
+        self.assertIn(mock.call('test/sub', local=False, stream=True),
+                      sut.client.rlog.call_args_list)
+
+    @mock.patch('codeminer_tools.repositories.cvs.tempfile')
+    def test_open_module_without_checkout(self, mock_tempfile):
+        sut = cvs.open_repository('test', cvs_root=':pserver:u@h:/cvsroot')
+        self.assertFalse(mock_tempfile.mkdtemp.called)
+        self.assertIsNone(sut.path)
+        self.assertEqual(sut.get_module_name(), 'test')
+
+        sut.client = mock.Mock()
+        sut.client.rlog.return_value = BytesIO(SAMPLE_LOG.encode())
+        self.assertEqual(sut.get_head_version('a.txt'), '1.2')
+        self.assertEqual(sut.get_head_version('b.txt'), '1.2')
+        sut.client.rlog.assert_called_once_with(
+            'test', header_only=True, stream=True)
+
+    def test_get_tag_revision(self):
+        sut = cvs.CVSRepository('test_dir', cvs_root='/cvsroot')
+        sut.get_module_name = mock.Mock(return_value='test')
+        sut.client = mock.Mock()
+        log = SAMPLE_LOG.replace('Working file: a.txt\n', '')
+        log = log.replace('\tRELEASE_1: 1.1\n',
+                          '\tRELEASE_1: 1.1\n\tBRANCH_1: 1.2.0.2\n')
+        sut.client.rlog.return_value = BytesIO(log.encode())
+        headers = sut.get_headers()
+        self.assertEqual(sorted(headers), ['a.txt', 'b.txt'])
+        self.assertEqual(headers['a.txt'].tags, {'RELEASE_1': '1.1'})
+        self.assertEqual(headers['a.txt'].branches, {'BRANCH_1': '1.2.2'})
+        self.assertEqual(sut.get_tag_revision('a.txt', 'RELEASE_1'), '1.1')
+        self.assertEqual(sut.get_tag_revision('a.txt', 'BRANCH_1'), '1.2.2')
+        self.assertEqual(sut.get_tag_revision('a.txt', 'HEAD'), '1.2')
+        self.assertIsNone(sut.get_tag_revision('b.txt', 'RELEASE_1'))
+        self.assertEqual(sut.client.rlog.call_count, 1)
+
+    @mock.patch.dict(os.environ, clear=True)
+    def test_open_module_requires_root(self):
+        with self.assertRaises(ValueError):
+            cvs.open_repository('test')
+
+    def test_split_checkout_output(self):
+        def header(path, revision):
+            return ('=' * 67 + '\nChecking out ' + path + '\nRCS:  /cvsroot/' +
+                    path + ',v\nVERS: ' + revision + '\n' + '*' * 15 + '\n')
+        output = (header('test/a.txt', '1.2') + 'a\nb\n' +
+                  header('test/b.txt', '1.1') + 'no newline ==' +
+                  header('test/c.txt', '1.1')).encode()
+        self.assertEqual(
+            cvs.split_checkout_output(output), ({
+                'test/a.txt': ('1.2', b'a\nb\n'),
+                'test/b.txt': ('1.1', b'no newline =='),
+                'test/c.txt': ('1.1', b'')}, []))
+
+        # Error messages come in between the files
+        output = ("cvs checkout: cannot find module `test/x.txt' - ignored\n" +
+                  header('test/a.txt', '1.2') + 'a\n' +
+                  "cvs checkout: cannot find module `test/y.txt' - ignored\n" +
+                  header('test/b.txt', '1.1') + 'no newline' +
+                  "cvs checkout: cannot find module `test/z.txt' - ignored\n"
+                  ).encode()
+        files, messages = cvs.split_checkout_output(output)
+        self.assertEqual(files, {'test/a.txt': ('1.2', b'a\n'),
+                                 'test/b.txt': ('1.1', b'no newline')})
+        self.assertEqual(messages, [
+            "cvs checkout: cannot find module `test/{0}.txt' - ignored"
+            .format(name) for name in 'xyz'])
+
+    def test_get_files_contents(self):
+        def checkout(path, revision, **kwargs):
+            output = b''
+            for module_path in path:
+                output += ('=' * 67 + '\nChecking out ' + module_path +
+                           '\nRCS:  x,v\nVERS: ' + str(revision) + '\n' +
+                           '*' * 15 + '\n').encode()
+                output += '{0}@{1}'.format(module_path, revision).encode()
+            return output, None
+
+        sut = cvs.CVSRepository(module='test', cvs_root='/cvsroot')
+        sut.client = mock.Mock()
+        sut.client.checkout.side_effect = checkout
+        contents = sut.get_files_contents(
+            [('a.txt', '1.1'), ('b.txt', '1.1'), ('a.txt', '1.2'),
+             ('c.txt', None)], batch_size=1)
+        self.assertEqual(contents, {
+            ('a.txt', '1.1'): b'test/a.txt@1.1',
+            ('b.txt', '1.1'): b'test/b.txt@1.1',
+            ('a.txt', '1.2'): b'test/a.txt@1.2',
+            ('c.txt', None): b'test/c.txt@None'})
+        self.assertEqual(sut.client.checkout.call_count, 4)
+
+        sut.client.checkout.reset_mock()
+        sut.get_files_contents([('a.txt', '1.1'), ('b.txt', '1.1')])
+        sut.client.checkout.assert_called_once_with(
+            path=['test/a.txt', 'test/b.txt'], revision='1.1', stdout=True,
+            combine_output=True, check=False, kopt='k')
+
+    def test_get_files_contents_missing_file(self):
+        def checkout(path, revision, **kwargs):
+            output = b''
+            for module_path in path:
+                if module_path == 'test/missing.txt':
+                    output += ("cvs server: cannot find module `" +
+                               module_path + "' - ignored\n").encode()
+                    continue
+                output += ('=' * 67 + '\nChecking out ' + module_path +
+                           '\nRCS:  x,v\nVERS: ' + revision + '\n' +
+                           '*' * 15 + '\n').encode()
+                output += module_path.encode() + b'\n'
+            return output, None
+
+        sut = cvs.CVSRepository(module='test', cvs_root='/cvsroot')
+        sut.client = mock.Mock()
+        sut.client.checkout.side_effect = checkout
+        contents = sut.get_files_contents(
+            [('a.txt', '1.1'), ('missing.txt', '1.1'), ('z.txt', '1.1')])
+        self.assertEqual(contents, {('a.txt', '1.1'): b'test/a.txt\n',
+                                    ('z.txt', '1.1'): b'test/z.txt\n'})
+
+        sut.client.checkout.side_effect = lambda **kwargs: (
+            b'cvs [server aborted]: connection lost\n', None)
+        with self.assertRaises(cvs.CVSException):
+            sut.get_files_contents([('a.txt', '1.1')])
+
+    def test_get_files_contents_cached(self):
+        def checkout(path, revision, **kwargs):
+            output = b''
+            for module_path in path:
+                output += ('=' * 67 + '\nChecking out ' + module_path +
+                           '\nRCS:  x,v\nVERS: ' + str(revision) + '\n' +
+                           '*' * 15 + '\n').encode()
+                output += module_path.encode()
+            return output, None
+
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        sut = cvs.CVSRepository(module='test', cvs_root='/cvsroot')
+        sut.cache = ResultCache(cache_path)
+        sut.client = mock.Mock()
+        sut.client.checkout.side_effect = checkout
+        files = [('a.txt', '1.1'), ('b.txt', 'TAG')]
+        sut.get_files_contents(files)
+        sut.client.checkout.reset_mock()
+
+        contents = sut.get_files_contents(files)
+        self.assertEqual(contents, {
+            ('a.txt', '1.1'): b'test/a.txt', ('b.txt', 'TAG'): b'test/b.txt'})
+        # Tags can move, only the revision number comes from the cache
+        sut.client.checkout.assert_called_once_with(
+            path=['test/b.txt'], revision='TAG', stdout=True,
+            combine_output=True, check=False, kopt='k')
+
+    def test_is_revision_number(self):
+        self.assertTrue(cvs.is_revision_number('1.1'))
+        self.assertTrue(cvs.is_revision_number('1.2.2.1'))
+        self.assertFalse(cvs.is_revision_number('1.2.2'))
+        self.assertFalse(cvs.is_revision_number('HEAD'))
+        self.assertFalse(cvs.is_revision_number(None))
+
+    def test_repository_directory(self):
+        self.assertEqual(
+            cvs.repository_directory(':pserver:user@host:2401/cvsroot'),
+            '/cvsroot')
+        self.assertEqual(cvs.repository_directory(':local:/cvsroot/'),
+                         '/cvsroot')
+        self.assertEqual(cvs.repository_directory('/cvsroot'), '/cvsroot')
+
+    @mock.patch.object(cvs.CVSRepository, 'list_directories')
+    def test_awalk_history(self, mock_list):
+        listed_in = []
+        mock_list.side_effect = lambda module_path: listed_in.append(
+            threading.current_thread()) or []
+        calls = []
+
+        async def rlog(module_path, local, **kwargs):
+            calls.append((module_path, local, kwargs))
+            return SAMPLE_LOG.encode(), b''
+
+        async def history(sut):
+            return [changeset async for changeset in sut.awalk_history()]
+
+        sut = cvs.CVSRepository(module='test', cvs_root='/cvsroot')
+        sut.async_client = mock.Mock()
+        sut.async_client.rlog.side_effect = rlog
+        changesets = asyncio.run(history(sut))
+        self.assertEqual(len(changesets), 2)
+        self.assertEqual(calls, [('test', True, {})])
+        # Not on the event loop's thread
+        self.assertNotIn(threading.main_thread(), listed_in)
+
+        changeset = asyncio.run(sut.aget_changeset('HEAD'))
+        self.assertEqual(changeset.identifier, changesets[-1].identifier)
+        self.assertEqual(calls[-1], ('test', True, {'revisions': 'HEAD'}))
+
+        calls.clear()
+        changeset = asyncio.run(sut.aget_changeset(changesets[0].identifier))
+        self.assertEqual(changeset.identifier, changesets[0].identifier)
+        asyncio.run(sut.aget_changeset(changesets[1].identifier))
+        self.assertEqual(len(calls), 1)
+
+    def test_aget_file_contents_cached(self):
+        async def checkout(path, revision, **kwargs):
+            return '{0}@{1}'.format(path, revision).encode(), b''
+
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        sut = cvs.CVSRepository(module='test', cvs_root='/cvsroot')
+        sut.cache = ResultCache(cache_path)
+        self.addCleanup(sut.cache.close)
+        sut.async_client = mock.Mock()
+        sut.async_client.checkout.side_effect = checkout
+        for _ in range(2):
+            contents = asyncio.run(sut.aget_file_contents('a.txt', '1.1'))
+            self.assertEqual(contents.read(), b'test/a.txt@1.1')
+        self.assertEqual(sut.async_client.checkout.call_count, 1)
+        # Shared with get_file_contents
+        self.assertEqual(sut.get_file_contents('a.txt', '1.1').read(),
+                         b'test/a.txt@1.1')
+
+    def test_previous_version(self):
+        self.assertEqual(cvs.previous_version('1.1'), None)
+        self.assertEqual(cvs.previous_version('1.3'), '1.2')
+        self.assertEqual(cvs.previous_version('1.2.2.1'), '1.2')
+        self.assertEqual(cvs.previous_version('1.2.2.3'), '1.2.2.2')
+
+
 if __name__ == '__main__':
     unittest.main()
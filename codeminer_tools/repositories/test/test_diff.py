@@ -0,0 +1,84 @@
+import collections
+import difflib
+import mock
+import random
+import unittest
+
+from codeminer_tools.repositories import diff
+
+
+def lines(*values):
+    return ''.join('{0}\n'.format(value) for value in values).encode()
+
+
+class TestDiff(unittest.TestCase):
+
+    def test_split_lines(self):
+        self.assertEqual(diff.split_lines(b'a\nb\n'), [b'a', b'b'])
+        self.assertEqual(diff.split_lines(b'a\nb'), [b'a', b'b'])
+        self.assertEqual(diff.split_lines(b''), [])
+
+    def test_identical(self):
+        self.assertEqual(diff.diff_lines(lines(1, 2, 3), lines(1, 2, 3)),
+                         (0, 0, 1.0))
+        self.assertEqual(diff.diff_lines(b'', b''), (0, 0, 1.0))
+
+    def test_added_and_removed(self):
+        self.assertEqual(diff.diff_lines(b'', lines(1, 2)), (2, 0, 0.0))
+        self.assertEqual(diff.diff_lines(lines(1, 2), b''), (0, 2, 0.0))
+        self.assertEqual(
+            diff.diff_lines(lines(1, 2, 3, 4), lines(1, 5, 3, 4, 6)),
+            (2, 1, 6 / 9))
+
+    def test_matches_difflib(self):
+        generator = random.Random(0)
+        for _ in range(20):
+            old = [generator.randrange(10) for _ in range(60)]
+            new = [generator.randrange(10) for _ in range(60)]
+            a, b = diff.hash_lines(lines(*old), lines(*new))
+            cost = diff.edit_distance(a, b)
+            # difflib isn't minimal, Myers never needs more edits
+            matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+            common = sum(block.size for block in matcher.get_matching_blocks())
+            self.assertLessEqual(cost, len(old) + len(new) - 2 * common)
+            self.assertEqual(cost, self.lcs_cost(old, new))
+
+    def test_max_cost(self):
+        old = lines(*range(100))
+        new = lines(*reversed(range(100)))
+        self.assertIsNone(diff.edit_distance(
+            *diff.hash_lines(old, new), max_cost=10))
+        # Past the cap counts come from the lines in common
+        self.assertEqual(diff.diff_lines(old, new, max_cost=10), (0, 0, 1.0))
+
+    def test_default_cost_limit(self):
+        self.assertEqual(diff.cost_limit(10, 10), diff.MIN_COST)
+        self.assertEqual(diff.cost_limit(600, 600), 300)
+        self.assertEqual(diff.cost_limit(6000, 6000), diff.MAX_COST)
+        # Large unrelated files are estimated instead of diffed
+        generator = random.Random(0)
+        old = lines(*(generator.randrange(1000) for _ in range(6000)))
+        new = lines(*(generator.randrange(1000) for _ in range(6000)))
+        with mock.patch.object(diff, 'edit_distance',
+                               wraps=diff.edit_distance) as edit_distance:
+            added, removed, score = diff.diff_lines(old, new)
+        # The search gave up at the ceiling
+        self.assertEqual(edit_distance.call_args[0][2], diff.MAX_COST)
+        a, b = diff.hash_lines(old, new)
+        common = sum((collections.Counter(a) &
+                      collections.Counter(b)).values())
+        self.assertEqual((added, removed), (6000 - common, 6000 - common))
+        self.assertGreater(score, 0.5)
+        # Small edits of large files are still exact
+        old = lines(*range(6000))
+        new = lines(*(x for x in range(6000) if x % 100))
+        self.assertEqual(diff.diff_lines(old, new), (0, 60, 11880 / 11940))
+
+    @staticmethod
+    def lcs_cost(a, b):
+        table = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+        for i in range(len(a)):
+            for j in range(len(b)):
+                table[i + 1][j + 1] = (table[i][j] + 1 if a[i] == b[j] else
+                                       max(table[i][j + 1], table[i + 1][j]))
+        return len(a) + len(b) - 2 * table[-1][-1]
@@ -0,0 +1,83 @@
+from io import BytesIO
+import mock
+import unittest
+
+from codeminer_tools.repositories.file import ContentCache, RepositoryFile
+
+
+class TestRepositoryFile(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = mock.Mock()
+        self.repository.name = 'Mock'
+        self.repository.get_file_size.return_value = None
+        self.repository.get_file_contents.side_effect = \
+            lambda path, revision=None: BytesIO(b'contents')
+        self.cache = ContentCache(max_size=20, max_entry_size=10)
+        patcher = mock.patch.object(RepositoryFile, 'cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_read_cached(self):
+        sut = RepositoryFile(self.repository, 'a.txt', '1')
+        self.assertEqual(sut.read(), b'contents')
+        self.assertEqual(
+            RepositoryFile(self.repository, 'a.txt', '1').read(), b'contents')
+        self.assertEqual(self.repository.get_file_contents.call_count, 1)
+        self.assertEqual(sut.open().read(), b'contents')
+        self.assertEqual(self.repository.get_file_contents.call_count, 1)
+
+    def test_current_revision_not_cached(self):
+        sut = RepositoryFile(self.repository, 'a.txt', None)
+        sut.read()
+        sut.read()
+        self.assertEqual(self.repository.get_file_contents.call_count, 2)
+
+    def test_open_streams(self):
+        stream = BytesIO(b'contents')
+        self.repository.get_file_contents.side_effect = None
+        self.repository.get_file_contents.return_value = stream
+        sut = RepositoryFile(self.repository, 'a.txt', '1')
+        self.assertIs(sut.open(), stream)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_size_from_metadata(self):
+        self.repository.get_file_size.return_value = 42
+        sut = RepositoryFile(self.repository, 'a.txt', '1')
+        self.assertEqual(sut.size(), 42)
+        self.assertFalse(self.repository.get_file_contents.called)
+
+    def test_size_without_metadata(self):
+        sut = RepositoryFile(self.repository, 'a.txt', '1')
+        self.assertEqual(sut.size(), 8)
+
+
+class TestContentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = mock.Mock()
+
+    def test_evicts_least_recently_used(self):
+        sut = ContentCache(max_size=10)
+        first = sut.key(self.repository, 'a.txt', '1')
+        second = sut.key(self.repository, 'b.txt', '1')
+        third = sut.key(self.repository, 'c.txt', '1')
+        sut.put(first, b'aaaa')
+        sut.put(second, b'bbbb')
+        sut.get(first)
+        sut.put(third, b'cccc')
+        self.assertEqual(sut.get(first), b'aaaa')
+        self.assertIsNone(sut.get(second))
+        self.assertEqual(sut.size, 8)
+
+    def test_skips_large_entries(self):
+        sut = ContentCache(max_size=100, max_entry_size=4)
+        key = sut.key(self.repository, 'a.txt', '1')
+        sut.put(key, b'too large')
+        self.assertIsNone(sut.get(key))
+
+    def test_keys_by_repository(self):
+        sut = ContentCache()
+        other = mock.Mock()
+        sut.put(sut.key(self.repository, 'a.txt', '1'), b'a')
+        self.assertIsNone(sut.get(sut.key(other, 'a.txt', '1')))
@@ -263,5 +263,71 @@ class TestGitReads(unittest.TestCase):
         contents = sut.get_file_contents('test.txt')
         self.assertEqual(contents.read(), b"ab")
 
+    def test_read_changed_file(self):
+        file_path = os.path.join(self.repository_path, 'test.txt')
+        with open(file_path, 'w') as out_file:
+            out_file.write("abc")
+        for command in ['git add test.txt', 'git commit -m "Added file"']:
+            subprocess.run(
+                shlex.split(command),
+                cwd=self.repository_path,
+                env=self.test_env)
+        sut = git.open_repository(self.repository_path)
+        # Changes refer to revisions by binary SHA
+        added = sut.get_changeset().changes[0]
+        self.assertIsInstance(added.current_file.revision, bytes)
+        self.assertEqual(added.current_file.read(), b"abc")
+
+    def test_read_walked_revision(self):
+        file_path = os.path.join(self.repository_path, 'test.txt')
+        with open(file_path, 'w') as out_file:
+            out_file.write("abcd")
+        for command in ['git add test.txt', 'git commit -m "Added file"']:
+            subprocess.run(
+                shlex.split(command),
+                cwd=self.repository_path,
+                env=self.test_env)
+        sut = git.open_repository(self.repository_path)
+        walked = next(sut.walk_history())
+        revision = walked.changes[0].current_file.revision
+        contents = sut.get_file_contents('test.txt', revision=revision)
+        self.assertEqual(contents.read(), b"abcd")
+        changeset = sut.get_changeset(revision)
+        self.assertEqual(changeset.identifier, walked.identifier)
+        self.assertEqual(changeset.changes, walked.changes)
+
+    def test_get_content_id(self):
+        file_path = os.path.join(self.repository_path, 'test.txt')
+        with open(file_path, 'w') as out_file:
+            out_file.write("ab")
+        for command in ['git add test.txt', 'git commit -m "Added file"']:
+            subprocess.run(
+                shlex.split(command),
+                cwd=self.repository_path,
+                env=self.test_env)
+        sut = git.open_repository(self.repository_path)
+        file_object = change.RepositoryFile(sut, 'test.txt', None)
+        self.assertEqual(file_object.content_id(), sut.content_digest(b"ab"))
+        self.assertIsNone(sut.get_content_id('missing.txt'))
+
+    def test_get_content_id_of_walked_change(self):
+        file_path = os.path.join(self.repository_path, 'test.txt')
+        with open(file_path, 'w') as out_file:
+            out_file.write("abc")
+        for command in ['git add test.txt', 'git commit -m "Added file"']:
+            subprocess.run(
+                shlex.split(command),
+                cwd=self.repository_path,
+                env=self.test_env)
+        sut = git.open_repository(self.repository_path)
+        added = next(sut.walk_history()).changes[0]
+        # Binary SHA revisions, as walk_history hands them out
+        self.assertEqual(added.current_file.content_id(),
+                         sut.content_digest(b"abc"))
+        self.assertEqual(sut.get_file_size(
+            'test.txt', revision=added.current_file.revision), 3)
+        self.assertIsNone(sut.get_content_id('test.txt', revision='0' * 40))
+        self.assertIsNone(sut.get_content_id('test.txt', revision='nothere'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -6,6 +6,7 @@ import subprocess
 import tempfile
 import unittest
 
+from codeminer_tools.cache import ResultCache
 from codeminer_tools.repositories import hg, change
 
 
@@ -80,6 +81,18 @@ class TestHgReads(unittest.TestCase):
         file_object = sut.get_file_contents("a.txt", revision=0)
         self.assertEqual(file_object.read(), b"a")
 
+    def test_get_object_cached(self):
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        sut = hg.open_repository(self.repository_path)
+        sut.cache = ResultCache(cache_path)
+        self.assertEqual(sut.get_file_contents("a.txt", revision=0).read(),
+                         b"a")
+        with mock.patch.object(sut, '_cat') as cat:
+            file_object = sut.get_file_contents("a.txt", revision=0)
+            self.assertFalse(cat.called)
+        self.assertEqual(file_object.read(), b"a")
+
     def test_get_changeset(self):
         sut = hg.open_repository(self.repository_path)
         changeset = sut.get_changeset('0')
@@ -0,0 +1,227 @@
+import datetime
+import mock
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import codeminer_tools.repositories.git as git
+from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
+from codeminer_tools.repositories.history import (CachedRepository,
+                                                  HistoryCache)
+
+
+class TestHistoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.cache = HistoryCache(os.path.join(self.path, 'history.db'))
+        self.addCleanup(self.cache.close)
+
+    def make_repository(self, changesets, state=None):
+        repository = mock.Mock()
+        repository.origin = 'origin'
+        repository.name = 'Mock'
+        repository.get_history_state.return_value = state
+        repository.walk_history.side_effect = \
+            lambda **kwargs: iter(changesets)
+        return repository
+
+    def test_round_trip(self):
+        repository = self.make_repository([])
+        modify = Change(repository, 'a.txt', b'\x01', 'a.txt', b'\x02',
+                        ChangeType.modify)
+        modify.lines_added, modify.lines_removed = 3, 1
+        changesets = [
+            ChangeSet([modify], 'tip', b'\x02', 'jacob', 'Second',
+                      datetime.datetime(2001, 1, 2)),
+            ChangeSet([Change(repository, None, None, 'a.txt', b'\x01',
+                              ChangeType.add)],
+                      None, b'\x01', 'jacob', 'First',
+                      datetime.datetime(2001, 1, 1))]
+        repository.walk_history.side_effect = \
+            lambda **kwargs: iter(changesets)
+
+        sut = CachedRepository(repository, self.cache)
+        replayed = list(sut.walk_history())
+        # Oldest first
+        self.assertEqual([x.identifier for x in replayed], [b'\x01', b'\x02'])
+        self.assertEqual(replayed[1].changes, [modify])
+        self.assertEqual(replayed[1].changes[0].lines_added, 3)
+        self.assertEqual(replayed[1].timestamp, datetime.datetime(2001, 1, 2))
+        self.assertEqual(replayed[1].tags, 'tip')
+        self.assertIs(replayed[1].changes[0].current_file.repository,
+                      repository)
+
+    def test_incremental(self):
+        first = ChangeSet([], None, '1', 'jacob', 'First',
+                          '2001-01-01T00:00:00Z')
+        second = ChangeSet([], None, '2', 'jacob', 'Second',
+                           '2001-01-02T00:00:00Z')
+        repository = self.make_repository([first], state=1)
+        sut = CachedRepository(repository, self.cache)
+        self.assertEqual(len(list(sut.walk_history())), 1)
+        repository.walk_history.assert_called_once_with()
+
+        repository.get_history_state.return_value = 2
+        repository.walk_history.side_effect = lambda **kwargs: iter([second])
+        self.assertEqual([x.identifier for x in sut.walk_history()],
+                         ['1', '2'])
+        repository.walk_history.assert_called_with(since=1)
+        self.assertEqual(self.cache.state(repository), 2)
+
+    def test_replaces_changesets(self):
+        repository = self.make_repository([
+            ChangeSet([], None, '1', 'jacob', 'Partial', 0),
+            ChangeSet([], None, '1', 'jacob', 'Whole', 0)])
+        self.cache.update(repository)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(next(self.cache.replay(repository)).message, 'Whole')
+
+    def test_failed_update_keeps_state(self):
+        def walk_history(**kwargs):
+            yield ChangeSet([], None, '1', 'jacob', 'First', 0)
+            raise RuntimeError()
+
+        repository = self.make_repository([], state=1)
+        repository.walk_history.side_effect = walk_history
+        with self.assertRaises(RuntimeError):
+            self.cache.update(repository)
+        self.assertIsNone(self.cache.state(repository))
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestHistoryQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = HistoryCache(':memory:')
+        self.addCleanup(self.cache.close)
+        repository = mock.Mock()
+        repository.origin = 'origin'
+        repository.name = 'Mock'
+        repository.get_history_state.return_value = None
+
+        def change(previous, current, action):
+            return Change(repository, previous, '1', current, '2', action)
+
+        self.changesets = [
+            ChangeSet([change(None, 'src/a.c', ChangeType.add),
+                       change(None, 'README', ChangeType.add)],
+                      None, '1', 'jacob', 'Import', '2001-01-01T00:00:00Z'),
+            ChangeSet([change('src/a.c', 'src/lib/a.c', ChangeType.move)],
+                      None, '2', 'jacob', 'Move', '2001-02-01T00:00:00Z'),
+            ChangeSet([change('README', 'README', ChangeType.modify)],
+                      None, '3', 'alice', 'Docs', '2001-03-01T00:00:00Z'),
+            ChangeSet([change('src/lib/a.c', 'src/lib/a.c',
+                              ChangeType.modify)],
+                      None, '4', 'alice', 'Fix', '2001-04-01T00:00:00Z')]
+        repository.walk_history.side_effect = \
+            lambda **kwargs: iter(self.changesets)
+        self.repository = CachedRepository(repository, self.cache)
+        self.repository.history.update(repository)
+
+    def identifiers(self, **filters):
+        return [changeset.identifier
+                for changeset in self.repository.query(**filters)]
+
+    def test_no_filters(self):
+        self.assertEqual(self.identifiers(), ['1', '2', '3', '4'])
+
+    def test_author(self):
+        self.assertEqual(self.identifiers(author='alice'), ['3', '4'])
+
+    def test_time_range(self):
+        self.assertEqual(
+            self.identifiers(since='2001-02-01T00:00:00Z',
+                             until=datetime.datetime(
+                                 2001, 4, 1, tzinfo=datetime.timezone.utc)),
+            ['2', '3'])
+
+    def test_path_glob(self):
+        self.assertEqual(self.identifiers(path_glob='src/**'),
+                         ['1', '2', '4'])
+        self.assertEqual(self.identifiers(path_glob='src/*.c'), ['1', '2'])
+        self.assertEqual(self.identifiers(path_glob='**/a.c'),
+                         ['1', '2', '4'])
+        # Only the matching changes are kept
+        first = next(self.repository.query(path_glob='src/**'))
+        self.assertEqual([x.current_file.path for x in first.changes],
+                         ['src/a.c'])
+
+    def test_actions(self):
+        self.assertEqual(
+            self.identifiers(actions=[ChangeType.move, ChangeType.add]),
+            ['1', '2'])
+
+    def test_combined(self):
+        self.assertEqual(
+            self.identifiers(author='alice', path_glob='src/**',
+                             actions=[ChangeType.modify]), ['4'])
+
+    @mock.patch('codeminer_tools.repositories.history.LOAD_BLOCK', 3)
+    def test_loads_in_blocks(self):
+        statements = []
+        self.cache.connection.set_trace_callback(statements.append)
+        changesets = list(self.repository.query())
+        self.assertEqual([x.identifier for x in changesets],
+                         ['1', '2', '3', '4'])
+        self.assertEqual([len(x.changes) for x in changesets], [2, 1, 1, 1])
+        self.assertEqual(
+            len([x for x in statements if 'FROM changes WHERE' in x]), 2)
+
+    def test_uses_indexes(self):
+        plan = self.cache.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT changeset FROM changes '
+            'WHERE current_path >= ? AND current_path < ?',
+            ('src/', 'src0')).fetchall()
+        self.assertIn('changes_current_path', str(plan))
+
+
+class TestGitIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.repository_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repository_path)
+        self.test_env = {
+            'GIT_AUTHOR_NAME': 'Test Author',
+            'GIT_AUTHOR_EMAIL': 'test@test.com',
+            'GIT_COMMITTER_NAME': 'Test Commiter',
+            'EMAIL': 'test@test.com'
+        }
+        self.run_git('git init')
+
+    def run_git(self, command):
+        subprocess.run(shlex.split(command), cwd=self.repository_path,
+                       env=self.test_env)
+
+    def commit(self, name):
+        with open(os.path.join(self.repository_path, name), 'w') as out_file:
+            out_file.write(name)
+        self.run_git('git add ' + name)
+        self.run_git('git commit -m "Added {0}"'.format(name))
+
+    def test_walk_since(self):
+        self.commit('a.txt')
+        sut = git.open_repository(self.repository_path)
+        state = sut.get_history_state()
+        self.assertEqual(list(sut.walk_history(since=state)), [])
+        self.commit('b.txt')
+        self.assertEqual(
+            [x.message for x in sut.walk_history(since=state)],
+            ['Added b.txt\n'])
+        self.assertEqual(len(list(sut.walk_history())), 2)
+
+    def test_cached_repository(self):
+        self.commit('a.txt')
+        history = HistoryCache(':memory:')
+        sut = CachedRepository(git.open_repository(self.repository_path),
+                               history)
+        self.assertEqual(len(list(sut.walk_history())), 1)
+        self.commit('b.txt')
+        replayed = list(sut.walk_history())
+        self.assertEqual([x.message for x in replayed],
+                         ['Added a.txt\n', 'Added b.txt\n'])
+        self.assertEqual(replayed[1].changes[0].current_file.path, 'b.txt')
@@ -0,0 +1,201 @@
+from io import BytesIO
+import mock
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+import hglib
+
+import codeminer_tools.repositories.git as git
+import codeminer_tools.repositories.hg as hg
+from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
+from codeminer_tools.repositories.file import RepositoryFile
+from codeminer_tools.repositories.prefetch import Prefetcher, prefetch
+from codeminer_tools.repositories.repository import Repository
+
+
+class FakeRepository(Repository):
+
+    thread_safe = True
+    origin = 'fake://origin'
+
+    def __init__(self, delay=0.0, size=100):
+        self.delay = delay
+        self.size = size
+        self.reads = []
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def get_file_contents(self, path, revision=None):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+            self.reads.append((path, revision))
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        return BytesIO('{0}@{1}'.format(path, revision).encode().ljust(
+            self.size))
+
+
+class FakeBatchRepository(FakeRepository):
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def get_files_contents(self, files):
+        self.batches.append(files)
+        return {(path, revision): b'batch'
+                for path, revision in files if path != 'missing.txt'}
+
+
+def history(repository, count, files=1):
+    changesets = []
+    for number in range(1, count + 1):
+        changes = [Change(repository, None, None, 'file{0}.txt'.format(x),
+                          str(number), ChangeType.add)
+                   for x in range(files)]
+        changesets.append(ChangeSet(changes, None, str(number), 'jacob',
+                                    'message', number))
+    return changesets
+
+
+@mock.patch.object(RepositoryFile, 'cache', None)
+class TestPrefetcher(unittest.TestCase):
+
+    def test_contents(self):
+        repository = FakeRepository()
+        modify = Change(repository, 'a.txt', '1', 'a.txt', '2',
+                        ChangeType.modify)
+        remove = Change(repository, 'b.txt', '1', None, None,
+                        ChangeType.remove)
+        changesets = [ChangeSet([modify, remove], None, '2', 'jacob', '', 2)]
+
+        (changeset, contents), = prefetch(changesets)
+        self.assertIs(changeset, changesets[0])
+        self.assertEqual(list(contents), [modify.current_file])
+        self.assertTrue(contents[modify.current_file].startswith(b'a.txt@2'))
+
+        (changeset, contents), = prefetch(changesets, previous=True)
+        self.assertEqual(set(contents), {modify.current_file,
+                                         modify.previous_file,
+                                         remove.previous_file})
+
+    def test_order_and_concurrency(self):
+        repository = FakeRepository(delay=0.05)
+        changesets = history(repository, 8, files=2)
+        start = time.perf_counter()
+        identifiers = [changeset.identifier for changeset, contents
+                       in Prefetcher(changesets, workers=4)]
+        # 16 reads of 50ms one after the other take 0.8s
+        self.assertLess(time.perf_counter() - start, 0.6)
+        self.assertEqual(identifiers, [str(x) for x in range(1, 9)])
+        self.assertGreater(repository.most_running, 1)
+
+    def test_not_thread_safe(self):
+        repository = FakeRepository(delay=0.01)
+        repository.thread_safe = False
+        list(Prefetcher(history(repository, 4, files=2), workers=4))
+        self.assertEqual(repository.most_running, 1)
+        self.assertEqual(len(repository.reads), 8)
+
+    def test_memory_budget(self):
+        repository = FakeRepository(delay=0.01)
+        sut = Prefetcher(history(repository, 20), lookahead=10,
+                         memory_budget=250)
+        most_ahead = 0
+        for consumed, (changeset, contents) in enumerate(sut, 1):
+            time.sleep(0.02)
+            most_ahead = max(most_ahead, len(repository.reads) - consumed)
+            self.assertLessEqual(sut.loaded, 300)
+        # Three 100 bytes files fit in the budget, the last one over it
+        self.assertLessEqual(most_ahead, 3)
+        self.assertEqual(len(repository.reads), 20)
+
+        repository = FakeRepository(delay=0.01)
+        most_ahead = 0
+        for consumed, (changeset, contents) in enumerate(
+                Prefetcher(history(repository, 20), lookahead=10), 1):
+            time.sleep(0.02)
+            most_ahead = max(most_ahead, len(repository.reads) - consumed)
+        self.assertGreater(most_ahead, 3)
+
+    def test_batch(self):
+        repository = FakeBatchRepository()
+        changeset = ChangeSet(
+            [Change(repository, None, None, 'a.txt', '1', ChangeType.add),
+             Change(repository, None, None, 'missing.txt', '1',
+                    ChangeType.add)], None, '1', 'jacob', '', 1)
+        (_, contents), = prefetch([changeset])
+        self.assertEqual(repository.batches,
+                         [[('a.txt', '1'), ('missing.txt', '1')]])
+        self.assertEqual(contents, {changeset.changes[0].current_file:
+                                    b'batch'})
+        self.assertEqual(repository.reads, [])
+
+    def test_errors(self):
+        repository = FakeRepository()
+        repository.get_file_contents = mock.Mock(side_effect=IOError)
+        with self.assertRaises(IOError):
+            list(prefetch(history(repository, 2)))
+
+
+@mock.patch.object(RepositoryFile, 'cache', None)
+class TestPrefetchRepositories(unittest.TestCase):
+    """ Git and Hg clients serve both the walk pulled by the consumer and
+    the reads of the workers"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def make(self, commit):
+        for number in range(30):
+            for name in ('file{0}.txt'.format(number % 4),
+                         'file{0}.txt'.format((number + 1) % 4)):
+                with open(os.path.join(self.path, name), 'a') as out_file:
+                    out_file.write('commit {0} line\n'.format(number) * 20)
+            commit(number)
+
+    def check_contents(self, repository):
+        expected = [{change.current_file.path: change.current_file.read()
+                     for change in changeset.changes}
+                    for changeset in repository.walk_history()]
+        contents = [{x.path: data for x, data in contents.items()}
+                    for _, contents in Prefetcher(repository.walk_history(),
+                                                  workers=4)]
+        self.assertEqual(contents, expected)
+
+    def test_git(self):
+        env = dict(os.environ, GIT_AUTHOR_NAME='Test Author',
+                   GIT_AUTHOR_EMAIL='test@test.com',
+                   GIT_COMMITTER_NAME='Test Commiter',
+                   GIT_COMMITTER_EMAIL='test@test.com')
+
+        def run(command):
+            subprocess.run(shlex.split(command), cwd=self.path, env=env,
+                           stdout=subprocess.DEVNULL, check=True)
+
+        run('git init -q')
+        self.make(lambda number: [
+            run('git add -A'), run('git commit -q -m "{0}"'.format(number))])
+        self.check_contents(git.open_repository(self.path))
+
+    def test_hg(self):
+        client = hglib.init(self.path)
+        client.open()
+        self.make(lambda number: client.commit(
+            str(number).encode(), addremove=True, user=b'test'))
+        client.close()
+        self.check_contents(hg.open_repository(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
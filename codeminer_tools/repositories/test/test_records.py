@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import pickle
+import unittest
+
+from codeminer_tools.repositories import records
+from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
+from codeminer_tools.repositories.repository import Repository
+
+
+class FakeRepository(Repository):
+
+    name = 'Fake'
+    opened = 0
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.pid = os.getpid()
+        FakeRepository.opened += 1
+
+
+def open_fake(origin):
+    return FakeRepository(origin)
+
+
+def attach_in_worker(record):
+    changeset = record.attach()
+    repository = changeset.changes[0].current_file.repository
+    return repository.origin, repository.pid, FakeRepository.opened
+
+
+class TestRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = records.RepositoryRegistry()
+        self.repository = FakeRepository('fake://origin')
+        self.registry.add(self.repository, open_fake, 'fake://origin')
+        modify = Change(self.repository, 'a.txt', '1', 'a.txt', '2',
+                        ChangeType.modify)
+        modify.lines_added = 3
+        self.changeset = ChangeSet(
+            [modify, Change(self.repository, None, None, 'b.txt', '2',
+                            ChangeType.add)],
+            None, '2', 'jacob', 'message', '2001-01-01T00:00:00Z')
+
+    def test_round_trip(self):
+        record = records.detach(self.changeset)
+        self.assertEqual(record.repository, 'fake://origin')
+        record = pickle.loads(pickle.dumps(record))
+        changeset = record.attach(self.registry)
+        self.assertEqual(changeset.changes, self.changeset.changes)
+        self.assertEqual(changeset.changes[0].lines_added, 3)
+        self.assertEqual(changeset.identifier, '2')
+        self.assertIs(changeset.changes[0].current_file.repository,
+                      self.repository)
+
+    def test_records_are_small(self):
+        record = pickle.dumps(records.detach(self.changeset.changes[0]))
+        self.assertNotIn(b'FakeRepository', record)
+
+    def test_file_record(self):
+        record = records.detach(self.changeset.changes[0].previous_file)
+        self.assertEqual(record, records.FileRecord('fake://origin', 'a.txt',
+                                                    '1'))
+        self.assertEqual(record.attach(self.registry),
+                         self.changeset.changes[0].previous_file)
+
+    def test_opens_once(self):
+        registry = records.RepositoryRegistry()
+        registry.register('fake://other', open_fake, 'fake://other')
+        first = registry.get('fake://other')
+        self.assertIs(registry.get('fake://other'), first)
+        with self.assertRaises(KeyError):
+            registry.get('fake://unknown')
+
+    def test_detach_unknown(self):
+        with self.assertRaises(TypeError):
+            records.detach(object())
+
+    def test_process_pool(self):
+        records.registry.register('fake://pool', open_fake, 'fake://pool')
+        self.addCleanup(records.registry.specs.pop, 'fake://pool')
+        record = records.detach(self.changeset, repository='fake://pool')
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(2, initializer=records.initialize,
+                          initargs=(records.registry.specs,)) as pool:
+            results = pool.map(attach_in_worker, [record] * 8)
+        for origin, pid, opened in results:
+            self.assertEqual(origin, 'fake://pool')
+            self.assertNotEqual(pid, os.getpid())
+            # Opened once per worker, not per record
+            self.assertEqual(opened, 1)
@@ -0,0 +1,118 @@
+import datetime
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
+from codeminer_tools.repositories.serialization import (ChangeSetReader,
+                                                        ChangeSetWriter)
+
+
+class TestSerialization(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'history.cms')
+        self.repository = mock.Mock()
+        self.repository.name = 'Mock'
+
+    def make_changesets(self, count):
+        changesets = []
+        for index in range(count):
+            modify = Change(self.repository, 'src/a.c', str(index),
+                            'src/a.c', str(index + 1), ChangeType.modify)
+            modify.lines_added, modify.lines_removed = index, 1
+            modify.similarity = 0.5
+            changesets.append(ChangeSet(
+                [modify, Change(self.repository, None, None,
+                                'src/{0}.c'.format(index), str(index + 1),
+                                ChangeType.add)],
+                None, str(index + 1), 'jacob', 'Commit {0}'.format(index),
+                '2001-01-01T00:00:00Z'))
+        return changesets
+
+    def assertChangeSetsEqual(self, actual, expected):
+        self.assertEqual(len(actual), len(expected))
+        for first, second in zip(actual, expected):
+            self.assertEqual(
+                (first.identifier, first.author, first.message,
+                 first.timestamp, first.tags),
+                (second.identifier, second.author, second.message,
+                 second.timestamp, second.tags))
+            self.assertEqual(first.changes, second.changes)
+            self.assertEqual(
+                [(x.lines_added, x.lines_removed, x.similarity)
+                 for x in first.changes],
+                [(x.lines_added, x.lines_removed, x.similarity)
+                 for x in second.changes])
+
+    def test_round_trip(self):
+        changesets = self.make_changesets(25)
+        with ChangeSetWriter(self.path, block_size=10) as writer:
+            for changeset in changesets:
+                writer.write(changeset)
+        with ChangeSetReader(self.path, self.repository) as reader:
+            self.assertEqual(len(reader), 25)
+            self.assertEqual(len(reader.blocks), 3)
+            self.assertChangeSetsEqual(list(reader), changesets)
+
+    def test_seek(self):
+        changesets = self.make_changesets(25)
+        with ChangeSetWriter(self.path, block_size=10) as writer:
+            for changeset in changesets:
+                writer.write(changeset)
+        with ChangeSetReader(self.path, self.repository) as reader:
+            self.assertChangeSetsEqual([reader['13']], [changesets[12]])
+            self.assertChangeSetsEqual(list(reader.seek('20')),
+                                       changesets[19:])
+            self.assertNotIn('26', reader)
+
+    @mock.patch(
+        'codeminer_tools.repositories.serialization.INDEX_PAGE_SIZE', 4)
+    def test_index_pages(self):
+        changesets = self.make_changesets(30)
+        # Written again, the later copy wins
+        changesets.append(ChangeSet([], None, '7', 'alice', 'Again', 0))
+        changesets.append(ChangeSet([], None, 40, 'alice', 'Number', 0))
+        with ChangeSetWriter(self.path, block_size=10) as writer:
+            for changeset in changesets:
+                writer.write(changeset)
+        with ChangeSetReader(self.path, self.repository) as reader:
+            self.assertEqual(reader.page_count, 8)
+            for changeset in changesets[:6] + changesets[7:]:
+                self.assertEqual(reader[changeset.identifier].message,
+                                 changeset.message)
+            for missing in ['0', '155', '9999', 'zzz', b'1', 1, '']:
+                self.assertNotIn(missing, reader)
+            with self.assertRaises(KeyError):
+                reader['0']
+
+    def test_value_types(self):
+        changeset = ChangeSet(
+            [Change(self.repository, 'a.txt', b'\x00\xff', 'b.txt', 12,
+                    ChangeType.derived)],
+            ['v1.0'], b'\x01\x02', 'jacob',
+            'Unicode é', datetime.datetime(2001, 1, 1, 12, 30))
+        with ChangeSetWriter(self.path, compress=False) as writer:
+            writer.write(changeset)
+        with ChangeSetReader(self.path, self.repository) as reader:
+            self.assertChangeSetsEqual([reader[b'\x01\x02']], [changeset])
+
+    def test_compression(self):
+        changesets = self.make_changesets(200)
+        sizes = []
+        for compress in (False, True):
+            with ChangeSetWriter(self.path, compress=compress) as writer:
+                for changeset in changesets:
+                    writer.write(changeset)
+            sizes.append(os.path.getsize(self.path))
+        self.assertLess(sizes[1], sizes[0])
+
+    def test_not_a_changeset_file(self):
+        with open(self.path, 'wb') as output:
+            output.write(b'garbage' * 10)
+        with self.assertRaises(ValueError):
+            ChangeSetReader(self.path)
@@ -0,0 +1,84 @@
+import mock
+import random
+import unittest
+
+from codeminer_tools.repositories import similarity
+
+
+def make_file(name, lines=100):
+    return '\n'.join('{0} line {1}'.format(name, index)
+                     for index in range(lines)).encode()
+
+
+class TestSimilarity(unittest.TestCase):
+
+    def test_line_hashes_ignore_whitespace(self):
+        self.assertEqual(similarity.line_hashes(b'a\n  b\n\n'),
+                         similarity.line_hashes(b'a\r\nb  \n'))
+        self.assertEqual(similarity.line_hashes(b'\n \n'), set())
+
+    def test_estimate(self):
+        minhash = similarity.MinHash()
+        first = similarity.line_hashes(make_file('a'))
+        second = similarity.line_hashes(make_file('a', lines=80))
+        estimate = minhash.estimate(minhash.signature(first),
+                                    minhash.signature(second))
+        self.assertAlmostEqual(estimate, 0.8, delta=0.15)
+
+    def test_find_matches(self):
+        modified = make_file('b', lines=90) + b'\nchanged'
+        matches = similarity.find_matches(
+            {'x': make_file('a'), 'y': modified, 'z': make_file('c'),
+             'empty': b''},
+            {'a': make_file('a'), 'b': make_file('b'), 'empty': b''})
+        self.assertEqual(matches['x'], ('a', 1.0))
+        self.assertEqual(matches['y'][0], 'b')
+        self.assertAlmostEqual(matches['y'][1], 90 / 101)
+        self.assertNotIn('z', matches)
+        self.assertNotIn('empty', matches)
+
+    def test_threshold(self):
+        matches = similarity.find_matches(
+            {'x': make_file('a', lines=40)}, {'a': make_file('a')},
+            threshold=0.5)
+        self.assertEqual(matches, {})
+
+    def test_recall_at_threshold(self):
+        # 68 of 100 lines kept and 32 added: a similarity of 68 / 132
+        sources = {name: make_file(name) for name in range(100)}
+        targets = {name: b'\n'.join(data.split(b'\n')[:68]) +
+                   make_file('new {0}'.format(name), lines=32)
+                   for name, data in sources.items()}
+        matches = similarity.find_matches(targets, sources, threshold=0.5)
+        found = sum(matches.get(name, (None,))[0] == name
+                    for name in targets)
+        self.assertGreaterEqual(found, 97)
+
+    def test_unrelated_files_arent_scored(self):
+        # Half of each file is 20 of 40 boilerplate lines, pairs share 10
+        # of those, a similarity of about 0.07
+        generator = random.Random(0)
+        boilerplate = make_file('#include', lines=40).split(b'\n')
+
+        def make_files(name):
+            return {index: b'\n'.join(generator.sample(boilerplate, 20)) +
+                    b'\n' + make_file((name, index), lines=50)
+                    for index in range(100)}
+
+        sources, targets = make_files('source'), make_files('target')
+        minhash = similarity.MinHash()
+        index = similarity.LSHIndex()
+        for key, data in sources.items():
+            index.add(key, minhash.signature(similarity.line_hashes(data)))
+        candidates = sum(
+            len(index.candidates(minhash.signature(
+                similarity.line_hashes(data)))) for data in targets.values())
+        # Out of 10000 pairs, 2 row bands got about 2600
+        self.assertLess(candidates, 1000)
+
+        with mock.patch.object(similarity, 'jaccard',
+                               wraps=similarity.jaccard) as jaccard:
+            matches = similarity.find_matches(targets, sources)
+        self.assertEqual(matches, {})
+        # Candidates estimated below the threshold aren't scored
+        self.assertLess(jaccard.call_count, 10)
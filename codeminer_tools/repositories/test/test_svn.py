@@ -1,3 +1,4 @@
+import asyncio
 import mock
 import os
 import shlex
@@ -6,6 +7,7 @@ import subprocess
 import tempfile
 import unittest
 
+from codeminer_tools.cache import ResultCache
 import codeminer_tools.repositories.svn as svn
 import codeminer_tools.repositories.change as change
 
@@ -169,5 +171,83 @@ class TestSVNReads(unittest.TestCase):
         revision = sut.info()['commit']['@revision']
         self.assertTrue(('a:b', 'c') in sut.get_properties('a.txt', revision=revision).items())
 
+
+INFO = b"""<?xml version="1.0" encoding="UTF-8"?>
+<info><entry kind="dir" path="." revision="3"><url>file:///svnroot</url>
+</entry></info>"""
+
+LOG = b"""<?xml version="1.0" encoding="UTF-8"?>
+<log><logentry revision="3"><author>jacob</author>
+<date>2001-01-01T00:00:00.000000Z</date>
+<paths><path action="M" kind="file">/a.txt</path></paths>
+<msg>Test</msg></logentry></log>"""
+
+
+class FakeAsyncClient:
+
+    def __init__(self):
+        self.calls = []
+
+    async def info(self, **kwargs):
+        self.calls.append(('info', kwargs))
+        return INFO, None
+
+    async def log(self, **kwargs):
+        self.calls.append(('log', kwargs))
+        return LOG, None
+
+    async def cat(self, target):
+        self.calls.append(('cat', target))
+        return b'contents', None
+
+
+class TestSVNAsync(unittest.TestCase):
+    """ Coroutines against a fake client, they behave like their
+    synchronous counterparts"""
+
+    def setUp(self):
+        self.sut = svn.SVNRepository.__new__(svn.SVNRepository)
+        self.sut.cleanup = False
+        self.sut.origin = 'file:///svnroot'
+        self.sut.async_client = FakeAsyncClient()
+
+    def walk(self, **kwargs):
+        async def history():
+            return [changeset async for changeset
+                    in self.sut.awalk_history(**kwargs)]
+        return asyncio.run(history())
+
+    def test_awalk_history_since(self):
+        self.assertEqual(self.walk(since=3), [])
+        self.assertEqual(self.sut.async_client.calls,
+                         [('info', {'xml': True})])
+        changeset, = self.walk(since=2)
+        self.assertEqual(changeset.identifier, 3)
+        self.assertEqual(self.sut.async_client.calls[-1],
+                         ('log', {'xml': True, 'verbose': True,
+                                  'revision': '3:3'}))
+
+    def test_cached(self):
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        self.sut.cache = ResultCache(cache_path)
+        self.addCleanup(self.sut.cache.close)
+        calls = self.sut.async_client.calls
+        for _ in range(2):
+            contents = asyncio.run(self.sut.aget_file_contents('a.txt', '3'))
+            self.assertEqual(contents.read(), b'contents')
+            changeset = asyncio.run(self.sut.aget_changeset('3'))
+            self.assertEqual(changeset.identifier, 3)
+        self.assertEqual([call[0] for call in calls], ['cat', 'log'])
+        # Shared with get_file_contents
+        self.assertEqual(self.sut.cache.get(self.sut.cache.key(
+            self.sut.origin, 'cat', 'a.txt', '3')), b'contents')
+
+        # HEAD moves, it isn't cached
+        asyncio.run(self.sut.aget_file_contents('a.txt', 'HEAD'))
+        asyncio.run(self.sut.aget_file_contents('a.txt', 'HEAD'))
+        self.assertEqual(calls[-2:], [('cat', 'a.txt@HEAD')] * 2)
+
+
 if __name__ == '__main__':
     unittest.main()
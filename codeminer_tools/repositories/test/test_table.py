@@ -0,0 +1,58 @@
+import mock
+import unittest
+
+from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
+from codeminer_tools.repositories.table import ChangeTable
+
+
+class TestChangeTable(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = mock.Mock()
+        self.repository.name = 'Mock'
+        self.changesets = [
+            ChangeSet([
+                Change(self.repository, None, None, 'a.txt', '1',
+                       ChangeType.add),
+                Change(self.repository, None, None, 'b.txt', '1',
+                       ChangeType.add)],
+                None, '1', 'author', 'message', 0),
+            ChangeSet([
+                Change(self.repository, 'a.txt', '1', 'c.txt', '2',
+                       ChangeType.move),
+                Change(self.repository, 'b.txt', '1', None, '2',
+                       ChangeType.remove)],
+                None, '2', 'author', 'message', 1)]
+
+    def test_round_trip(self):
+        sut = ChangeTable(self.repository)
+        for changeset in self.changesets:
+            sut.add_changeset(changeset)
+        expected = [change for changeset in self.changesets
+                    for change in changeset.changes]
+        self.assertEqual(len(sut), 4)
+        self.assertEqual(list(sut), expected)
+        self.assertEqual(sut[2], expected[2])
+        self.assertEqual(sut[1:3], expected[1:3])
+        self.assertIs(sut[0].current_file.repository, self.repository)
+
+    def test_interns_paths(self):
+        sut = ChangeTable(self.repository)
+        for changeset in self.changesets:
+            sut.add_changeset(changeset)
+        self.assertEqual(sorted(sut.paths.values), ['a.txt', 'b.txt', 'c.txt'])
+        self.assertEqual(sorted(sut.revisions.values), ['1', '2'])
+
+    def test_changesets(self):
+        sut = ChangeTable(self.repository)
+        for changeset in self.changesets:
+            sut.add_changeset(changeset)
+        self.assertEqual(sut.changeset_of(3), '2')
+        self.assertEqual(sut.rows('2'), [2, 3])
+        self.assertEqual(sut.rows('missing'), [])
+
+    def test_slots(self):
+        change = self.changesets[0].changes[0]
+        self.assertFalse(hasattr(change, '__dict__'))
+        self.assertFalse(hasattr(change.current_file, '__dict__'))
+        self.assertFalse(hasattr(self.changesets[0], '__dict__'))
@@ -0,0 +1,311 @@
+import collections
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import sqlite3
+import time
+import traceback
+
+from codeminer_tools.repositories import records
+
+# Jobs of a backend allowed to run at once, CVS servers don't cope with
+# more than a few connections. Backends not listed only share `processes`
+DEFAULT_LIMITS = {'cvs': 2}
+
+# Results waiting for the parent before workers block on putting more
+QUEUE_SIZE = 1000
+
+# Seconds between checks on jobs which died without reporting
+POLL_INTERVAL = 1.0
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+RESULT = 'result'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    origin TEXT PRIMARY KEY,
+    backend TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    results INTEGER,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, position);
+"""
+
+
+def load_manifest(path):
+    """ Repository specs from a JSON file
+
+    The file holds a list of objects, each with a `backend` (a key of
+    records.BACKENDS) and a `path`, optionally an `origin` naming the job
+    (the path by default) and `options` passed on to open_repository:
+
+        [{"backend": "cvs", "path": "module",
+          "options": {"cvs_root": ":pserver:anonymous@cvs.example.org:/cvs"}},
+         {"backend": "git", "path": "https://example.org/project.git"}]
+    """
+    with open(path) as manifest:
+        return json.load(manifest)
+
+
+def spec_origin(spec):
+    return spec.get('origin', spec['path'])
+
+
+def open_spec(spec):
+    """ Open the repository a manifest spec describes"""
+    module = importlib.import_module(records.BACKENDS[spec['backend']])
+    return module.open_repository(spec['path'], **spec.get('options', {}))
+
+
+def mine_history(repository, spec):
+    """ Default job: the repository's history as ChangeSetRecords"""
+    for changeset in repository.walk_history():
+        yield records.detach(changeset, repository.origin)
+
+
+class ProgressStore:
+    """ State of every job of a manifest, kept in SQLite
+
+    Each change of state is committed as it happens, so after a crash the
+    store still knows which repositories were finished. Jobs left running
+    by a crashed scheduler go back to pending with `recover`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, specs):
+        """ Add jobs for specs, those already known keep their state"""
+        position = self.connection.execute(
+            'SELECT COALESCE(MAX(position), -1) + 1 FROM jobs').fetchone()[0]
+        self.connection.execute('BEGIN')
+        try:
+            for offset, spec in enumerate(specs):
+                self.connection.execute(
+                    'INSERT OR IGNORE INTO jobs (origin, backend, spec, '
+                    'position, status, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                    (spec_origin(spec), spec['backend'], json.dumps(spec),
+                     position + offset, PENDING, time.time()))
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+
+    def recover(self):
+        """ Put jobs a previous run left running back to pending, returns
+        how many there were"""
+        return self.connection.execute(
+            'UPDATE jobs SET status = ?, updated = ? WHERE status = ?',
+            (PENDING, time.time(), RUNNING)).rowcount
+
+    def pending(self, retry_failed=False):
+        """ Specs of the jobs still to run, in manifest order"""
+        statuses = (PENDING, FAILED) if retry_failed else (PENDING,)
+        return [json.loads(spec) for spec, in self.connection.execute(
+            'SELECT spec FROM jobs WHERE status IN ({0}) '
+            'ORDER BY position'.format(', '.join('?' * len(statuses))),
+            statuses)]
+
+    def started(self, origin):
+        self.connection.execute(
+            'UPDATE jobs SET status = ?, attempts = attempts + 1, '
+            'error = NULL, updated = ? WHERE origin = ?',
+            (RUNNING, time.time(), origin))
+
+    def finished(self, origin, results):
+        self.connection.execute(
+            'UPDATE jobs SET status = ?, results = ?, updated = ? '
+            'WHERE origin = ?', (DONE, results, time.time(), origin))
+
+    def failed(self, origin, error):
+        self.connection.execute(
+            'UPDATE jobs SET status = ?, error = ?, updated = ? '
+            'WHERE origin = ?', (FAILED, error, time.time(), origin))
+
+    def status(self, origin):
+        row = self.connection.execute(
+            'SELECT status FROM jobs WHERE origin = ?', (origin,)).fetchone()
+        return None if row is None else row[0]
+
+    def error(self, origin):
+        row = self.connection.execute(
+            'SELECT error FROM jobs WHERE origin = ?', (origin,)).fetchone()
+        return None if row is None else row[0]
+
+    def counts(self):
+        """ Number of jobs in each status"""
+        return dict(self.connection.execute(
+            'SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+
+
+# Queue results are put on, and the one workers report the jobs they
+# start on, set in each worker by the pool initializer
+_results = None
+_starts = None
+
+
+def _initialize(results, starts=None):
+    global _results, _starts
+    _results = results
+    _starts = starts
+
+
+def _run(spec, job, opener):
+    origin = spec_origin(spec)
+    count = 0
+    if _starts is not None:
+        # A SimpleQueue writes straight to the pipe, this can't be lost
+        # with the worker like what is still buffered in _results
+        _starts.put((origin, os.getpid()))
+    try:
+        repository = opener(spec)
+        for result in job(repository, spec):
+            # Blocks while the queue is full, until the parent catches up
+            _results.put((RESULT, origin, result))
+            count += 1
+    except Exception:
+        _results.put((FAILED, origin, traceback.format_exc()))
+    else:
+        _results.put((DONE, origin, count))
+
+
+class Scheduler:
+    """ Mines many repositories in a process pool
+
+    Every spec of a manifest (see `load_manifest`) becomes a job: a worker
+    opens the repository with `opener` and runs `job(repository, spec)`,
+    whose results stream back to the parent through a bounded queue and
+    are handed to `sink(origin, result)`. Workers block when the parent
+    falls `queue_size` results behind, so memory stays bounded however
+    large the histories are.
+
+    No more than `limits[backend]` jobs of a backend run at once, waiting
+    jobs of other backends go first. A job is only marked done in the
+    ProgressStore once the sink has taken all its results, a crashed run
+    is resumed by running again with the same store: finished repositories
+    are skipped and unfinished ones start over, so the sink should accept
+    a repository's results twice (HistoryCache does, for instance). A job
+    whose worker process dies (killed, or crashed in a C extension) is
+    marked failed.
+
+        progress = ProgressStore('progress.db')
+        scheduler = Scheduler(progress, processes=16)
+        scheduler.run(load_manifest('manifest.json'), sink=store)
+
+    `job` and `opener` are sent to the workers and have to be picklable,
+    module level functions are.
+    """
+
+    def __init__(self, progress, job=mine_history, opener=open_spec,
+                 processes=None, limits=None, queue_size=QUEUE_SIZE,
+                 context=None):
+        self.progress = progress
+        self.job = job
+        self.opener = opener
+        self.processes = processes or os.cpu_count() or 1
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.queue_size = queue_size
+        self.context = multiprocessing.get_context(context)
+
+    def run(self, specs=(), sink=None, retry_failed=False):
+        """ Run the jobs of specs, along with those a previous run left
+        unfinished. Returns the number of jobs in each status"""
+        self.progress.add(specs)
+        self.progress.recover()
+        waiting = collections.OrderedDict()
+        for spec in self.progress.pending(retry_failed):
+            waiting.setdefault(spec['backend'], collections.deque()).append(
+                spec)
+
+        running = {}
+        workers = {}
+        results = self.context.Queue(self.queue_size)
+        starts = self.context.SimpleQueue()
+        checked = time.monotonic()
+        with self.context.Pool(self.processes, initializer=_initialize,
+                               initargs=(results, starts)) as pool:
+            while waiting or running:
+                self._start(pool, waiting, running)
+                while not starts.empty():
+                    origin, pid = starts.get()
+                    workers[origin] = pid
+                try:
+                    kind, origin, value = results.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    kind = None
+                # However busy the queue is, or the job of a dead worker
+                # holds its backend's slot until it goes quiet
+                if time.monotonic() - checked >= POLL_INTERVAL:
+                    self._check(running, workers)
+                    checked = time.monotonic()
+                if kind is None:
+                    continue
+                if kind == RESULT:
+                    if sink is not None:
+                        sink(origin, value)
+                elif kind == DONE:
+                    self.progress.finished(origin, value)
+                    running.pop(origin, None)
+                    workers.pop(origin, None)
+                else:
+                    self.progress.failed(origin, value)
+                    running.pop(origin, None)
+                    workers.pop(origin, None)
+        return self.progress.counts()
+
+    def _start(self, pool, waiting, running):
+        # One job per backend in turn, so a long queue of one backend
+        # doesn't hold back the others
+        busy = collections.Counter(
+            backend for backend, result in running.values())
+        started = True
+        while started and len(running) < self.processes:
+            started = False
+            for backend in list(waiting):
+                if len(running) >= self.processes:
+                    break
+                limit = self.limits.get(backend)
+                if limit is not None and busy[backend] >= limit:
+                    continue
+                spec = waiting[backend].popleft()
+                if not waiting[backend]:
+                    del waiting[backend]
+                origin = spec_origin(spec)
+                self.progress.started(origin)
+                running[origin] = (backend, pool.apply_async(
+                    _run, (spec, self.job, self.opener)))
+                busy[backend] += 1
+                started = True
+
+    def _check(self, running, workers):
+        # _run reports its own failures, this catches those it can't: an
+        # unpicklable job for instance, or a worker which died. The pool
+        # replaces the worker but never completes its job
+        alive = {process.pid for process in multiprocessing.active_children()}
+        for origin, (backend, result) in list(running.items()):
+            if result.ready() and not result.successful():
+                try:
+                    result.get()
+                except Exception:
+                    self.progress.failed(origin, traceback.format_exc())
+                del running[origin]
+            elif origin in workers and workers[origin] not in alive:
+                self.progress.failed(origin, 'Worker process {0} died'.format(
+                    workers.pop(origin)))
+                del running[origin]
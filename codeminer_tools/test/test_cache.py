@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from codeminer_tools.cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def cache(self, **kwargs):
+        cache = ResultCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_get_missing(self):
+        sut = self.cache()
+        self.assertIsNone(sut.get(sut.key('origin', 'cat', 'a.txt', 1)))
+
+    def test_put_get(self):
+        sut = self.cache()
+        key = sut.key('origin', 'cat', 'a.txt', 1)
+        sut.put(key, b'contents')
+        self.assertEqual(sut.get(key), b'contents')
+        # Shared with other instances (and processes) using the directory
+        self.assertEqual(self.cache().get(key), b'contents')
+
+    def test_key(self):
+        self.assertEqual(ResultCache.key('origin', 'cat', 1),
+                         ResultCache.key('origin', 'cat', '1'))
+        self.assertNotEqual(ResultCache.key('origin', 'cat', 1),
+                            ResultCache.key('other', 'cat', 1))
+
+    def test_fetch(self):
+        sut = self.cache()
+        calls = []
+
+        def producer():
+            calls.append(None)
+            return b'contents'
+
+        key = sut.key('origin', 'cat', 'a.txt', 1)
+        self.assertEqual(sut.fetch(key, producer), b'contents')
+        self.assertEqual(sut.fetch(key, producer), b'contents')
+        self.assertEqual(len(calls), 1)
+
+    def test_deduplicates_objects(self):
+        sut = self.cache()
+        sut.put(sut.key('origin', 'cat', 'a.txt', 1), b'contents')
+        sut.put(sut.key('origin', 'cat', 'a.txt', 2), b'contents')
+        objects = [name for directory, _, names
+                   in os.walk(sut.objects_path) for name in names]
+        self.assertEqual(len(objects), 1)
+
+    def test_evicts_least_recently_used(self):
+        sut = self.cache()
+        first, second = os.urandom(1000), os.urandom(1000)
+        sut.put('first', first)
+        sut.put('second', second)
+        sut.get('first')
+        sut.evict(target=sut.size() - 1)
+        self.assertEqual(sut.get('first'), first)
+        self.assertIsNone(sut.get('second'))
+
+    def test_max_size(self):
+        sut = self.cache(max_size=1500)
+        sut.put('first', os.urandom(1000))
+        sut.put('second', os.urandom(1000))
+        self.assertLessEqual(sut.size(), 1500)
+        self.assertIsNone(sut.get('first'))
+
+    def test_missing_object_is_a_miss(self):
+        sut = self.cache()
+        sut.put('key', b'contents')
+        shutil.rmtree(sut.objects_path)
+        self.assertIsNone(sut.get('key'))
+        # Its object doesn't count any more
+        self.assertEqual(sut.size(), 0)
+
+    def test_evict_reclaims_unreferenced_objects(self):
+        sut = self.cache()
+        sut.put('key', b'contents')
+        sut.connection.execute('DELETE FROM entries')
+        sut.evict()
+        self.assertEqual(sut.size(), 0)
+        objects = [name for directory, _, names
+                   in os.walk(sut.objects_path) for name in names]
+        self.assertEqual(objects, [])
+
+    def test_size_is_kept(self):
+        sut = self.cache()
+        for number in range(5):
+            sut.put('key{0}'.format(number), os.urandom(100 * number))
+        sut.put('key0', b'contents')
+        sut.put('copy', b'contents')
+        sut.evict(target=sut.size() - 1)
+
+        def summed():
+            return sut.connection.execute(
+                'SELECT SUM(size) FROM objects').fetchone()[0]
+
+        self.assertEqual(sut.size(), summed())
+        # Indexes without the running total get it on opening
+        sut.connection.execute('DROP TABLE meta')
+        sut.close()
+        self.assertEqual(sut.size(), summed())
+
+    def test_put_doesnt_sum_objects(self):
+        sut = self.cache()
+        statements = []
+        sut.connection.set_trace_callback(statements.append)
+        sut.put('key', b'contents')
+        self.assertFalse([x for x in statements if 'SUM(' in x])
+
+    def test_close(self):
+        sut = self.cache()
+        sut.put('key', b'contents')
+        sut.close()
+        # Reconnects on the next use
+        self.assertEqual(sut.get('key'), b'contents')
+
+    def test_clear(self):
+        sut = self.cache()
+        sut.put('key', b'contents')
+        sut.clear()
+        self.assertIsNone(sut.get('key'))
+        self.assertEqual(sut.size(), 0)
@@ -0,0 +1,95 @@
+from io import BytesIO
+import os
+import shutil
+import tempfile
+import unittest
+
+from codeminer_tools import lineage
+from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
+from codeminer_tools.repositories.repository import Repository
+
+
+class FakeRepository(Repository):
+
+    def __init__(self, origin, name, history, contents):
+        self.origin = origin
+        self.name = name
+        self.history = history
+        self.contents = contents
+
+    def walk_history(self):
+        return iter(self.history(self))
+
+    def get_file_contents(self, path, revision=None):
+        return BytesIO(self.contents[(path, revision)])
+
+
+class TestLineageIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.index = lineage.LineageIndex(os.path.join(self.path, 'index.db'))
+        self.addCleanup(self.index.close)
+
+        self.cvs = FakeRepository(
+            ':pserver:cvs:/cvsroot/module', 'CVS', lambda repository: [
+                ChangeSet([Change(repository, None, None, 'main.c', '1.1',
+                                  ChangeType.add)],
+                          None, 'a', 'jacob', 'Import',
+                          '2001-01-01T00:00:00Z'),
+                ChangeSet([Change(repository, 'main.c', '1.1', 'main.c',
+                                  '1.2', ChangeType.modify)],
+                          None, 'b', 'jacob', 'Fix',
+                          '2002-01-01T00:00:00Z')],
+            {('main.c', '1.1'): b'int main;\r\n/* $Id: main.c,v 1.1 $ */\r\n',
+             ('main.c', '1.2'): b'int main(void);\n'})
+        self.git = FakeRepository(
+            'https://example.com/code.git', 'GIT', lambda repository: [
+                ChangeSet([Change(repository, None, None, 'src/main.c',
+                                  'abc', ChangeType.add),
+                           Change(repository, 'old.c', 'abc', None, 'abc',
+                                  ChangeType.remove)],
+                          None, 'abc', 'jacob', 'Convert', 1262304000)],
+            {('src/main.c', 'abc'): b'int main;  \n/* $Id$ */\n'})
+
+    def test_normalize(self):
+        self.assertEqual(
+            lineage.normalize(b'a  \r\n$Id: a.c,v 1.1 2001/01/01 jacob $\n'),
+            b'a\n$Id$\n')
+
+    def test_ingest(self):
+        self.assertEqual(self.index.ingest(self.cvs, batch_size=1), 2)
+        self.assertEqual(self.index.ingest(self.git), 1)
+        self.assertEqual(len(self.index), 3)
+
+        # The converted file has its keywords unexpanded and new line
+        # endings, but still goes back to the CVS import
+        origin = self.index.first_origin(b'int main;\n/* $Id$ */\n')
+        self.assertEqual(origin, lineage.Occurrence(
+            ':pserver:cvs:/cvsroot/module', 'main.c', '1.1', 978307200.0))
+        self.assertEqual(
+            [occurrence.path for occurrence in self.index.occurrences(
+                b'int main;\n/* $Id$ */\n')],
+            ['main.c', 'src/main.c'])
+
+    def test_ingest_again(self):
+        self.index.ingest(self.cvs)
+        self.index.ingest(self.git)
+        self.assertEqual(self.index.ingest(self.cvs, batch_size=1), 0)
+        self.assertEqual(self.index.ingest(self.git), 0)
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(
+            len(self.index.occurrences(b'int main;\n/* $Id$ */\n')), 2)
+
+    def test_first_origin_unknown(self):
+        self.index.ingest(self.cvs)
+        self.assertIsNone(self.index.first_origin(b'unknown'))
+
+    def test_persistent(self):
+        self.index.ingest(self.cvs)
+        self.index.close()
+        sut = lineage.LineageIndex(os.path.join(self.path, 'index.db'))
+        self.addCleanup(sut.close)
+        self.assertEqual(
+            sut.first_origin(b'int main(void);\n').revision, '1.2')
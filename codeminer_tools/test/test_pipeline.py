@@ -0,0 +1,191 @@
+from io import BytesIO
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+import hglib
+
+from codeminer_tools import lineage, pipeline
+from codeminer_tools.pipeline import Pipeline, Stage
+from codeminer_tools.repositories import git, hg
+from codeminer_tools.repositories.change import ChangeType, Change, ChangeSet
+from codeminer_tools.repositories.file import content_cache
+from codeminer_tools.repositories.repository import Repository
+
+COMMITS = 30
+
+
+class FakeRepository(Repository):
+
+    origin = 'fake://origin'
+    name = 'Fake'
+
+    def __init__(self, contents):
+        self.contents = contents
+
+    def get_file_contents(self, path, revision=None):
+        return BytesIO(self.contents[(path, revision)])
+
+
+def square(number):
+    return number * number
+
+
+def fail_on_three(number):
+    if number == 3:
+        raise ValueError('three')
+    return number
+
+
+def slow(number):
+    time.sleep(0.05)
+    return number
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_modes_keep_order(self):
+        for mode, workers in ((pipeline.INLINE, 1), (pipeline.THREADS, 4),
+                              (pipeline.PROCESSES, 2)):
+            stage = Stage(square, mode, workers)
+            self.assertEqual(list(Pipeline(range(20), stage)),
+                             [x * x for x in range(20)])
+            self.assertEqual(stage.stats.items_in, 20)
+            self.assertEqual(stage.stats.items_out, 20)
+
+    def test_expand(self):
+        stage = Stage(lambda number: range(number), expand=True,
+                      name='expand')
+        self.assertEqual(list(Pipeline([1, 0, 3], stage)), [0, 0, 1, 2])
+        self.assertEqual(stage.stats.items_out, 4)
+        self.assertIn('expand: 3 in, 4 out', str(stage.stats))
+
+    def test_stages_overlap(self):
+        start = time.perf_counter()
+        result = list(Pipeline(range(10),
+                               Stage(slow, pipeline.THREADS, name='first'),
+                               Stage(slow, pipeline.THREADS, name='second'),
+                               prefetch=4))
+        # One after the other would take a second
+        self.assertLess(time.perf_counter() - start, 0.9)
+        self.assertEqual(result, list(range(10)))
+
+    def test_bounded_queue(self):
+        pulled = []
+
+        def source():
+            for number in range(1000):
+                pulled.append(number)
+                yield number
+
+        items = iter(Pipeline(source(), Stage(square, pipeline.THREADS,
+                                              queue_size=4)))
+        self.assertEqual(next(items), 0)
+        time.sleep(0.2)
+        # The queue, plus the item the feeder waits to put
+        self.assertLess(len(pulled), 10)
+        items.close()
+
+    def test_errors_propagate(self):
+        for mode in (pipeline.INLINE, pipeline.THREADS):
+            items = iter(Pipeline(range(10), Stage(fail_on_three, mode)))
+            self.assertEqual([next(items) for _ in range(3)], [0, 1, 2])
+            with self.assertRaises(ValueError):
+                next(items)
+        # The feeder threads are gone
+        self.assertEqual(
+            [thread for thread in threading.enumerate()
+             if thread.name == 'fail_on_three'], [])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            Stage(square, 'fibers')
+
+    def test_lineage(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        index = lineage.LineageIndex(os.path.join(path, 'index.db'))
+        self.addCleanup(index.close)
+        repository = FakeRepository({('a.c', '1'): b'int a;\n',
+                                     ('b.c', '2'): b'int a;\r\n'})
+        history = [
+            ChangeSet([Change(repository, None, None, 'a.c', '1',
+                              ChangeType.add)],
+                      None, '1', 'jacob', 'Add', 100),
+            ChangeSet([Change(repository, 'a.c', '1', None, None,
+                              ChangeType.remove),
+                       Change(repository, 'a.c', '1', 'b.c', '2',
+                              ChangeType.copy)],
+                      None, '2', 'jacob', 'Move', 200)]
+
+        mining = Pipeline(history, pipeline.optimize(),
+                          pipeline.fetch_versions(),
+                          pipeline.hash_versions(workers=2))
+        self.assertEqual(index.add_all(mining), 2)
+        # Copied, then modified (line endings) and its source removed
+        self.assertEqual(history[1].changes[0].action, ChangeType.derived)
+        self.assertEqual(index.first_origin(b'int a;\n'),
+                         lineage.Occurrence('fake://origin', 'a.c', '1', 100))
+        self.assertEqual([stats.items_out for stats in mining.report()],
+                         [2, 2, 2])
+
+
+class TestRepositoryPipeline(unittest.TestCase):
+    """ Stages in threads of their own share the clients of Git and Hg
+    repositories with the walk, which they mustn't use at the same time"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.addCleanup(content_cache.clear)
+
+    def make(self, commit):
+        for number in range(COMMITS):
+            # Two files a commit, for optimize to compare
+            for name in ('file{0}.txt'.format(number % 4),
+                         'file{0}.txt'.format((number + 1) % 4)):
+                with open(os.path.join(self.path, name), 'a') as out_file:
+                    out_file.write('commit {0} line\n'.format(number) * 20)
+            commit(number)
+
+    def check_versions(self, repository):
+        expected = [(change.current_file.path, change.current_file.read())
+                    for changeset in repository.walk_history()
+                    for change in changeset.changes]
+        # Read from the repository again
+        content_cache.clear()
+        mining = Pipeline(repository.walk_history(), pipeline.optimize(),
+                          pipeline.fetch_versions(workers=4))
+        self.assertEqual([(path, data) for _, _, path, _, _, data in mining],
+                         expected)
+
+    def test_git(self):
+        env = dict(os.environ, GIT_AUTHOR_NAME='Test Author',
+                   GIT_AUTHOR_EMAIL='test@test.com',
+                   GIT_COMMITTER_NAME='Test Commiter',
+                   GIT_COMMITTER_EMAIL='test@test.com')
+
+        def run(command):
+            subprocess.run(shlex.split(command), cwd=self.path, env=env,
+                           stdout=subprocess.DEVNULL, check=True)
+
+        run('git init -q')
+        self.make(lambda number: [
+            run('git add -A'), run('git commit -q -m "{0}"'.format(number))])
+        self.check_versions(git.open_repository(self.path))
+
+    def test_hg(self):
+        client = hglib.init(self.path)
+        client.open()
+        self.make(lambda number: client.commit(
+            str(number).encode(), addremove=True, user=b'test'))
+        client.close()
+        self.check_versions(hg.open_repository(self.path))
+
+if __name__ == '__main__':
+    unittest.main()
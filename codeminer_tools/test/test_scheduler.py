@@ -0,0 +1,165 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from codeminer_tools import scheduler
+from codeminer_tools.scheduler import ProgressStore, Scheduler
+
+
+class FakeRepository:
+
+    def __init__(self, spec):
+        self.origin = scheduler.spec_origin(spec)
+        if spec.get('options', {}).get('fail'):
+            raise RuntimeError('Can not open ' + self.origin)
+
+
+def fake_job(repository, spec):
+    if spec.get('options', {}).get('crash'):
+        os._exit(1)
+    start = time.time()
+    time.sleep(spec.get('options', {}).get('sleep', 0))
+    for number in range(spec.get('options', {}).get('results', 3)):
+        time.sleep(spec.get('options', {}).get('interval', 0))
+        yield (spec['backend'], number, start, time.time())
+
+
+def overlap(intervals):
+    """ Most intervals in progress at the same time"""
+    events = sorted([(start, 1) for start, end in intervals] +
+                    [(end, -1) for start, end in intervals],
+                    key=lambda event: (event[0], event[1]))
+    most = current = 0
+    for when, change in events:
+        current += change
+        most = max(most, current)
+    return most
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.progress = ProgressStore(os.path.join(self.path, 'progress.db'))
+        self.addCleanup(self.progress.close)
+        self.results = []
+
+    def sink(self, origin, result):
+        self.results.append((origin, result))
+
+    def make_scheduler(self, **kwargs):
+        kwargs.setdefault('processes', 4)
+        return Scheduler(self.progress, job=fake_job, opener=FakeRepository,
+                         **kwargs)
+
+    def test_run(self):
+        specs = [{'backend': 'git', 'path': 'repository{0}'.format(number)}
+                 for number in range(6)]
+        counts = self.make_scheduler().run(specs, sink=self.sink)
+        self.assertEqual(counts, {scheduler.DONE: 6})
+        self.assertEqual(len(self.results), 18)
+        self.assertEqual(
+            sorted(result[1] for origin, result in self.results
+                   if origin == 'repository2'), [0, 1, 2])
+        # Nothing left to do
+        self.results = []
+        self.make_scheduler().run(specs, sink=self.sink)
+        self.assertEqual(self.results, [])
+
+    def test_backend_limit(self):
+        specs = [{'backend': backend, 'path': backend + str(number),
+                  'options': {'sleep': 0.2}}
+                 for number in range(4) for backend in ('cvs', 'git')]
+        self.make_scheduler(limits={'cvs': 1}).run(specs, sink=self.sink)
+        intervals = {}
+        for origin, (backend, number, start, end) in self.results:
+            intervals[origin] = (backend, start, end)
+        cvs = [(start, end) for backend, start, end in intervals.values()
+               if backend == 'cvs']
+        git = [(start, end) for backend, start, end in intervals.values()
+               if backend == 'git']
+        self.assertEqual(overlap(cvs), 1)
+        self.assertGreater(overlap(git), 1)
+
+    def test_failure(self):
+        specs = [{'backend': 'svn', 'path': 'broken',
+                  'options': {'fail': True}},
+                 {'backend': 'svn', 'path': 'working'}]
+        counts = self.make_scheduler().run(specs, sink=self.sink)
+        self.assertEqual(counts, {scheduler.DONE: 1, scheduler.FAILED: 1})
+        self.assertIn('Can not open broken', self.progress.error('broken'))
+        self.assertEqual({origin for origin, result in self.results},
+                         {'working'})
+
+        # Failed jobs only run again when asked
+        self.assertEqual(self.progress.pending(), [])
+        self.assertEqual(self.progress.pending(retry_failed=True),
+                         [specs[0]])
+
+    def test_worker_dies(self):
+        specs = [{'backend': 'git', 'path': 'crashing',
+                  'options': {'crash': True}},
+                 {'backend': 'git', 'path': 'working'}]
+        counts = self.make_scheduler(processes=2).run(specs, sink=self.sink)
+        self.assertEqual(counts, {scheduler.DONE: 1, scheduler.FAILED: 1})
+        self.assertIn('died', self.progress.error('crashing'))
+        self.assertEqual({origin for origin, result in self.results},
+                         {'working'})
+
+    def test_worker_dies_while_others_stream(self):
+        specs = [{'backend': 'cvs', 'path': 'crashing',
+                  'options': {'crash': True}},
+                 {'backend': 'cvs', 'path': 'streaming',
+                  'options': {'results': 300, 'interval': 0.01}},
+                 {'backend': 'cvs', 'path': 'waiting'}]
+        counts = self.make_scheduler(limits={'cvs': 2}).run(
+            specs, sink=self.sink)
+        self.assertEqual(counts, {scheduler.DONE: 2, scheduler.FAILED: 1})
+        # The slot of the dead worker was handed on while the queue never
+        # went quiet for long
+        waiting_start = min(start for origin, (_, _, start, _)
+                            in self.results if origin == 'waiting')
+        streaming_end = max(end for origin, (_, _, _, end)
+                            in self.results if origin == 'streaming')
+        self.assertLess(waiting_start, streaming_end)
+
+    def test_resume(self):
+        specs = [{'backend': 'hg', 'path': name}
+                 for name in ('finished', 'interrupted', 'waiting')]
+        # A run which crashed while mining 'interrupted'
+        self.progress.add(specs)
+        self.progress.started('finished')
+        self.progress.finished('finished', 3)
+        self.progress.started('interrupted')
+
+        counts = self.make_scheduler().run(sink=self.sink)
+        self.assertEqual(counts, {scheduler.DONE: 3})
+        self.assertEqual({origin for origin, result in self.results},
+                         {'interrupted', 'waiting'})
+
+    def test_backpressure(self):
+        results = queue.Queue(2)
+        scheduler._initialize(results)
+        self.addCleanup(scheduler._initialize, None)
+        worker = threading.Thread(
+            target=scheduler._run,
+            args=({'backend': 'git', 'path': 'slow'}, fake_job,
+                  FakeRepository))
+        worker.start()
+        time.sleep(0.2)
+        # The job is held up until the queue is read
+        self.assertTrue(worker.is_alive())
+        self.assertTrue(results.full())
+        received = [results.get() for _ in range(4)]
+        worker.join()
+        self.assertEqual([kind for kind, origin, value in received],
+                         [scheduler.RESULT] * 3 + [scheduler.DONE])
+
+
+if __name__ == '__main__':
+    unittest.main()